@@ -0,0 +1,294 @@
+"""Offline analysis of recorded workout videos.
+
+    python analyze.py squats workout1.mp4 workout2.mp4 --output results.jsonl
+
+Frames are decoded on a background thread as fast as the disk allows and run
+through the pose backend and ``ExerciseProcessor``. Every frame is stamped with
+its position in the video, so reps, good reps and timed stats come out the same
+however fast the machine is. Output is JSON lines: one ``rep`` record per
+counted rep followed by a ``summary`` record per video.
+
+With ``--segments N`` each video is cut into N pieces analyzed concurrently;
+rep state is stitched exactly across the cuts (see ``_analyze_segment``).
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2
+
+from landmark_filters import create_landmark_filter
+from landmark_store import LandmarkRecorder
+from pose_backends import create_pose_backend
+from processor import ExerciseProcessor
+
+DEFAULT_FPS = 30.0
+
+
+def probe_video(path):
+    """Return (fps, frame_count) of a video file"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return fps, frame_count
+
+
+def decode_frames(path, start_frame=0, end_frame=None, queue_size=64):
+    """Yield (index, timestamp_seconds, rgb_image) for frames [start_frame, end_frame) of a video
+
+    Decoding and color conversion run on a reader thread so they overlap with
+    inference in the caller.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    if start_frame:
+        # FFmpeg seeks to the preceding keyframe and decodes forward to the exact frame
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    frames = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def read():
+        index = start_frame
+        try:
+            while not stop.is_set() and (end_frame is None or index < end_frame):
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                frames.put((index, index / fps, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+                index += 1
+        finally:
+            frames.put(None)
+            capture.release()
+
+    reader = threading.Thread(target=read, name='video-decoder', daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            yield item
+    finally:
+        stop.set()
+        # Unblock the reader if it is waiting on a full queue
+        while reader.is_alive():
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                reader.join(0.01)
+
+
+def analyze_video(path, exercise_name, pose, recorder=None):
+    """Run one video through pose estimation and exercise logic, yielding result records
+
+    When a ``LandmarkRecorder`` is given, every frame's landmarks, stage and
+    feedback are appended to it.
+    """
+    processor = ExerciseProcessor(exercise_name)
+    processor.reset_state(start_time=0.0)
+    landmark_filter = create_landmark_filter()
+
+    frames = 0
+    timestamp = 0.0
+    reported_reps = 0
+    start = time.perf_counter()
+
+    for index, timestamp, image in decode_frames(path):
+        landmarks = pose.process(image, int(timestamp * 1000)).landmarks
+        if landmark_filter:
+            landmarks = landmark_filter.update(landmarks, timestamp)
+        processor.process_frame(None, landmarks, timestamp)
+        if recorder:
+            recorder.append(timestamp, landmarks, processor.stage, processor.feedback_list)
+        frames += 1
+
+        for rep in processor.rep_log[reported_reps:]:
+            yield dict(type='rep', video=path, exercise=exercise_name, **rep)
+        reported_reps = len(processor.rep_log)
+
+    processing_seconds = time.perf_counter() - start
+    stats = processor.get_stats(now=timestamp)
+    stats.pop('feedback')
+    yield dict(
+        type='summary',
+        video=path,
+        frames=frames,
+        duration=round(timestamp, 3),
+        processing_seconds=round(processing_seconds, 3),
+        processing_fps=round(frames / processing_seconds, 1) if processing_seconds else 0.0,
+        **stats,
+    )
+
+
+# Per-process pose graph for pool workers, created once by init_worker
+_worker_pose = None
+
+
+def init_worker(backend_name):
+    """Pool initializer: build one warm pose graph per worker process"""
+    global _worker_pose
+    # Workers already run one per core; keep OpenCV from oversubscribing them
+    cv2.setNumThreads(1)
+    _worker_pose = create_pose_backend(backend_name)
+
+
+def worker_pose():
+    """The worker's pose graph, reset so a new video or segment does not inherit tracking state"""
+    _worker_pose.reset()
+    return _worker_pose
+
+
+def _analyze_segment(job):
+    """Infer one segment once, then replay its logic from every possible entry stage
+
+    The first ``overlap`` frames before the segment only warm up pose tracking
+    and the landmark filter. Because the stage is the only state that crosses a
+    cut, running the segment's logic from each possible stage lets the parent
+    stitch segments exactly, without losing or double counting straddling reps.
+    """
+    path, exercise_name, start_frame, end_frame, overlap = job
+    pose = worker_pose()
+    landmark_filter = create_landmark_filter()
+    frames = []
+    # Time of the frame before the cut, from which timed stats count; the cut itself without warm-up
+    entry_time = None
+
+    for index, timestamp, image in decode_frames(path, max(0, start_frame - overlap), end_frame):
+        landmarks = pose.process(image, int(timestamp * 1000)).landmarks
+        if landmark_filter:
+            landmarks = landmark_filter.update(landmarks, timestamp)
+        if index >= start_frame:
+            if entry_time is None:
+                entry_time = timestamp
+            frames.append((timestamp, landmarks))
+        else:
+            entry_time = timestamp
+    if entry_time is None:
+        entry_time = 0.0
+
+    runs = {}
+    processor = ExerciseProcessor(exercise_name)
+    entry_stages = ('up', 'down') if processor.stage is not None else (None,)
+    for stage in entry_stages:
+        processor.reset_state(start_time=0.0)
+        processor.stage = stage
+        if processor.last_frame_time is not None:
+            processor.last_frame_time = entry_time
+        for timestamp, landmarks in frames:
+            processor.process_frame(None, landmarks, timestamp)
+        runs[stage] = {
+            'exit_stage': processor.stage,
+            'rep_log': processor.rep_log,
+            'good_form_time': processor.good_form_time,
+        }
+
+    return {'frames': len(frames), 'end_time': frames[-1][0] if frames else entry_time, 'runs': runs}
+
+
+def analyze_video_segmented(path, exercise_name, pool, segments, overlap=30):
+    """Analyze one long video as ``segments`` concurrent pieces and stitch the results
+
+    Yields the same records as ``analyze_video``.
+    """
+    start = time.perf_counter()
+    _, frame_count = probe_video(path)
+    bounds = [round(i * frame_count / segments) for i in range(segments)]
+    jobs = [(path, exercise_name, bounds[i], bounds[i + 1] if i + 1 < segments else None, overlap)
+            for i in range(segments)]
+    results = pool.map(_analyze_segment, jobs)
+
+    # Walk the segments in order, entering each with the stage the previous one exited in
+    processor = ExerciseProcessor(exercise_name)
+    processor.reset_state(start_time=0.0)
+    frames = 0
+    end_time = 0.0
+    for result in results:
+        run = result['runs'][processor.stage]
+        for rep in run['rep_log']:
+            processor.counter += 1
+            processor.good_reps += rep['good']
+            rep = dict(rep, rep=processor.counter)
+            processor.rep_log.append(rep)
+            yield dict(type='rep', video=path, exercise=exercise_name, **rep)
+        if run['good_form_time'] is not None:
+            processor.good_form_time += run['good_form_time']
+        processor.stage = run['exit_stage']
+        frames += result['frames']
+        end_time = max(end_time, result['end_time'])
+
+    processing_seconds = time.perf_counter() - start
+    stats = processor.get_stats(now=end_time)
+    stats.pop('feedback')
+    yield dict(
+        type='summary',
+        video=path,
+        frames=frames,
+        duration=round(end_time, 3),
+        processing_seconds=round(processing_seconds, 3),
+        processing_fps=round(frames / processing_seconds, 1) if processing_seconds else 0.0,
+        segments=segments,
+        **stats,
+    )
+
+
+def _video_recorder(directory, path, exercise_name):
+    if not directory:
+        return contextlib.nullcontext()
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return LandmarkRecorder(os.path.join(directory, f"{name}.lmk"), exercise_name,
+                            {'video': path, 'start_time': 0.0})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('exercise', help='Exercise id, e.g. squats')
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--backend', help='Pose backend (defaults to POSE_BACKEND or solutions)')
+    parser.add_argument('--output', help='JSON lines output file (defaults to stdout)')
+    parser.add_argument('--segments', type=int, default=1,
+                        help='Split each video into this many segments analyzed in parallel processes')
+    parser.add_argument('--overlap', type=int, default=30,
+                        help='Warm-up frames decoded before each segment cut (default 30)')
+    parser.add_argument('--record-dir', help='Also save each video\'s landmark stream as <name>.lmk here')
+    args = parser.parse_args()
+    if args.record_dir and args.segments > 1:
+        # A segment's stages and feedback are only known once it is stitched to the one before
+        parser.error('--record-dir cannot be combined with --segments')
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        if args.segments > 1:
+            with multiprocessing.Pool(args.segments, initializer=init_worker, initargs=(args.backend,)) as pool:
+                for path in args.videos:
+                    for record in analyze_video_segmented(path, args.exercise, pool, args.segments, args.overlap):
+                        output.write(json.dumps(record) + '\n')
+                    output.flush()
+        else:
+            with create_pose_backend(args.backend) as pose:
+                for path in args.videos:
+                    # Each video is a new clip for pose tracking and its timestamps
+                    pose.reset()
+                    with _video_recorder(args.record_dir, path, args.exercise) as recorder:
+                        for record in analyze_video(path, args.exercise, pose, recorder):
+                            output.write(json.dumps(record) + '\n')
+                    output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,372 +1,181 @@
 from flask import Flask, request, Response, jsonify
 from flask_cors import CORS
 import cv2
+import functools
 import json
 import threading
 import time
-import importlib.util
 import os
 import sys
-from pathlib import Path
+import uuid
+
+import h264_stream
+import metrics
+import profiling
+import tracing
+from errors import error_tracker
+from events import (
+    KEEPALIVE_INTERVAL, SESSION_ENDED, SESSION_STARTED, SSE_KEEPALIVE, SSE_MIMETYPE, event_hub, format_sse,
+    subscription_options,
+)
+from frame_sources import open_frame_source
+from landmark_filters import LandmarkPredictor, create_landmark_filter
+from landmark_store import create_session_recorder
+from landmarks import draw_landmarks
+from pose_backends import create_pose_backend
+from processor import ExerciseProcessor
+from streaming import DEFAULT_RENDITION, MJPEG_MIMETYPE, EncodedFrame, FrameBroadcast, encode_renditions
+from video_recorder import create_video_recorder
 
 app = Flask(__name__)
 CORS(app)
 
+# Seconds stop_exercise waits for the pipeline to finish its current frame
+PIPELINE_STOP_TIMEOUT = 5.0
+
 # Global variables for video processing
 current_exercise = None
 exercise_processor = None
-video_capture = None
+frame_source = None
+session_id = None
+session_metrics = None
 processing_thread = None
-is_processing = False
-frame_data = {}
-
-class ExerciseProcessor:
-    def __init__(self, exercise_name):
-        self.exercise_name = exercise_name
-        self.exercise_module = self._load_exercise_module(exercise_name)
-        self.reset_state()
-    
-    def _load_exercise_module(self, exercise_name):
-        """Dynamically load exercise module"""
-        exercise_path = Path(__file__).parent / "exercises" / f"{exercise_name}.py"
-        if not exercise_path.exists():
-            raise ValueError(f"Exercise {exercise_name} not found")
-        
-        spec = importlib.util.spec_from_file_location(exercise_name, exercise_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        return module
-    
-    def reset_state(self):
-        """Reset exercise state"""
-        self.counter = 0
-        self.stage = 'down' if self.exercise_name != 'plank' else None
-        self.good_reps = 0
-        self.feedback_list = []
-        self.start_time = time.time()
-        self.good_form_time = 0 if self.exercise_name == 'plank' else None
-        self.last_frame_time = time.time() if self.exercise_name == 'plank' else None
-    
-    def process_frame(self, frame, results):
-        """Process frame using exercise-specific logic"""
-        try:
-            if hasattr(self.exercise_module, 'calculate_angle'):
-                calculate_angle = self.exercise_module.calculate_angle
-            else:
-                # Fallback angle calculation
-                import numpy as np
-                def calculate_angle(a, b, c):
-                    a, b, c = np.array(a), np.array(b), np.array(c)
-                    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-                    angle = np.abs(radians*180.0/np.pi)
-                    return 360-angle if angle > 180 else angle
-            
-            if results.pose_landmarks:
-                landmarks = results.pose_landmarks.landmark
-                
-                # Exercise-specific processing
-                if self.exercise_name == 'bicep_curl':
-                    self._process_bicep_curl(landmarks, calculate_angle)
-                elif self.exercise_name == 'squats':
-                    self._process_squats(landmarks, calculate_angle)
-                elif self.exercise_name == 'overhead_press':
-                    self._process_overhead_press(landmarks, calculate_angle)
-                elif self.exercise_name == 'lateral_raises':
-                    self._process_lateral_raises(landmarks, calculate_angle)
-                elif self.exercise_name == 'lunges':
-                    self._process_lunges(landmarks, calculate_angle)
-                elif self.exercise_name == 'pullups':
-                    self._process_pullups(landmarks, calculate_angle)
-                elif self.exercise_name == 'pushups':
-                    self._process_pushups(landmarks, calculate_angle)
-                elif self.exercise_name == 'glute_bridges':
-                    self._process_glute_bridges(landmarks, calculate_angle)
-                elif self.exercise_name == 'crunches':
-                    self._process_crunches(landmarks, calculate_angle)
-                elif self.exercise_name == 'plank':
-                    self._process_plank(landmarks, calculate_angle)
-                
-        except Exception as e:
-            print(f"Error processing frame: {e}")
-    
-    def _process_bicep_curl(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x, landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x, landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        
-        elbow_angle = calculate_angle(shoulder, elbow, wrist)
-        self.feedback_list = self.exercise_module.check_bicep_curl_form(landmarks, elbow_angle, self.stage)
-        
-        if elbow_angle > 160:
-            self.stage = "down"
-        if elbow_angle < 30 and self.stage == 'down':
-            self.stage = "up"
-            self.counter += 1
-            if not self.exercise_module.check_bicep_curl_form(landmarks, elbow_angle, "up"):
-                self.good_reps += 1
-    
-    def _process_squats(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        
-        knee_angle = calculate_angle(hip, knee, ankle)
-        hip_angle = calculate_angle(shoulder, hip, knee)
-        
-        self.feedback_list = self.exercise_module.check_squat_form(knee_angle, hip_angle, self.stage)
-        
-        if knee_angle > 160:
-            self.stage = "up"
-        if knee_angle < 100 and self.stage == "up":
-            self.stage = "down"
-            self.counter += 1
-            if not self.exercise_module.check_squat_form(knee_angle, hip_angle, "down"):
-                self.good_reps += 1
-    
-    def _process_plank(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-        
-        hip_angle = calculate_angle(shoulder, hip, ankle)
-        self.feedback_list = self.exercise_module.check_plank_form(hip_angle)
-        
-        good_form = not self.feedback_list
-        now = time.time()
-        if good_form:
-            self.good_form_time += now - self.last_frame_time
-        self.last_frame_time = now
-    
-    # Add other exercise processing methods...
-    def _process_overhead_press(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x, landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x, landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        
-        elbow_angle = calculate_angle(shoulder, elbow, wrist)
-        shoulder_angle = calculate_angle(hip, shoulder, elbow)
-        
-        self.feedback_list = self.exercise_module.check_overhead_press_form(elbow_angle, shoulder_angle, self.stage)
-        
-        if elbow_angle < 90:
-            self.stage = "down"
-        if elbow_angle > 160 and self.stage == "down":
-            self.stage = "up"
-            self.counter += 1
-            if not self.exercise_module.check_overhead_press_form(elbow_angle, shoulder_angle, "up"):
-                self.good_reps += 1
-    
-    def _process_lateral_raises(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x, landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x, landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        
-        shoulder_angle = calculate_angle(hip, shoulder, elbow)
-        elbow_angle = calculate_angle(shoulder, elbow, wrist)
-        
-        self.feedback_list = self.exercise_module.check_lateral_raise_form(shoulder_angle, elbow_angle, self.stage)
-        
-        if shoulder_angle < 30:
-            self.stage = "down"
-        if shoulder_angle > 70 and self.stage == "down":
-            self.stage = "up"
-            self.counter += 1
-            if not self.exercise_module.check_lateral_raise_form(shoulder_angle, elbow_angle, "up"):
-                self.good_reps += 1
-    
-    def _process_lunges(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        left_hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        left_knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        left_ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-        right_hip = [landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].x, landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].y]
-        right_knee = [landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].x, landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].y]
-        right_ankle = [landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x, landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].y]
-        
-        front_knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
-        back_knee_angle = calculate_angle(right_hip, right_knee, right_ankle)
-        
-        self.feedback_list = self.exercise_module.check_lunge_form(front_knee_angle, back_knee_angle, self.stage)
-        
-        if front_knee_angle > 160 and back_knee_angle > 160:
-            self.stage = "up"
-        if front_knee_angle < 100 and self.stage == "up":
-            self.stage = "down"
-            self.counter += 1
-            if not self.exercise_module.check_lunge_form(front_knee_angle, back_knee_angle, "down"):
-                self.good_reps += 1
-    
-    def _process_pullups(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x, landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x, landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        nose = landmarks[mp_pose.PoseLandmark.NOSE.value]
-        
-        elbow_angle = calculate_angle(shoulder, elbow, wrist)
-        self.feedback_list = self.exercise_module.check_pullup_form(landmarks, elbow_angle, self.stage)
-        
-        if elbow_angle > 160:
-            self.stage = "down"
-        if nose.y < shoulder[1] and elbow_angle < 100 and self.stage == "down":
-            self.stage = "up"
-            self.counter += 1
-            if not self.exercise_module.check_pullup_form(landmarks, elbow_angle, "up"):
-                self.good_reps += 1
-    
-    def _process_pushups(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x, landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x, landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        
-        elbow_angle = calculate_angle(shoulder, elbow, wrist)
-        hip_angle = calculate_angle(shoulder, hip, knee)
-        
-        if elbow_angle > 160:
-            current_stage = "up"
-        elif elbow_angle < 90:
-            current_stage = "down"
-        else:
-            current_stage = self.stage
-        
-        if current_stage == "down" and self.stage == "up":
-            self.counter += 1
-            if not self.exercise_module.check_pushup_form(elbow_angle, hip_angle, "down"):
-                self.good_reps += 1
-        
-        self.stage = current_stage
-        self.feedback_list = self.exercise_module.check_pushup_form(elbow_angle, hip_angle, current_stage)
-    
-    def _process_glute_bridges(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        
-        hip_angle = calculate_angle(shoulder, hip, knee)
-        self.feedback_list = self.exercise_module.check_glute_bridge_form(hip_angle, self.stage)
-        
-        if hip_angle < 150:
-            self.stage = "down"
-        if hip_angle > 160 and self.stage == 'down':
-            self.stage = "up"
-            self.counter += 1
-            if not self.exercise_module.check_glute_bridge_form(hip_angle, "up"):
-                self.good_reps += 1
-    
-    def _process_crunches(self, landmarks, calculate_angle):
-        import mediapipe as mp
-        mp_pose = mp.solutions.pose
-        
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x, landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x, landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x, landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        
-        hip_angle = calculate_angle(shoulder, hip, knee)
-        self.feedback_list = self.exercise_module.check_crunch_form(hip_angle, self.stage)
-        
-        if hip_angle > 160:
-            self.stage = "down"
-        if hip_angle < 150 and self.stage == 'down':
-            self.stage = "up"
-            self.counter += 1
-            if not self.exercise_module.check_crunch_form(hip_angle, "up"):
-                self.good_reps += 1
-    
-    def get_stats(self):
-        """Get current exercise statistics"""
-        elapsed_time = time.time() - self.start_time
-        
-        if self.exercise_name == 'plank':
-            return {
-                'exercise': self.exercise_name,
-                'elapsed_time': int(elapsed_time),
-                'good_form_time': int(self.good_form_time),
-                'feedback': self.feedback_list
-            }
-        else:
-            return {
-                'exercise': self.exercise_name,
-                'reps': self.counter,
-                'good_reps': self.good_reps,
-                'stage': self.stage,
-                'elapsed_time': int(elapsed_time),
-                'feedback': self.feedback_list
-            }
-
-def generate_frames():
-    """Generate video frames with pose estimation"""
-    global exercise_processor, video_capture, is_processing
+frame_broadcast = None
+video_recorder = None
+
+def process_video(session, exercise_processor, source, broadcast, video_recorder=None):
+    """Run pose estimation and exercise logic on a session's frames and publish them encoded
     
-    import mediapipe as mp
-    mp_drawing = mp.solutions.drawing_utils
-    mp_pose = mp.solutions.pose
+    Runs on the session's processing thread, once however many clients watch;
+    viewers only ever wait on ``broadcast``.
+    """
+    landmark_filter = create_landmark_filter()
+    # Replays need the session start to reproduce elapsed-time stats
+    recording_metadata = {'start_time': exercise_processor.start_time}
     
-    with mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
-        while is_processing and video_capture and video_capture.isOpened():
-            ret, frame = video_capture.read()
-            if not ret:
+    # Leaving the block closes the broadcast, ending every viewer's stream, even if the pipeline fails
+    with broadcast, profiling.profiled_loop(session), create_pose_backend() as pose, \
+            create_session_recorder(exercise_processor.exercise_name, session.session_id,
+                                    metadata=recording_metadata) as recorder:
+        # Asynchronous backends return landmarks for an older frame; extrapolate
+        # them to the frame on screen so the skeleton does not trail the body
+        predictor = None
+        if pose.asynchronous and os.environ.get('OVERLAY_PREDICTION', '1') == '1':
+            predictor = LandmarkPredictor()
+        
+        landmarks = None
+        # Each lap charges the time since the previous one to a pipeline stage
+        timer = metrics.StageTimer(session)
+        while not broadcast.closed:
+            timer.start()
+            # Always the newest frame; older ones the reader thread skipped are never processed
+            captured = source.read()
+            if captured is None:
                 break
+            frame = captured.image
+            timer.frame_id = captured.index
+            timer.lap('capture')
+            # Armed through /api/admin/profile; a single attribute check otherwise
+            profiler = session.profiler
+            if profiler:
+                profiler.frame_started()
             
-            # Process frame
+            # Submit frame; asynchronous backends deliver results on a later iteration
             image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = pose.process(image)
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            timer.lap('color_conversion')
+            timestamp_ms = int(captured.timestamp * 1000)
+            pose.submit(image, timestamp_ms)
+            results = pose.poll()
+            timer.lap('pose')
+            
+            for result in results:
+                landmarks = result.landmarks
+                # Smooth jitter before it reaches the stage thresholds
+                if landmark_filter:
+                    landmarks = landmark_filter.update(landmarks, result.timestamp_ms / 1000.0)
+                if predictor:
+                    predictor.update(landmarks, result.timestamp_ms / 1000.0)
+                # Apply exercise-specific processing
+                exercise_processor.process_frame(frame, landmarks, result.timestamp_ms / 1000.0)
+                if recorder:
+                    recorder.append(result.timestamp_ms / 1000.0, landmarks,
+                                    exercise_processor.stage, exercise_processor.feedback_list)
+            
+            timer.lap('logic')
             
-            # Apply exercise-specific processing
-            if exercise_processor:
-                exercise_processor.process_frame(image, results)
-                
-                # Add feedback to frame
-                y_pos = 100
-                if exercise_processor.feedback_list:
-                    for feedback in exercise_processor.feedback_list:
-                        cv2.putText(image, feedback, (15, y_pos), 
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2, cv2.LINE_AA)
-                        y_pos += 30
-                else:
-                    cv2.putText(image, "GOOD FORM", (15, y_pos), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2, cv2.LINE_AA)
+            # Add feedback to frame
+            y_pos = 100
+            if exercise_processor.feedback_list:
+                for feedback in exercise_processor.feedback_list:
+                    cv2.putText(frame, feedback, (15, y_pos), 
+                              cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2, cv2.LINE_AA)
+                    y_pos += 30
+            else:
+                cv2.putText(frame, "GOOD FORM", (15, y_pos), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2, cv2.LINE_AA)
             
-            # Draw pose landmarks
-            if results.pose_landmarks:
-                mp_drawing.draw_landmarks(image, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
+            # Draw pose landmarks; the counting logic above only ever sees measured ones
+            overlay_landmarks = predictor.predict(timestamp_ms / 1000.0) if predictor else landmarks
+            if overlay_landmarks is not None:
+                draw_landmarks(frame, overlay_landmarks)
+            timer.lap('overlay')
             
-            # Encode frame
-            ret, buffer = cv2.imencode('.jpg', image)
-            if ret:
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+            # Encode only the renditions someone is watching, once each however many watch it
+            jpegs = encode_renditions(frame, broadcast.wanted_renditions())
+            timer.lap('encode')
+            if profiler and profiler.frame_finished():
+                session.profiler = None
+            # Wall-clock capture time, comparable with the display time the client reports
+            capture_time = time.time() - (time.monotonic() - captured.timestamp)
+            session.dropped_frames = source.dropped + pose.frames_skipped
+            session.frame_done(captured.index, capture_time)
+            broadcast.publish(EncodedFrame(jpegs, captured.index, capture_time, frame))
+            if video_recorder:
+                # Queued for the recorder's own thread; dropped rather than waited for when it is behind
+                video_recorder.submit(frame, capture_time)
+
+def generate_frames(broadcast, viewer):
+    """Stream a session's frames as MJPEG parts, skipping any published while this client was sending"""
+    try:
+        sequence = 0
+        while True:
+            time.sleep(viewer.delay())
+            update = broadcast.wait(sequence)
+            if update is None:
+                break
+            sequence, frame = update
+            part = viewer.render(sequence, frame)
+            if part is None:
+                continue
+            # The server writes the part before resuming us, so this times the send to this client
+            send_start = time.perf_counter()
+            yield part
+            viewer.sent(len(part), time.perf_counter() - send_start)
+    finally:
+        broadcast.remove_viewer(viewer)
+
+def generate_h264(stream, viewer):
+    """Stream a session's H.264 as fragmented MP4: init segment, then one fragment per frame"""
+    try:
+        while True:
+            chunks = stream.next_chunks(viewer)
+            if chunks is None:
+                break
+            if chunks:
+                yield b''.join(chunks)
+    finally:
+        stream.remove_viewer(viewer)
+
+def generate_events(subscription):
+    """Stream hub events as Server-Sent Events, with a comment whenever the stream has been idle a while"""
+    try:
+        # WSGI servers send the headers with the first chunk; don't hold them back until the first event
+        yield SSE_KEEPALIVE
+        while True:
+            events = event_hub.next_events(subscription, timeout=KEEPALIVE_INTERVAL)
+            yield b''.join(format_sse(event) for event in events) if events else SSE_KEEPALIVE
+    finally:
+        event_hub.unsubscribe(subscription)
 
 @app.route('/api/exercises', methods=['GET'])
 def get_exercises():
@@ -388,7 +197,8 @@ def get_exercises():
 @app.route('/api/start_exercise', methods=['POST'])
 def start_exercise():
     """Start exercise tracking"""
-    global current_exercise, exercise_processor, video_capture, is_processing
+    global current_exercise, exercise_processor, frame_source, session_id, session_metrics, \
+        processing_thread, frame_broadcast, video_recorder
     
     data = request.get_json()
     exercise_name = data.get('exercise')
@@ -405,13 +215,25 @@ def start_exercise():
         current_exercise = exercise_name
         
         # Start video capture
-        video_capture = cv2.VideoCapture(0)
-        if not video_capture.isOpened():
-            return jsonify({'error': 'Could not access webcam'}), 500
-        
-        is_processing = True
-        
-        return jsonify({'message': f'Started {exercise_name}', 'exercise': exercise_name})
+        source = data.get('source') or os.environ.get('VIDEO_SOURCE', '0')
+        try:
+            frame_source = open_frame_source(source, exercise_name)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 500
+        
+        session_id = uuid.uuid4().hex[:12]
+        session_metrics = metrics.start_session(session_id, exercise_name)
+        exercise_processor.on_event = functools.partial(event_hub.publish, session_id=session_id)
+        event_hub.publish(SESSION_STARTED, session_id=session_id, exercise=exercise_name)
+        frame_broadcast = FrameBroadcast()
+        video_recorder = create_video_recorder(exercise_name, session_id)
+        processing_thread = threading.Thread(
+            target=process_video,
+            args=(session_metrics, exercise_processor, frame_source, frame_broadcast, video_recorder),
+            name=f'session-{session_id}', daemon=True)
+        processing_thread.start()
+        
+        return jsonify({'message': f'Started {exercise_name}', 'exercise': exercise_name, 'session_id': session_id})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -419,43 +241,215 @@ def start_exercise():
 @app.route('/api/stop_exercise', methods=['POST'])
 def stop_exercise():
     """Stop exercise tracking"""
-    global current_exercise, exercise_processor, video_capture, is_processing
+    global current_exercise, exercise_processor, frame_source, session_id, session_metrics, \
+        processing_thread, frame_broadcast, video_recorder
     
-    is_processing = False
+    warning = None
+    if frame_broadcast:
+        frame_broadcast.close()
+        frame_broadcast = None
+    if frame_source:
+        frame_source.close()
+        frame_source = None
+    if processing_thread:
+        # Let the pipeline finish its frame and close the landmark recording before reporting
+        processing_thread.join(timeout=PIPELINE_STOP_TIMEOUT)
+        if processing_thread.is_alive():
+            # Still inside a frame (e.g. a hung camera read); the stats below may miss its last frames
+            warning = f"Session pipeline did not stop within {PIPELINE_STOP_TIMEOUT:g}s"
+            print(f"{warning}: session {session_id}", file=sys.stderr)
+        processing_thread = None
     
-    if video_capture:
-        video_capture.release()
-        video_capture = None
+    recording = None
+    if video_recorder:
+        # Encodes whatever is still queued before the file is finished
+        recording = video_recorder.close()
+        video_recorder = None
     
     stats = None
     if exercise_processor:
         stats = exercise_processor.get_stats()
     
+    if session_id:
+        metrics.end_session(session_id)
+        event_hub.publish(SESSION_ENDED, session_id=session_id, exercise=current_exercise, final_stats=stats,
+                          recording=recording)
+    
     current_exercise = None
     exercise_processor = None
+    session_id = None
+    session_metrics = None
     
-    return jsonify({'message': 'Exercise stopped', 'final_stats': stats})
+    response = {'message': 'Exercise stopped', 'final_stats': stats, 'recording': recording}
+    if warning:
+        response['warning'] = warning
+    return jsonify(response)
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get current exercise statistics"""
     if exercise_processor:
-        return jsonify(exercise_processor.get_stats())
+        stats = exercise_processor.get_stats()
+        session = session_metrics
+        if session:
+            stats['latency'] = session.latency_summary()
+        broadcast = frame_broadcast
+        if broadcast:
+            stats['viewers'] = broadcast.viewer_stats()
+            h264 = h264_stream.current(broadcast)
+            if h264:
+                stats['h264'] = h264.stats()
+        stats['errors'] = dict(exercise_processor.error_counts)
+        stats['frames_without_pose'] = exercise_processor.frames_without_pose
+        recorder = video_recorder
+        if recorder:
+            stats['recording'] = recorder.stats()
+        return jsonify(stats)
     return jsonify({'error': 'No active exercise'}), 400
 
+@app.route('/api/latency', methods=['POST'])
+def report_latency():
+    """Client display times of video frames, as [[frame_id, displayed_at], ...] in server-clock seconds"""
+    data = request.get_json(silent=True) or {}
+    session = metrics.get_session(data.get('session_id') or session_id or '')
+    if not session:
+        return jsonify({'error': 'No such session'}), 404
+    
+    try:
+        matched = sum(session.frame_displayed(int(frame_id), float(displayed_at))
+                      for frame_id, displayed_at in data.get('frames', []))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'frames must be [frame_id, displayed_at] pairs'}), 400
+    # server_time lets the client estimate its clock offset from the round trip
+    return jsonify({'matched': matched, 'server_time': time.time()})
+
 @app.route('/video_feed')
 def video_feed():
-    """Video streaming route"""
-    if not is_processing:
+    """Video streaming route; ?rendition=full|half|quarter picks the resolution"""
+    broadcast = frame_broadcast
+    if not broadcast:
         return jsonify({'error': 'No active exercise'}), 400
     
-    return Response(generate_frames(),
-                   mimetype='multipart/x-mixed-replace; boundary=frame')
+    try:
+        viewer = broadcast.add_viewer(request.args.get('rendition', DEFAULT_RENDITION))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(generate_frames(broadcast, viewer), mimetype=MJPEG_MIMETYPE)
+
+@app.route('/video_h264')
+def video_h264():
+    """H.264 video as fragmented MP4, for a <video> element through Media Source Extensions"""
+    broadcast = frame_broadcast
+    if not broadcast:
+        return jsonify({'error': 'No active exercise'}), 400
+    if not h264_stream.available():
+        return jsonify({'error': f'H.264 output needs {h264_stream.FFMPEG} with libx264'}), 503
+    
+    stream, viewer = h264_stream.add_viewer(broadcast)
+    return Response(generate_h264(stream, viewer), mimetype=h264_stream.MIMETYPE,
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/events')
+def stream_events():
+    """Workout events as Server-Sent Events; ?types=rep_completed,form_fault and ?session_id= filter them"""
+    try:
+        subscription = event_hub.subscribe(**subscription_options(
+            request.args.get('types'), request.args.get('session_id'), request.headers.get('Last-Event-ID')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(generate_events(subscription), mimetype=SSE_MIMETYPE, headers={'Cache-Control': 'no-cache'})
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'current_exercise': current_exercise})
+    return jsonify({'status': 'healthy', 'current_exercise': current_exercise, 'session_id': session_id})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Pipeline stage timings, frame rate and dropped frames in Prometheus text format"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def admin_denied():
+    """Error response unless the request carries ADMIN_TOKEN (when one is configured)"""
+    token = os.environ.get('ADMIN_TOKEN')
+    if token and request.headers.get('X-Admin-Token') != token:
+        return jsonify({'error': 'Admin token required'}), 403
+    return None
+
+@app.route('/api/admin/profile', methods=['POST'])
+def start_profile():
+    """Profile the next N frames of a session's video loop"""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    data = request.get_json(silent=True) or {}
+    target = data.get('session_id') or session_id
+    session = metrics.get_session(target) if target else None
+    if not session:
+        return jsonify({'error': 'No such session'}), 404
+
+    try:
+        profiler = profiling.arm(session, int(data.get('frames', 100)), data.get('mode', 'cprofile'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(profiler.status()), 202
+
+@app.route('/api/admin/profile/<profile_session_id>', methods=['GET'])
+def get_profile(profile_session_id):
+    """Progress of a profile, or the finished profile as a download (?format=pstats|text|collapsed)"""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    profiler = profiling.get_profile(profile_session_id)
+    if not profiler:
+        return jsonify({'error': 'No profile for this session'}), 404
+    if not profiler.finished:
+        return jsonify(profiler.status()), 202
+
+    try:
+        body, mimetype, filename = profiler.export(request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/api/admin/errors', methods=['GET'])
+def get_errors():
+    """Frame processing error counts by exercise and type, with recent sampled stack traces"""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    counts = [{'exercise': exercise_name, 'type': error_type, 'count': count}
+              for (exercise_name, error_type), count in sorted(error_tracker.snapshot().items())]
+    return jsonify({'counts': counts, 'samples': error_tracker.recent_samples()})
+
+@app.route('/api/admin/trace', methods=['POST'])
+def configure_trace():
+    """Switch pipeline tracing on or off, resize or clear its ring buffer"""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    data = request.get_json(silent=True) or {}
+    try:
+        capacity = int(data['capacity']) if 'capacity' in data else None
+        return jsonify(tracing.configure(data.get('enabled'), capacity, bool(data.get('clear'))))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/admin/trace', methods=['GET'])
+def get_trace():
+    """Recorded pipeline spans as Chrome/Perfetto trace-event JSON"""
+    denied = admin_denied()
+    if denied:
+        return denied
+
+    return Response(json.dumps(tracing.export()), mimetype='application/json',
+                    headers={'Content-Disposition': 'attachment; filename=pipeline-trace.json'})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
\ No newline at end of file
+    # Development server; see asgi.py for production serving
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG', '1') == '1', threaded=True)
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""Production server: ASGI with video streams served on the event loop.
+
+    python asgi.py                                   # uvicorn with WEB_CONCURRENCY workers
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+The Flask app in ``app.py`` still answers the JSON API, on a bounded pool of
+``WSGI_THREADS`` threads. ``/video_feed`` is served natively: every viewer is a
+coroutine waiting on its session's ``FrameBroadcast``, so hundreds of idle or
+slow streaming connections cost a small buffer each instead of an OS thread,
+and no request handler ever waits on the frame pipeline, which runs on its own
+thread per session. A viewer whose socket is not writable blocks only its own
+coroutine and picks up the newest frame once it can send again. ``/video_h264``
+is served the same way from the session's shared H.264 encoder, and
+``/api/events`` from the event hub.
+
+Sessions live in the worker process that started them. With more than one
+worker, run behind a proxy that pins each client to one worker.
+"""
+import asyncio
+import json
+import os
+import time
+from urllib.parse import parse_qs
+
+import uvicorn
+from a2wsgi import WSGIMiddleware
+
+import app as backend
+import h264_stream
+from events import KEEPALIVE_INTERVAL, SSE_KEEPALIVE, SSE_MIMETYPE, event_hub, format_sse, subscription_options
+from streaming import DEFAULT_RENDITION, MJPEG_MIMETYPE
+
+wsgi_application = WSGIMiddleware(backend.app, workers=int(os.environ.get('WSGI_THREADS', 16)))
+
+# Flask-CORS covers the WSGI routes; the native ones answer cross-origin requests themselves
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode())] + CORS_HEADERS})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stream_video(scope, receive, send):
+    """MJPEG stream of the current session; each send waits only for this viewer's socket"""
+    broadcast = backend.frame_broadcast
+    if broadcast is None:
+        await send_json(send, 400, {'error': 'No active exercise'})
+        return
+
+    query = parse_qs(scope.get('query_string', b'').decode())
+    try:
+        viewer = broadcast.add_viewer(query.get('rendition', [DEFAULT_RENDITION])[0])
+    except ValueError as e:
+        await send_json(send, 400, {'error': str(e)})
+        return
+
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    disconnected = False
+
+    def on_publish():
+        # Called on the pipeline thread
+        loop.call_soon_threadsafe(wakeup.set)
+
+    async def watch_disconnect():
+        nonlocal disconnected
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected = True
+        wakeup.set()
+
+    broadcast.add_listener(on_publish)
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', MJPEG_MIMETYPE.encode()),
+                                (b'cache-control', b'no-cache')] + CORS_HEADERS})
+        sent = 0
+        while not disconnected:
+            delay = viewer.delay()
+            if delay:
+                await asyncio.sleep(delay)
+            wakeup.clear()
+            sequence, frame = broadcast.current()
+            if broadcast.closed:
+                break
+            if sequence > sent:
+                sent = sequence
+                part = viewer.render(sequence, frame)
+                if part is None:
+                    continue
+                # Completes once the transport has room, so this times the send to this client
+                send_start = time.perf_counter()
+                await send({'type': 'http.response.body', 'body': part, 'more_body': True})
+                viewer.sent(len(part), time.perf_counter() - send_start)
+                continue
+            await wakeup.wait()
+        if not disconnected:
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        broadcast.remove_listener(on_publish)
+        broadcast.remove_viewer(viewer)
+        watcher.cancel()
+
+
+async def stream_h264(scope, receive, send):
+    """Fragmented MP4 stream of the current session's H.264 encoder"""
+    broadcast = backend.frame_broadcast
+    if broadcast is None:
+        await send_json(send, 400, {'error': 'No active exercise'})
+        return
+    if not h264_stream.available():
+        await send_json(send, 503, {'error': f'H.264 output needs {h264_stream.FFMPEG} with libx264'})
+        return
+
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    disconnected = False
+
+    async def watch_disconnect():
+        nonlocal disconnected
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected = True
+        wakeup.set()
+
+    stream, viewer = h264_stream.add_viewer(broadcast)
+    # Called on the encoder's reader thread
+    viewer.listener = lambda: loop.call_soon_threadsafe(wakeup.set)
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', h264_stream.MIMETYPE.encode()),
+                                (b'cache-control', b'no-cache')] + CORS_HEADERS})
+        while not disconnected:
+            wakeup.clear()
+            chunks = stream.take_chunks(viewer)
+            if chunks is None:
+                break
+            if chunks:
+                await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': True})
+                continue
+            await wakeup.wait()
+        if not disconnected:
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        stream.remove_viewer(viewer)
+        watcher.cancel()
+
+
+async def stream_events(scope, receive, send):
+    """Server-Sent Events from the event hub; each client is a coroutine, not a WSGI thread"""
+    query = parse_qs(scope.get('query_string', b'').decode())
+    headers = dict(scope.get('headers', []))
+    try:
+        subscription = event_hub.subscribe(**subscription_options(
+            query.get('types', [None])[0], query.get('session_id', [None])[0],
+            headers.get(b'last-event-id', b'').decode()))
+    except ValueError as e:
+        await send_json(send, 400, {'error': str(e)})
+        return
+
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    disconnected = False
+
+    async def watch_disconnect():
+        nonlocal disconnected
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected = True
+        wakeup.set()
+
+    # Called on the publishing thread
+    subscription.listener = lambda: loop.call_soon_threadsafe(wakeup.set)
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', SSE_MIMETYPE.encode()),
+                                (b'cache-control', b'no-cache')] + CORS_HEADERS})
+        while not disconnected:
+            wakeup.clear()
+            events = event_hub.take_events(subscription)
+            if events:
+                await send({'type': 'http.response.body', 'body': b''.join(format_sse(event) for event in events),
+                            'more_body': True})
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                await send({'type': 'http.response.body', 'body': SSE_KEEPALIVE, 'more_body': True})
+    finally:
+        event_hub.unsubscribe(subscription)
+        watcher.cancel()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Close the camera and flush the landmark recording of a running session
+            await asyncio.to_thread(stop_session)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def stop_session():
+    with backend.app.app_context():
+        backend.stop_exercise()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/video_feed' and scope['method'] == 'GET':
+        await stream_video(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/video_h264' and scope['method'] == 'GET':
+        await stream_h264(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/events' and scope['method'] == 'GET':
+        await stream_events(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
+
+
+if __name__ == '__main__':
+    uvicorn.run('asgi:application', host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)),
+                workers=int(os.environ.get('WEB_CONCURRENCY', 1)), lifespan='on')
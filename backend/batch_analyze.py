@@ -0,0 +1,123 @@
+"""Parallel re-scoring of archived workout videos.
+
+    python batch_analyze.py recordings/ --exercise squats --output scores.jsonl
+    python batch_analyze.py manifest.jsonl --output scores.jsonl --workers 16
+
+The input is a directory (walked recursively, every video scored as
+``--exercise``) or a JSON lines manifest of ``{"video": ..., "exercise": ...}``
+entries. Videos are spread over a process pool whose workers each keep one warm
+pose graph, reset before every video so a score does not depend on which videos
+the worker ran before. Records stream into a single output file as videos
+finish; the output doubles as the checkpoint, so rerunning the same command
+after an interruption skips every video that already has a summary line.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from analyze import analyze_video, init_worker, worker_pose
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm')
+
+def collect_jobs(source, exercise):
+    """List (video, exercise) pairs from a directory or a JSON lines manifest"""
+    if os.path.isdir(source):
+        if not exercise:
+            raise ValueError("--exercise is required when scoring a directory")
+        jobs = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(VIDEO_EXTENSIONS):
+                    jobs.append((os.path.join(root, name), exercise))
+        return sorted(jobs)
+
+    jobs = []
+    with open(source) as manifest:
+        for line in manifest:
+            if line.strip():
+                entry = json.loads(line)
+                jobs.append((entry['video'], entry.get('exercise', exercise)))
+    return jobs
+
+
+def completed_videos(output_path):
+    """Videos that already have a summary in the output file"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as output:
+        for line in output:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by the interruption
+                continue
+            if record.get('type') == 'summary':
+                done.add(record['video'])
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _score_video(job):
+    path, exercise = job
+    try:
+        # worker_pose() resets the graph, so every video scores as on a freshly loaded one
+        return list(analyze_video(path, exercise, worker_pose()))
+    except Exception as e:
+        return [{'type': 'error', 'video': path, 'exercise': exercise, 'error': str(e)}]
+
+
+def run_batch(jobs, output_path, workers=None, backend_name=None):
+    """Score jobs in parallel, appending records to ``output_path``; returns aggregate stats"""
+    done = completed_videos(output_path)
+    pending = [job for job in jobs if job[0] not in done]
+    totals = {'videos': 0, 'skipped': len(jobs) - len(pending), 'errors': 0, 'frames': 0}
+
+    start = time.perf_counter()
+    with open(output_path, 'a') as output, multiprocessing.Pool(
+            workers or os.cpu_count(), initializer=init_worker, initargs=(backend_name,)) as pool:
+        # Terminate a line left half-written by an interruption
+        if output.tell() and not _ends_with_newline(output_path):
+            output.write('\n')
+        # Unordered so one long video does not hold back the results behind it
+        for records in pool.imap_unordered(_score_video, pending):
+            # Failed videos get an error line but no summary, so a rerun retries them
+            for record in records:
+                output.write(json.dumps(record) + '\n')
+                if record['type'] == 'summary':
+                    totals['videos'] += 1
+                    totals['frames'] += record['frames']
+                elif record['type'] == 'error':
+                    totals['errors'] += 1
+            output.flush()
+
+    elapsed = time.perf_counter() - start
+    totals['seconds'] = round(elapsed, 1)
+    totals['fps'] = round(totals['frames'] / elapsed, 1) if elapsed else 0.0
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='Directory of videos or JSON lines manifest')
+    parser.add_argument('--exercise', help='Exercise for directory inputs or manifest entries without one')
+    parser.add_argument('--output', required=True, help='JSON lines output, also used as the resume checkpoint')
+    parser.add_argument('--workers', type=int, help='Worker processes (defaults to all cores)')
+    parser.add_argument('--backend', help='Pose backend (defaults to POSE_BACKEND or solutions)')
+    args = parser.parse_args()
+
+    jobs = collect_jobs(args.source, args.exercise)
+    totals = run_batch(jobs, args.output, args.workers, args.backend)
+    print(f"Scored {totals['videos']} videos ({totals['skipped']} already done, {totals['errors']} failed): "
+          f"{totals['frames']} frames in {totals['seconds']}s, {totals['fps']} frames/s")
+
+
+if __name__ == '__main__':
+    main()
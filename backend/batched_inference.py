@@ -0,0 +1,231 @@
+"""Micro-batched pose inference shared across sessions.
+
+Instead of one MediaPipe graph per session, every ``TFLiteBatchedPoseBackend``
+crops its frame to a 256x256 region of interest and hands it to a shared
+``MicroBatcher``. The batcher waits up to a small latency window for frames from
+other sessions, runs them through the pose landmark TFLite model in a single
+interpreter call and scatters the landmarks back to each session's backend.
+Each session keeps at most ``MAX_IN_FLIGHT`` frames in the batcher and skips
+frames submitted while they are pending, so when the sessions together send
+more frames than the model can run, the queue stays short and every session
+gets its newest frames inferred instead of an ever older backlog.
+
+Requires ``tflite_runtime`` (or full ``tensorflow``) and the pose landmark model,
+which ships with the mediapipe package as ``pose_landmark_full.tflite``.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+import tracing
+from errors import record_error
+from landmarks import NUM_LANDMARKS, VISIBILITY_THRESHOLD
+from pose_backends import PoseBackend
+
+INPUT_SIZE = 256
+# Each landmark is x, y, z, visibility logit, presence logit
+LANDMARK_VALUES = 5
+ROI_SCALE = 1.5
+# Frames one session may have waiting in the shared batcher; newer ones are skipped meanwhile
+MAX_IN_FLIGHT = 2
+# Minimum pose presence probability, compared after the presence logit's sigmoid
+POSE_PRESENCE_THRESHOLD = 0.5
+
+
+def _load_interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tensorflow.lite import Interpreter
+        except ImportError:
+            raise ImportError("The tflite_batched backend requires tflite_runtime or tensorflow")
+    return Interpreter
+
+
+def default_model_path():
+    """Locate the pose landmark model bundled with mediapipe"""
+    path = os.environ.get('POSE_TFLITE_MODEL')
+    if path:
+        return path
+    import mediapipe
+    return os.path.join(os.path.dirname(mediapipe.__file__), 'modules', 'pose_landmark', 'pose_landmark_full.tflite')
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class MicroBatcher:
+    """Groups single-frame inference requests into batched interpreter calls"""
+
+    def __init__(self, model_path, max_batch=8, window_ms=5.0, num_threads=None):
+        self.model_path = model_path
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self.num_threads = num_threads or os.cpu_count()
+        self._interpreter_class = _load_interpreter_class()
+        self._interpreters = {}
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='pose-microbatcher', daemon=True)
+        self._worker.start()
+
+    def infer(self, tensor):
+        """Queue a (256, 256, 3) float32 tensor and return a Future for its raw outputs"""
+        future = Future()
+        self._requests.put((tensor, future))
+        return future
+
+    def _interpreter(self, batch_size):
+        # Interpreters are cached per padded batch size so tensors are only allocated once
+        interpreter = self._interpreters.get(batch_size)
+        if interpreter is None:
+            interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+            input_index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(input_index, [batch_size, INPUT_SIZE, INPUT_SIZE, 3])
+            interpreter.allocate_tensors()
+            outputs = interpreter.get_output_details()
+            landmark_index = next(o['index'] for o in outputs if o['shape'][-1] == 39 * LANDMARK_VALUES)
+            presence_index = next(o['index'] for o in outputs if len(o['shape']) == 2 and o['shape'][-1] == 1)
+            interpreter = (interpreter, input_index, landmark_index, presence_index)
+            self._interpreters[batch_size] = interpreter
+        return interpreter
+
+    def _collect(self):
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            padded_size = 1 << (len(batch) - 1).bit_length()
+            inputs = np.zeros((padded_size, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32)
+            for i, (tensor, _) in enumerate(batch):
+                inputs[i] = tensor
+
+            invoke_start = time.perf_counter()
+            try:
+                interpreter, input_index, landmark_index, presence_index = self._interpreter(padded_size)
+                interpreter.set_tensor(input_index, inputs)
+                interpreter.invoke()
+                landmarks = interpreter.get_tensor(landmark_index)
+                presence = interpreter.get_tensor(presence_index)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            if tracing.enabled:
+                tracing.record('batch_inference', invoke_start, time.perf_counter() - invoke_start,
+                               category='pose', batch_size=len(batch), padded_size=padded_size)
+
+            for i, (_, future) in enumerate(batch):
+                future.set_result((landmarks[i].reshape(-1, LANDMARK_VALUES), float(presence[i, 0])))
+
+
+_shared_batchers = {}
+_shared_batchers_lock = threading.Lock()
+
+
+def get_shared_batcher(model_path=None, **kwargs):
+    """Return the process-wide batcher for a model, creating it on first use"""
+    model_path = model_path or default_model_path()
+    with _shared_batchers_lock:
+        if model_path not in _shared_batchers:
+            _shared_batchers[model_path] = MicroBatcher(model_path, **kwargs)
+        return _shared_batchers[model_path]
+
+
+class TFLiteBatchedPoseBackend(PoseBackend):
+    """Per-session front end to a shared ``MicroBatcher``
+
+    The region of interest follows the previous frame's landmarks, falling back to
+    the whole (letterboxed) frame when tracking is lost.
+    """
+
+    name = 'tflite_batched'
+    asynchronous = True
+
+    def __init__(self, batcher=None):
+        super().__init__()
+        self._batcher = batcher or get_shared_batcher(
+            max_batch=int(os.environ.get('POSE_MAX_BATCH', 8)),
+            window_ms=float(os.environ.get('POSE_BATCH_WINDOW_MS', 5.0)),
+        )
+        self._roi = None
+        self._slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+
+    def reset(self):
+        super().reset()
+        self._roi = None
+
+    def _frame_roi(self, width, height):
+        if self._roi is not None:
+            return self._roi
+        return (width / 2.0, height / 2.0, float(max(width, height)))
+
+    def submit(self, image, timestamp_ms):
+        if not self._slots.acquire(blocking=False):
+            # Earlier frames are still waiting for the batcher
+            self.frames_skipped += 1
+            return
+        height, width = image.shape[:2]
+        center_x, center_y, size = self._frame_roi(width, height)
+        scale = INPUT_SIZE / size
+        x0, y0 = center_x - size / 2.0, center_y - size / 2.0
+        transform = np.float32([[scale, 0, -x0 * scale], [0, scale, -y0 * scale]])
+        crop = cv2.warpAffine(image, transform, (INPUT_SIZE, INPUT_SIZE), flags=cv2.INTER_LINEAR)
+        tensor = crop.astype(np.float32) * (1.0 / 255.0)
+
+        future = self._batcher.infer(tensor)
+        future.add_done_callback(
+            lambda f: self._on_result(f, timestamp_ms, x0, y0, size, width, height))
+
+    def _on_result(self, future, timestamp_ms, x0, y0, size, width, height):
+        self._slots.release()
+        if future.exception() is not None:
+            # A broken interpreter fails every batch; the tracker rate-limits the log
+            record_error(self.name, future.exception())
+            self._publish(None, timestamp_ms)
+            return
+
+        raw, presence = future.result()
+        if _sigmoid(presence) < POSE_PRESENCE_THRESHOLD:
+            self._roi = None
+            self._publish(None, timestamp_ms)
+            return
+
+        raw = raw[:NUM_LANDMARKS]
+        landmarks = np.empty((NUM_LANDMARKS, 4), dtype=np.float64)
+        crop_scale = size / INPUT_SIZE
+        landmarks[:, 0] = (x0 + raw[:, 0] * crop_scale) / width
+        landmarks[:, 1] = (y0 + raw[:, 1] * crop_scale) / height
+        landmarks[:, 2] = raw[:, 2] * crop_scale / width
+        landmarks[:, 3] = _sigmoid(raw[:, 3])
+
+        self._roi = self._landmark_roi(landmarks, width, height)
+        self._publish(landmarks, timestamp_ms)
+
+    @staticmethod
+    def _landmark_roi(landmarks, width, height):
+        visible = landmarks[landmarks[:, 3] >= VISIBILITY_THRESHOLD]
+        if len(visible) < 2:
+            return None
+        xs, ys = visible[:, 0] * width, visible[:, 1] * height
+        size = max(xs.max() - xs.min(), ys.max() - ys.min()) * ROI_SCALE
+        if size < INPUT_SIZE / 4:
+            return None
+        return ((xs.max() + xs.min()) / 2.0, (ys.max() + ys.min()) / 2.0, size)
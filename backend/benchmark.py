@@ -0,0 +1,147 @@
+"""Benchmarks for the video pipeline.
+
+    python benchmark.py backends clip1.mp4 clip2.mp4 --backends solutions tasks_video tasks_live_stream
+    python benchmark.py filter --frames 10000
+    python benchmark.py counter squats --frames 100000
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from landmark_filters import OneEuroFilter
+from pose_backends import create_pose_backend
+from processor import ExerciseProcessor
+from synthetic import expected_reps, generate_trace
+from vectorized import count_reps
+
+
+def load_clip(path, max_frames):
+    """Decode a clip into memory so decoding does not count against the backend"""
+    capture = cv2.VideoCapture(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    capture.release()
+    return frames, fps
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else float('nan')
+
+
+def run_backend(backend_name, frames, fps, realtime):
+    """Feed frames through one backend and measure per-frame latency and throughput"""
+    frame_interval = 1.0 / fps
+    submitted = {}
+    latencies = []
+
+    with create_pose_backend(backend_name) as pose:
+        start = time.perf_counter()
+        for index, image in enumerate(frames):
+            if realtime:
+                delay = start + index * frame_interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            timestamp_ms = int(index * frame_interval * 1000)
+            submitted[timestamp_ms] = time.perf_counter()
+            pose.submit(image, timestamp_ms)
+            for result in pose.poll():
+                latencies.append(time.perf_counter() - submitted[result.timestamp_ms])
+
+        # Drain results still in flight on asynchronous backends
+        deadline = time.perf_counter() + 2.0
+        while pose.asynchronous and len(latencies) < len(frames) and time.perf_counter() < deadline:
+            time.sleep(0.001)
+            for result in pose.poll():
+                latencies.append(time.perf_counter() - submitted[result.timestamp_ms])
+        elapsed = time.perf_counter() - start
+
+    return {
+        'backend': backend_name,
+        'frames': len(frames),
+        'results': len(latencies),
+        'dropped': len(frames) - len(latencies),
+        'fps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile_ms(latencies, 50),
+        'p95_ms': percentile_ms(latencies, 95),
+    }
+
+
+def benchmark_backends(args):
+    clips = [load_clip(path, args.max_frames) for path in args.clips]
+    print(f"{'backend':<20}{'clip':<30}{'frames':>8}{'dropped':>9}{'fps':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for backend_name in args.backends:
+        for path, (frames, fps) in zip(args.clips, clips):
+            stats = run_backend(backend_name, frames, fps, args.realtime)
+            print(f"{backend_name:<20}{path[-29:]:<30}{stats['frames']:>8}{stats['dropped']:>9}"
+                  f"{stats['fps']:>9.1f}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}")
+
+
+def benchmark_filter(args):
+    """Time one filter update over a (33, 4) landmark array"""
+    rng = np.random.default_rng(0)
+    frames = 0.5 + 0.01 * rng.standard_normal((args.frames, 33, 4))
+    landmark_filter = OneEuroFilter()
+    start = time.perf_counter()
+    for index, landmarks in enumerate(frames):
+        landmark_filter.update(landmarks, index / 30.0)
+    elapsed = time.perf_counter() - start
+    print(f"one_euro: {elapsed / args.frames * 1e6:.1f} us per frame over {args.frames} frames")
+
+
+def benchmark_counter(args):
+    """Compare per-frame ExerciseProcessor with the vectorized whole-trace counter"""
+    trace = generate_trace(args.exercise, reps=max(1, round(args.frames / 75)), fault_rate=0.2, seed=0)
+    timestamps, landmarks = trace.timestamps, trace.landmarks
+    frames = len(timestamps)
+
+    processor = ExerciseProcessor(args.exercise)
+    processor.reset_state(start_time=0.0)
+    start = time.perf_counter()
+    for timestamp, frame_landmarks in zip(timestamps.tolist(), landmarks):
+        processor.process_frame(None, frame_landmarks, timestamp)
+    per_frame = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stats = count_reps(landmarks, timestamps, args.exercise, start_time=0.0,
+                       exercise_module=processor.exercise_module)
+    vectorized = time.perf_counter() - start
+
+    matches = stats['rep_log'] == processor.rep_log
+    print(f"per-frame:  {frames / per_frame:>12.0f} frames/s")
+    print(f"vectorized: {frames / vectorized:>12.0f} frames/s ({per_frame / vectorized:.0f}x), "
+          f"{len(stats['rep_log'])} of {expected_reps(trace)} reps, {'matches' if matches else 'DIFFERS from'} per-frame")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backends = subparsers.add_parser('backends', help='Compare pose backends on the same recorded clips')
+    backends.add_argument('clips', nargs='+')
+    backends.add_argument('--backends', nargs='+', default=['solutions', 'tasks_video', 'tasks_live_stream'])
+    backends.add_argument('--max-frames', type=int, default=300)
+    backends.add_argument('--realtime', action='store_true', help='Pace submission at the clip frame rate')
+    backends.set_defaults(func=benchmark_backends)
+
+    landmark_filter = subparsers.add_parser('filter', help='Measure per-frame cost of landmark smoothing')
+    landmark_filter.add_argument('--frames', type=int, default=10000)
+    landmark_filter.set_defaults(func=benchmark_filter)
+
+    counter = subparsers.add_parser('counter', help='Per-frame vs vectorized rep counting throughput')
+    counter.add_argument('exercise')
+    counter.add_argument('--frames', type=int, default=100000)
+    counter.set_defaults(func=benchmark_counter)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
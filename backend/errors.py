@@ -0,0 +1,70 @@
+"""Structured, rate-limited accounting of per-frame processing errors.
+
+A broken exercise module or a malformed landmark array fails on every frame,
+so printing each failure turns one bug into 30 stderr writes per second per
+session. Errors are instead counted by exercise and exception type; at most
+one line per (exercise, type) is written every ``ERROR_LOG_INTERVAL`` seconds,
+carrying the stack trace of that sampled occurrence and how many similar
+errors were suppressed since the last line. Counts are exported through
+``/metrics`` and the last few sampled traces are kept for inspection.
+"""
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+LOG_INTERVAL = float(os.environ.get('ERROR_LOG_INTERVAL', 10.0))
+# Sampled stack traces kept per (exercise, exception type)
+SAMPLES_KEPT = 3
+
+
+class ErrorTracker:
+    """Counts errors by (exercise, exception type) and logs a sampled trace at most once per interval"""
+
+    def __init__(self, log_interval=LOG_INTERVAL, stream=None):
+        self.log_interval = log_interval
+        self.stream = stream
+        self.counts = Counter()
+        self.samples = {}
+        self._suppressed = Counter()
+        self._last_logged = {}
+        self._lock = threading.Lock()
+
+    def record(self, exercise_name, error):
+        key = (exercise_name, type(error).__name__)
+        now = time.monotonic()
+        with self._lock:
+            self.counts[key] += 1
+            last = self._last_logged.get(key)
+            if last is not None and now - last < self.log_interval:
+                self._suppressed[key] += 1
+                return
+            self._last_logged[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+
+        # Only sampled occurrences pay for formatting a traceback
+        trace = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+        with self._lock:
+            self.samples.setdefault(key, deque(maxlen=SAMPLES_KEPT)).append({'time': time.time(), 'trace': trace})
+        note = f" ({suppressed} similar errors suppressed)" if suppressed else ''
+        print(f"Error processing {exercise_name} frame: {key[1]}: {error}{note}\n{trace}",
+              file=self.stream or sys.stderr, end='')
+
+    def snapshot(self):
+        """{(exercise, exception type): count}"""
+        with self._lock:
+            return dict(self.counts)
+
+    def recent_samples(self):
+        with self._lock:
+            return [{'exercise': exercise_name, 'type': error_type, **sample}
+                    for (exercise_name, error_type), samples in self.samples.items() for sample in samples]
+
+
+error_tracker = ErrorTracker()
+
+
+def record_error(exercise_name, error):
+    error_tracker.record(exercise_name, error)
@@ -0,0 +1,145 @@
+"""In-process publish/subscribe of typed workout events.
+
+``/api/stats`` only exposes running totals, so a client that wants to react to
+a rep has to poll and diff them. The exercise processor instead reports what
+happened as events - a rep starting, a rep completing with its range of
+motion, duration and form codes, a form fault appearing - and the app adds
+session start and end. ``EventHub.publish`` hands each event to every
+subscriber: the ``/api/events`` Server-Sent Events stream, recorders or
+analytics sinks in the same process.
+
+Publishing never blocks the pipeline. Every subscriber has a bounded queue;
+when it is full the oldest event is dropped and counted, and as event ids are
+consecutive a client can tell from the ids that it missed some. The last
+``EVENT_HISTORY`` events are kept so a reconnecting SSE client resumes from
+its ``Last-Event-ID``.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+SESSION_STARTED = 'session_started'
+SESSION_ENDED = 'session_ended'
+REP_STARTED = 'rep_started'
+REP_COMPLETED = 'rep_completed'
+FORM_FAULT = 'form_fault'
+EVENT_TYPES = (SESSION_STARTED, SESSION_ENDED, REP_STARTED, REP_COMPLETED, FORM_FAULT)
+
+QUEUE_EVENTS = int(os.environ.get('EVENT_QUEUE', 256))
+HISTORY_EVENTS = int(os.environ.get('EVENT_HISTORY', 256))
+SSE_MIMETYPE = 'text/event-stream'
+# Sent every KEEPALIVE_INTERVAL seconds without events, so proxies keep idle streams open
+SSE_KEEPALIVE = b': keepalive\n\n'
+KEEPALIVE_INTERVAL = 15.0
+
+
+def form_code(message):
+    """Stable identifier for a feedback message, e.g. 'squat_deeper_for_full_range_of_motion'"""
+    return re.sub(r'[^a-z0-9]+', '_', message.lower()).strip('_')
+
+
+class Subscription:
+    """Bounded queue of the events one subscriber has not taken yet"""
+
+    def __init__(self, types=None, session_id=None, max_queue=QUEUE_EVENTS):
+        unknown = set(types or ()) - set(EVENT_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown event types {', '.join(sorted(unknown))}; "
+                             f"expected {', '.join(EVENT_TYPES)}")
+        self.types = set(types) if types else None
+        self.session_id = session_id
+        self.events = deque()
+        self.max_queue = max_queue
+        self.dropped = 0
+        # Called (from the publishing thread) after events are queued
+        self.listener = None
+
+    def wants(self, event):
+        return ((self.types is None or event['type'] in self.types)
+                and (self.session_id is None or event.get('session_id') == self.session_id))
+
+
+class EventHub:
+    """Fans published events out to subscriptions and keeps a short history for resuming"""
+
+    def __init__(self, history=HISTORY_EVENTS):
+        self.sequence = 0
+        self._history = deque(maxlen=history)
+        self._subscriptions = set()
+        self._condition = threading.Condition()
+
+    def publish(self, event_type, **fields):
+        """Publish an event of ``event_type`` carrying ``fields``; returns the event"""
+        listeners = []
+        with self._condition:
+            self.sequence += 1
+            event = {'id': self.sequence, 'type': event_type, 'time': time.time(), **fields}
+            self._history.append(event)
+            for subscription in self._subscriptions:
+                if not subscription.wants(event):
+                    continue
+                if len(subscription.events) >= subscription.max_queue:
+                    subscription.events.popleft()
+                    subscription.dropped += 1
+                subscription.events.append(event)
+                listeners.append(subscription.listener)
+            self._condition.notify_all()
+        for listener in listeners:
+            if listener:
+                listener()
+        return event
+
+    def subscribe(self, types=None, session_id=None, after=None, max_queue=QUEUE_EVENTS):
+        """New subscription, starting with the kept events newer than id ``after`` if given"""
+        subscription = Subscription(types, session_id, max_queue)
+        with self._condition:
+            if after is not None:
+                missed = [event for event in self._history if event['id'] > after and subscription.wants(event)]
+                subscription.events.extend(missed[-max_queue:])
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._condition:
+            self._subscriptions.discard(subscription)
+
+    def next_events(self, subscription, timeout=None):
+        """Block until ``subscription`` has events and take them; [] on timeout"""
+        with self._condition:
+            self._condition.wait_for(lambda: subscription.events, timeout)
+            return self.take_events(subscription)
+
+    def take_events(self, subscription):
+        with self._condition:
+            events = list(subscription.events)
+            subscription.events.clear()
+            return events
+
+    def stats(self):
+        with self._condition:
+            return {
+                'published': self.sequence,
+                'subscribers': len(self._subscriptions),
+                'dropped': sum(subscription.dropped for subscription in self._subscriptions),
+            }
+
+
+def subscription_options(types=None, session_id=None, last_event_id=None):
+    """``subscribe()`` arguments from the SSE endpoint's query parameters and ``Last-Event-ID`` header"""
+    try:
+        after = int(last_event_id) if last_event_id else None
+    except ValueError:
+        raise ValueError('Last-Event-ID must be an event id')
+    return {'types': [name for name in types.split(',') if name] if types else None,
+            'session_id': session_id or None, 'after': after}
+
+
+def format_sse(event):
+    """One Server-Sent Events message; the event type is its SSE event name"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+event_hub = EventHub()
@@ -6,6 +6,8 @@ import mediapipe as mp
 import numpy as np
 import time
 
+REQUIRED_LANDMARKS = ['LEFT_SHOULDER', 'LEFT_ELBOW', 'LEFT_WRIST', 'LEFT_HIP']
+
 # --- Helper Functions ---
 def calculate_angle(a, b, c):
     a, b, c = np.array(a), np.array(b), np.array(c)
@@ -6,6 +6,8 @@ import mediapipe as mp
 import numpy as np
 import time
 
+REQUIRED_LANDMARKS = ['LEFT_SHOULDER', 'LEFT_HIP', 'LEFT_KNEE']
+
 # --- Helper Functions (Specific to Glute Bridges) ---
 
 def calculate_angle(a, b, c):
@@ -0,0 +1,199 @@
+"""Frame sources: cameras, video files, network streams, image directories and synthetic workouts.
+
+Every source runs a reader thread that pulls frames as fast as the source
+delivers them and keeps only the newest one, stamped with its capture time.
+Consumers always get the freshest frame, so when inference is slower than the
+camera, frames are skipped instead of queueing up in the driver buffer and
+latency stays bounded by one processing step.
+
+Sources are opened from a spec string (``VIDEO_SOURCE`` or the ``source`` of
+``/api/start_exercise``):
+
+- ``0``, ``1``, ... - camera device index
+- ``rtsp://...``, ``http(s)://...`` - network stream, reopened if it drops
+- a video file path - played back at its own frame rate
+- a directory - its images in name order, at 30 fps
+- ``synthetic[:options]`` - generated workout, see ``synthetic.py``
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+import tracing
+from synthetic import SyntheticCapture, parse_synthetic_options
+
+# image: BGR array; timestamp: time.monotonic() when the frame was read; index: sequence number
+Frame = namedtuple('Frame', ['image', 'timestamp', 'index'])
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+DEFAULT_FPS = 30.0
+RECONNECT_DELAY = 1.0
+
+
+class ImageDirectoryCapture:
+    """``cv2.VideoCapture``-like reader over the images of a directory, in name order"""
+
+    def __init__(self, directory, fps=DEFAULT_FPS):
+        self.paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.fps = fps
+        self.position = 0
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self):
+        if self.position >= len(self.paths):
+            return False, None
+        image = cv2.imread(self.paths[self.position])
+        self.position += 1
+        return image is not None, image
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+            return True
+        return False
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FPS: self.fps, cv2.CAP_PROP_FRAME_COUNT: len(self.paths)}.get(prop, 0.0)
+
+    def release(self):
+        self.paths = []
+
+
+class FrameSource:
+    """Latest-frame reader thread over a capture object (anything with read/isOpened/release)
+
+    ``open_capture`` returns a new capture; it is called again on the reader
+    thread when reconnecting.
+    ``pace_fps`` throttles reads to that rate, for sources that would otherwise
+    deliver frames as fast as they can be decoded (files, directories).
+    ``reconnect`` reopens a live stream that stops delivering; ``loop`` restarts
+    a file or directory at its end.
+    """
+
+    def __init__(self, open_capture, name, pace_fps=None, reconnect=False, loop=False):
+        self.name = name
+        self.pace_fps = pace_fps
+        self.reconnect = reconnect
+        self.loop = loop
+        self.frames_read = 0
+        self.dropped = 0
+        self._open_capture = open_capture
+        self._latest = None
+        self._last_returned = -1
+        self._running = True
+        self._condition = threading.Condition()
+
+        # Open the first capture here so a bad source fails start_exercise, not the stream
+        self._capture = open_capture()
+        if not self._capture.isOpened():
+            self._capture.release()
+            raise ValueError(f"Could not open video source {name}")
+        self._thread = threading.Thread(target=self._read_loop, name=f'frame-source-{name}', daemon=True)
+        self._thread.start()
+
+    def _read_loop(self):
+        capture = self._capture
+        next_time = time.monotonic()
+        try:
+            while self._running:
+                read_start = time.perf_counter()
+                ret, image = capture.read()
+                if tracing.enabled:
+                    tracing.record('source_read', read_start, time.perf_counter() - read_start,
+                                   self.frames_read, category='source', source=self.name)
+                if not ret:
+                    if self.loop and capture.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                        continue
+                    if not self.reconnect:
+                        break
+                    capture.release()
+                    time.sleep(RECONNECT_DELAY)
+                    capture = self._capture = self._open_capture()
+                    continue
+
+                if self.pace_fps:
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        # Fell behind (e.g. a slow disk); do not try to catch up in a burst
+                        next_time = time.monotonic()
+                    next_time += 1.0 / self.pace_fps
+
+                with self._condition:
+                    if self._latest is not None and self._latest.index > self._last_returned:
+                        self.dropped += 1
+                    self._latest = Frame(image, time.monotonic(), self.frames_read)
+                    self.frames_read += 1
+                    self._condition.notify_all()
+        finally:
+            capture.release()
+            with self._condition:
+                self._running = False
+                self._condition.notify_all()
+
+    def read(self, after=None, timeout=None):
+        """Newest frame with an index above ``after`` (default: the last one returned)
+
+        Blocks until such a frame arrives; returns None once the source has
+        ended or been closed, or on timeout.
+        """
+        with self._condition:
+            after = self._last_returned if after is None else after
+            ready = self._condition.wait_for(
+                lambda: not self._running or (self._latest is not None and self._latest.index > after), timeout)
+            if not ready or not self._running:
+                return None
+            self._last_returned = max(self._last_returned, self._latest.index)
+            return self._latest
+
+    def isOpened(self):
+        return self._running
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _device_capture(index):
+    capture = cv2.VideoCapture(index)
+    # Keep the driver from queueing stale frames behind the one we are about to read
+    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return capture
+
+
+def open_frame_source(spec, exercise_name=None, loop=False):
+    """Open a ``FrameSource`` from a source spec string (see module docstring)"""
+    spec = str(spec).strip()
+    if spec.isdigit():
+        return FrameSource(lambda: _device_capture(int(spec)), f'camera {spec}')
+    if spec.startswith('synthetic'):
+        options = parse_synthetic_options(spec)
+        exercise_name = options.pop('exercise', exercise_name)
+        # SyntheticCapture paces itself like a camera
+        return FrameSource(lambda: SyntheticCapture(exercise_name, **options), spec)
+    if '://' in spec:
+        return FrameSource(lambda: cv2.VideoCapture(spec), spec, reconnect=True)
+    if os.path.isdir(spec):
+        return FrameSource(lambda: ImageDirectoryCapture(spec), spec, pace_fps=DEFAULT_FPS, loop=loop)
+    if os.path.isfile(spec):
+        capture = cv2.VideoCapture(spec)
+        fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        capture.release()
+        return FrameSource(lambda: cv2.VideoCapture(spec), spec, pace_fps=fps, loop=loop)
+    raise ValueError(f"Unknown video source {spec}")
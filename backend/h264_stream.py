@@ -0,0 +1,327 @@
+"""H.264 live video in fragmented MP4, encoded by an ffmpeg/libx264 subprocess.
+
+MJPEG sends every frame as an independent picture; an inter-frame codec needs
+roughly a fifth to a tenth of the bandwidth at the same quality. An
+``H264Stream`` listens to a session's ``FrameBroadcast``, pipes each annotated
+frame into ``ffmpeg`` (``-tune zerolatency``, no B-frames, one fragment per
+frame) and splits its output into the MP4 init segment and per-frame
+``moof``/``mdat`` fragments, which browsers play through Media Source
+Extensions in a ``<video>`` element.
+
+One encoder runs per session, started by its first viewer and stopped when
+the last one leaves. Frames reach the encoder through a latest-frame slot
+drained by a writer thread, so a busy encoder drops frames instead of slowing
+the pipeline. Every viewer has a bounded queue; a viewer that falls more than
+``MAX_QUEUED_FRAGMENTS`` behind is cut back and resumes at the next keyframe,
+since fragments after a gap cannot be decoded without one.
+
+Requires the ``ffmpeg`` binary (``FFMPEG_BINARY``) with libx264.
+"""
+import functools
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import weakref
+from collections import deque
+
+FFMPEG = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+MIMETYPE = 'video/mp4'
+BITRATE = os.environ.get('H264_BITRATE', '1000k')
+# Frames between keyframes; new and resynchronized viewers wait up to this long for a picture
+GOP = 30
+MAX_QUEUED_FRAGMENTS = 60
+# trun/tfhd sample flag marking a frame that depends on others
+SAMPLE_IS_NON_SYNC = 0x10000
+
+
+def _boxes(data, offset=0, end=None):
+    """(type, payload start, box end) of the MP4 boxes in data[offset:end]"""
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def is_keyframe(moof):
+    """Whether the first sample of a ``moof`` box (whole box, header included) is a sync sample"""
+    for kind, start, end in _boxes(moof):
+        if kind != b'moof':
+            continue
+        for traf_kind, traf_start, traf_end in _boxes(moof, start, end):
+            if traf_kind != b'traf':
+                continue
+            default_flags = None
+            for child, child_start, _ in _boxes(moof, traf_start, traf_end):
+                flags = struct.unpack_from('>I', moof, child_start)[0] & 0xFFFFFF
+                if child == b'tfhd' and flags & 0x20:
+                    position = child_start + 8
+                    position += 8 if flags & 0x1 else 0
+                    position += 4 * bool(flags & 0x2) + 4 * bool(flags & 0x8) + 4 * bool(flags & 0x10)
+                    default_flags = struct.unpack_from('>I', moof, position)[0]
+                elif child == b'trun':
+                    position = child_start + 8 + (4 if flags & 0x1 else 0)
+                    if flags & 0x4:
+                        sample_flags = struct.unpack_from('>I', moof, position)[0]
+                    elif flags & 0x400:
+                        position += 4 * bool(flags & 0x100) + 4 * bool(flags & 0x200)
+                        sample_flags = struct.unpack_from('>I', moof, position)[0]
+                    else:
+                        sample_flags = default_flags or 0
+                    return not sample_flags & SAMPLE_IS_NON_SYNC
+    return False
+
+
+class H264Viewer:
+    """Queue of MP4 bytes for one client, starting with the init segment and a keyframe"""
+
+    def __init__(self):
+        self.chunks = deque()
+        self.synced = False
+        self.initialized = False
+        self.fragments_dropped = 0
+        # Called (from the encoder's reader thread) when chunks arrive or the stream ends
+        self.listener = None
+
+
+class H264Stream:
+    """One libx264 encoder fed from a session's broadcast, shared by that session's H.264 viewers"""
+
+    def __init__(self, broadcast, gop=GOP, bitrate=BITRATE):
+        self.broadcast = broadcast
+        self.gop = gop
+        self.bitrate = bitrate
+        self.init_segment = None
+        self.closed = False
+        self.viewers = set()
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self._process = None
+        self._failed = False
+        self._size = None
+        self._pending = None
+        self._condition = threading.Condition()
+        broadcast.add_listener(self._on_publish)
+
+    def _command(self, width, height):
+        return [
+            FFMPEG, '-loglevel', 'error',
+            # Timestamps from arrival time, so frames the writer skipped do not speed up playback
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}',
+            '-use_wallclock_as_timestamps', '1', '-i', 'pipe:0',
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'zerolatency', '-profile:v', 'baseline',
+            '-pix_fmt', 'yuv420p', '-g', str(self.gop), '-keyint_min', str(self.gop), '-sc_threshold', '0',
+            '-bf', '0', '-crf', '23', '-maxrate', self.bitrate, '-bufsize', self.bitrate,
+            '-fps_mode', 'passthrough',
+            '-f', 'mp4', '-movflags', 'empty_moov+default_base_moof+frag_every_frame', 'pipe:1',
+        ]
+
+    def _on_publish(self):
+        # Runs on the pipeline thread: hand over the frame and return
+        if self.broadcast.closed:
+            self.close()
+            return
+        frame = self.broadcast.latest
+        if frame is None:
+            return
+        with self._condition:
+            if self.closed:
+                return
+            if self._pending is not None:
+                self.frames_dropped += 1
+            self._pending = frame.image
+            if self._process is None and not self._failed:
+                self._start(frame.image.shape[1], frame.image.shape[0])
+            self._condition.notify_all()
+        if self._failed:
+            self.close()
+
+    def _start(self, width, height):
+        self._size = (height, width)
+        try:
+            # stderr is inherited, so ffmpeg's own errors (-loglevel error) reach the server log
+            self._process = subprocess.Popen(self._command(width, height), stdin=subprocess.PIPE,
+                                             stdout=subprocess.PIPE)
+        except OSError as e:
+            print(f"Could not start {FFMPEG}: {e}", file=sys.stderr)
+            self._failed = True
+            return
+        threading.Thread(target=self._write_loop, name='h264-writer', daemon=True).start()
+        threading.Thread(target=self._read_loop, name='h264-reader', daemon=True).start()
+
+    def _write_loop(self):
+        process = self._process
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self.closed or self._pending is not None)
+                    if self.closed:
+                        break
+                    image, self._pending = self._pending, None
+                if image.shape[:2] != self._size:
+                    continue
+                process.stdin.write(image.tobytes())
+                self.frames_written += 1
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except (BrokenPipeError, ValueError):
+                pass
+
+    def _read_exactly(self, stdout, size):
+        data = stdout.read(size)
+        return data if data is not None and len(data) == size else None
+
+    def _read_loop(self):
+        stdout = self._process.stdout
+        init_parts = []
+        moof = None
+        while True:
+            header = self._read_exactly(stdout, 8)
+            if header is None:
+                break
+            size, kind = struct.unpack('>I4s', header)
+            if size == 1:
+                extended = self._read_exactly(stdout, 8)
+                if extended is None:
+                    break
+                header += extended
+                size = struct.unpack('>Q', extended)[0]
+            payload = self._read_exactly(stdout, size - len(header))
+            if payload is None:
+                break
+            box = header + payload
+
+            if kind == b'moof':
+                moof = box
+            elif kind == b'mdat' and moof is not None:
+                self._publish_fragment(moof + box, is_keyframe(moof))
+                moof = None
+            elif self.init_segment is None:
+                init_parts.append(box)
+                if kind == b'moov':
+                    with self._condition:
+                        self.init_segment = b''.join(init_parts)
+        self.close()
+        self._process.wait()
+
+    def _publish_fragment(self, fragment, keyframe):
+        listeners = []
+        with self._condition:
+            for viewer in self.viewers:
+                if len(viewer.chunks) >= MAX_QUEUED_FRAGMENTS:
+                    # Too far behind to catch up frame by frame; resume at the next keyframe
+                    viewer.fragments_dropped += len(viewer.chunks)
+                    viewer.chunks.clear()
+                    viewer.synced = False
+                if not viewer.synced:
+                    if not keyframe:
+                        continue
+                    if not viewer.initialized:
+                        viewer.chunks.append(self.init_segment)
+                        viewer.initialized = True
+                    viewer.synced = True
+                viewer.chunks.append(fragment)
+                listeners.append(viewer.listener)
+            self._condition.notify_all()
+        for listener in listeners:
+            if listener:
+                listener()
+
+    def remove_viewer(self, viewer):
+        """Detach ``viewer``; the encoder stops with the last one"""
+        with _streams_lock:
+            with self._condition:
+                self.viewers.discard(viewer)
+                idle = not self.viewers
+            if idle and _streams.get(self.broadcast) is self:
+                del _streams[self.broadcast]
+        if idle:
+            self.close()
+
+    def next_chunks(self, viewer, timeout=None):
+        """Block until ``viewer`` has data and return it; None once the stream is closed"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.closed or viewer.chunks, timeout)
+            return self.take_chunks(viewer)
+
+    def take_chunks(self, viewer):
+        """Everything queued for ``viewer`` ([] if nothing yet), or None once the stream is closed"""
+        with self._condition:
+            if self.closed and not viewer.chunks:
+                return None
+            chunks = list(viewer.chunks)
+            viewer.chunks.clear()
+            return chunks
+
+    def close(self):
+        with self._condition:
+            if self.closed:
+                return
+            self.closed = True
+            self._condition.notify_all()
+            listeners = [viewer.listener for viewer in self.viewers if viewer.listener]
+        # The writer closes ffmpeg's stdin and the reader reaps it once its output ends
+        self.broadcast.remove_listener(self._on_publish)
+        with _streams_lock:
+            if _streams.get(self.broadcast) is self:
+                del _streams[self.broadcast]
+        for listener in listeners:
+            listener()
+
+    def stats(self):
+        # Viewers come and go on other threads; snapshot them under the same lock
+        with self._condition:
+            return {
+                'viewers': len(self.viewers),
+                'frames_written': self.frames_written,
+                'frames_dropped': self.frames_dropped,
+                'fragments_dropped': sum(viewer.fragments_dropped for viewer in self.viewers),
+            }
+
+
+_streams = weakref.WeakKeyDictionary()
+_streams_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def available():
+    """Whether the ffmpeg binary exists and has the libx264 encoder; checked once per process"""
+    if shutil.which(FFMPEG) is None:
+        return False
+    try:
+        encoders = subprocess.run([FFMPEG, '-hide_banner', '-encoders'], capture_output=True,
+                                  text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return any(line.split()[1:2] == ['libx264'] for line in encoders.splitlines())
+
+
+def current(broadcast):
+    """The running H.264 stream of a broadcast, or None"""
+    with _streams_lock:
+        return _streams.get(broadcast)
+
+
+def add_viewer(broadcast):
+    """(stream, viewer) for a new H.264 client of a broadcast, starting its encoder if needed"""
+    with _streams_lock:
+        stream = _streams.get(broadcast)
+        if stream is None or stream.closed:
+            stream = _streams[broadcast] = H264Stream(broadcast)
+        viewer = H264Viewer()
+        with stream._condition:
+            stream.viewers.add(viewer)
+        return stream, viewer
@@ -0,0 +1,135 @@
+"""Temporal filters applied to whole (33, 4) landmark arrays.
+
+Each filter keeps per-session state and updates every joint in a handful of
+vectorized numpy operations per frame. Smoothing factors are derived from the
+real time between frames, so behaviour does not change with the frame rate.
+"""
+import math
+import os
+
+import numpy as np
+
+# Gaps longer than this (e.g. the person left the frame) restart the filter
+MAX_GAP_SECONDS = 0.5
+
+
+class OneEuroFilter:
+    """One Euro filter (Casiez et al. 2012) over a landmark array
+
+    Cuts jitter strongly while a joint is still and lets it through with little
+    lag while it moves: the cutoff frequency rises with the filtered speed.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=10.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self._value = None
+        self._derivative = None
+        self._timestamp = None
+
+    def update(self, landmarks, timestamp):
+        """Filter one frame; ``timestamp`` is in seconds. Returns a new array."""
+        if landmarks is None:
+            self.reset()
+            return None
+
+        if self._value is None or not 0 < timestamp - self._timestamp <= MAX_GAP_SECONDS:
+            self._value = np.array(landmarks, dtype=np.float64)
+            self._derivative = np.zeros_like(self._value)
+            self._timestamp = timestamp
+            return self._value.copy()
+
+        dt = timestamp - self._timestamp
+        self._timestamp = timestamp
+
+        # alpha = 1 / (1 + tau / dt) with tau = 1 / (2 * pi * cutoff)
+        alpha_d = 1.0 / (1.0 + 1.0 / (2 * math.pi * self.d_cutoff * dt))
+        derivative = (landmarks - self._value) / dt
+        self._derivative += alpha_d * (derivative - self._derivative)
+
+        cutoff = self.min_cutoff + self.beta * np.abs(self._derivative)
+        alpha = 1.0 / (1.0 + 1.0 / (2 * math.pi * dt * cutoff))
+        self._value += alpha * (landmarks - self._value)
+        return self._value.copy()
+
+
+class LandmarkPredictor:
+    """Constant-velocity Kalman filter that extrapolates landmarks for display
+
+    Each x, y, z coordinate is an independent (position, velocity) state, so the
+    2x2 covariances are held as three element-wise arrays. ``update`` corrects the
+    state with a measured frame; ``predict`` extrapolates to a later timestamp
+    without touching the state. Visibility is carried over from the last
+    measurement.
+    """
+
+    def __init__(self, process_noise=50.0, measurement_noise=1e-4, max_horizon=0.25):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.max_horizon = max_horizon
+        self.reset()
+
+    def reset(self):
+        self._position = None
+        self._timestamp = None
+
+    def _propagate(self, dt):
+        q = self.process_noise
+        position = self._position + self._velocity * dt
+        p00 = self._p00 + dt * (2 * self._p01 + dt * self._p11) + q * dt ** 3 / 3
+        p01 = self._p01 + dt * self._p11 + q * dt ** 2 / 2
+        p11 = self._p11 + q * dt
+        return position, p00, p01, p11
+
+    def update(self, landmarks, timestamp):
+        """Correct the state with measured landmarks taken at ``timestamp`` seconds"""
+        if landmarks is None:
+            self.reset()
+            return
+
+        measured = landmarks[:, :3]
+        if self._position is None or not 0 < timestamp - self._timestamp <= MAX_GAP_SECONDS:
+            self._position = np.array(measured, dtype=np.float64)
+            self._velocity = np.zeros_like(self._position)
+            self._p00 = np.full_like(self._position, self.measurement_noise)
+            self._p01 = np.zeros_like(self._position)
+            self._p11 = np.full_like(self._position, 1.0)
+        else:
+            position, p00, p01, p11 = self._propagate(timestamp - self._timestamp)
+            gain_position = p00 / (p00 + self.measurement_noise)
+            gain_velocity = p01 / (p00 + self.measurement_noise)
+            residual = measured - position
+            self._position = position + gain_position * residual
+            self._velocity += gain_velocity * residual
+            self._p11 = p11 - gain_velocity * p01
+            self._p01 = (1 - gain_position) * p01
+            self._p00 = (1 - gain_position) * p00
+        self._visibility = landmarks[:, 3].copy()
+        self._timestamp = timestamp
+
+    def predict(self, timestamp):
+        """Extrapolated (33, 4) landmarks at ``timestamp`` seconds, or None before the first update"""
+        if self._position is None:
+            return None
+        dt = min(max(timestamp - self._timestamp, 0.0), self.max_horizon)
+        predicted = np.empty((len(self._position), 4))
+        predicted[:, :3] = self._position + self._velocity * dt
+        predicted[:, 3] = self._visibility
+        return predicted
+
+
+def create_landmark_filter():
+    """Build the smoothing filter configured for this deployment, or None"""
+    name = os.environ.get('LANDMARK_FILTER', 'one_euro')
+    if name == 'none':
+        return None
+    elif name == 'one_euro':
+        return OneEuroFilter(
+            min_cutoff=float(os.environ.get('LANDMARK_FILTER_MIN_CUTOFF', 1.0)),
+            beta=float(os.environ.get('LANDMARK_FILTER_BETA', 10.0)),
+        )
+    raise ValueError(f"Unknown landmark filter {name}")
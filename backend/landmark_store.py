@@ -0,0 +1,221 @@
+"""Compact columnar on-disk format for per-frame landmark streams.
+
+Layout of a ``.lmk`` file::
+
+    header   64 bytes: magic, version, index offset, index length
+    chunk 0  timestamps float64[n] | landmarks int16[n, 33, 4] | stage uint8[n] | feedback uint32[n]
+    chunk 1  ...
+    index    JSON: exercise, metadata, feedback vocabulary, and per-chunk offset/frames/time range
+
+Landmarks are quantized to int16 at 1/8192 (range +-4, well below a pixel at
+1080p); frames without a pose store ``MISSING`` in the visibility column. Stage
+is a code into ``STAGES`` and feedback is a bitmask into the file's feedback
+vocabulary. Every column of every chunk is 8-byte aligned, so readers map them
+straight out of a single ``numpy.memmap`` without copying, and the index lets a
+time-range read touch only the chunks it needs.
+"""
+import contextlib
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from landmarks import NUM_LANDMARKS
+
+MAGIC = b'LMKREC\x00\x01'
+VERSION = 1
+HEADER = struct.Struct('<8sIQQ')
+HEADER_SIZE = 64
+
+SCALE = 8192.0
+MISSING = np.iinfo(np.int16).min
+STAGES = (None, 'up', 'down')
+STAGE_CODES = {stage: code for code, stage in enumerate(STAGES)}
+MAX_FEEDBACK_MESSAGES = 32
+# Shares the last code with every message seen after the vocabulary filled up
+OTHER_FEEDBACK = 'Other feedback'
+DEFAULT_CHUNK_FRAMES = 1024
+
+
+def _aligned(size):
+    return (size + 7) & ~7
+
+
+def _column_layout(frames):
+    """Byte offsets of each column inside a chunk of ``frames`` frames, plus the chunk size"""
+    layout = {}
+    offset = 0
+    for name, dtype, shape in (('timestamps', np.float64, ()),
+                               ('landmarks', np.int16, (NUM_LANDMARKS, 4)),
+                               ('stage', np.uint8, ()),
+                               ('feedback', np.uint32, ())):
+        layout[name] = (offset, dtype, (frames,) + shape)
+        offset += _aligned(int(np.prod((frames,) + shape)) * np.dtype(dtype).itemsize)
+    return layout, offset
+
+
+def quantize(landmarks):
+    """(33, 4) float landmarks, or None, to int16"""
+    if landmarks is None:
+        quantized = np.zeros((NUM_LANDMARKS, 4), dtype=np.int16)
+        quantized[:, 3] = MISSING
+        return quantized
+    return np.clip(np.rint(landmarks * SCALE), MISSING + 1, np.iinfo(np.int16).max).astype(np.int16)
+
+
+def dequantize(quantized):
+    """int16 landmarks of shape (..., 33, 4) back to float64; missing frames get visibility 0"""
+    landmarks = quantized.astype(np.float64) * (1.0 / SCALE)
+    landmarks[..., 3][quantized[..., 3] == MISSING] = 0.0
+    return landmarks
+
+
+def is_missing(quantized):
+    """Boolean mask of frames that had no pose, for int16 landmarks of shape (..., 33, 4)"""
+    return quantized[..., 0, 3] == MISSING
+
+
+class LandmarkRecorder:
+    """Appends frames to a ``.lmk`` file, one column-major chunk at a time"""
+
+    def __init__(self, path, exercise_name, metadata=None, chunk_frames=DEFAULT_CHUNK_FRAMES):
+        self.path = path
+        self.exercise_name = exercise_name
+        self.metadata = metadata or {}
+        self.chunk_frames = chunk_frames
+        self.frames = 0
+        self._feedback_codes = {}
+        self._chunks = []
+        self._buffer = {name: np.zeros(shape, dtype) for name, (_, dtype, shape)
+                        in _column_layout(chunk_frames)[0].items()}
+        self._buffered = 0
+        self._file = open(path, 'wb')
+        self._file.write(b'\0' * HEADER_SIZE)
+
+    def append(self, timestamp, landmarks, stage, feedback):
+        """Record one frame: capture time in seconds, (33, 4) landmarks or None, stage, feedback list"""
+        i = self._buffered
+        self._buffer['timestamps'][i] = timestamp
+        self._buffer['landmarks'][i] = quantize(landmarks)
+        self._buffer['stage'][i] = STAGE_CODES[stage]
+        self._buffer['feedback'][i] = self._encode_feedback(feedback)
+        self._buffered += 1
+        self.frames += 1
+        if self._buffered == self.chunk_frames:
+            self._flush()
+
+    def _encode_feedback(self, feedback):
+        mask = 0
+        for message in feedback:
+            code = self._feedback_codes.get(message)
+            if code is None:
+                # Recording runs inside the live pipeline, so an unexpected message must not raise
+                if len(self._feedback_codes) >= MAX_FEEDBACK_MESSAGES - 1:
+                    code = self._feedback_codes.setdefault(OTHER_FEEDBACK, MAX_FEEDBACK_MESSAGES - 1)
+                else:
+                    code = self._feedback_codes[message] = len(self._feedback_codes)
+            mask |= 1 << code
+        return mask
+
+    def _flush(self):
+        frames = self._buffered
+        if not frames:
+            return
+        layout, size = _column_layout(frames)
+        offset = self._file.tell()
+        for name, (column_offset, _, _) in layout.items():
+            self._file.seek(offset + column_offset)
+            self._file.write(self._buffer[name][:frames].tobytes())
+        self._file.seek(offset + size)
+        self._file.truncate()
+        timestamps = self._buffer['timestamps']
+        self._chunks.append({'offset': offset, 'frames': frames,
+                             'start': float(timestamps[0]), 'end': float(timestamps[frames - 1])})
+        self._buffered = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._flush()
+        index = json.dumps({
+            'exercise': self.exercise_name,
+            'metadata': self.metadata,
+            'feedback': sorted(self._feedback_codes, key=self._feedback_codes.get),
+            'chunks': self._chunks,
+        }).encode()
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, index_offset, len(index)))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LandmarkRecording:
+    """Memory-mapped reader for ``.lmk`` files; column arrays are views into the file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, index_offset, index_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a landmark recording")
+            if version != VERSION:
+                raise ValueError(f"Unsupported landmark recording version {version}")
+            f.seek(index_offset)
+            index = json.loads(f.read(index_length))
+
+        self.exercise_name = index['exercise']
+        self.metadata = index['metadata']
+        self.feedback_vocabulary = index['feedback']
+        self.chunks = index['chunks']
+        self.frame_count = sum(chunk['frames'] for chunk in self.chunks)
+        self._map = np.memmap(path, dtype=np.uint8, mode='r') if self.chunks else None
+
+    def _chunk_columns(self, chunk):
+        layout, _ = _column_layout(chunk['frames'])
+        return {name: np.ndarray(shape, dtype, buffer=self._map, offset=chunk['offset'] + column_offset)
+                for name, (column_offset, dtype, shape) in layout.items()}
+
+    def iter_chunks(self, start=None, end=None):
+        """Yield zero-copy column dicts for frames with ``start <= timestamp <= end``, chunk by chunk"""
+        for chunk in self.chunks:
+            if (start is not None and chunk['end'] < start) or (end is not None and chunk['start'] > end):
+                continue
+            columns = self._chunk_columns(chunk)
+            timestamps = columns['timestamps']
+            first = 0 if start is None else int(np.searchsorted(timestamps, start, 'left'))
+            last = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, 'right'))
+            if first < last:
+                yield {name: column[first:last] for name, column in columns.items()}
+
+    def read(self, start=None, end=None):
+        """All columns for a time range; zero-copy when the range lies within one chunk"""
+        chunks = list(self.iter_chunks(start, end))
+        if len(chunks) == 1:
+            return chunks[0]
+        layout, _ = _column_layout(0)
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) if chunks
+                else np.zeros(shape, dtype) for name, (_, dtype, shape) in layout.items()}
+
+    def decode_feedback(self, mask):
+        """Feedback messages for one frame's bitmask"""
+        return [message for code, message in enumerate(self.feedback_vocabulary) if mask >> code & 1]
+
+
+def create_session_recorder(exercise_name, session_id, directory=None, metadata=None):
+    """Recorder for a session when RECORD_LANDMARKS_DIR is set; otherwise a context yielding None"""
+    directory = directory or os.environ.get('RECORD_LANDMARKS_DIR')
+    if not directory:
+        return contextlib.nullcontext()
+    os.makedirs(directory, exist_ok=True)
+    # The session id keeps sessions started in the same second apart
+    path = os.path.join(directory, f"{exercise_name}-{time.strftime('%Y%m%d-%H%M%S')}-{session_id}.lmk")
+    return LandmarkRecorder(path, exercise_name, metadata)
@@ -0,0 +1,103 @@
+"""Helpers for working with pose landmarks as (33, 4) numpy arrays.
+
+Columns are x, y, z, visibility in MediaPipe's normalized image coordinates.
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Same order as mp.solutions.pose.PoseLandmark, kept here so the per-frame path
+# does not need to touch mediapipe
+LANDMARK_NAMES = (
+    'NOSE', 'LEFT_EYE_INNER', 'LEFT_EYE', 'LEFT_EYE_OUTER', 'RIGHT_EYE_INNER', 'RIGHT_EYE',
+    'RIGHT_EYE_OUTER', 'LEFT_EAR', 'RIGHT_EAR', 'MOUTH_LEFT', 'MOUTH_RIGHT', 'LEFT_SHOULDER',
+    'RIGHT_SHOULDER', 'LEFT_ELBOW', 'RIGHT_ELBOW', 'LEFT_WRIST', 'RIGHT_WRIST', 'LEFT_PINKY',
+    'RIGHT_PINKY', 'LEFT_INDEX', 'RIGHT_INDEX', 'LEFT_THUMB', 'RIGHT_THUMB', 'LEFT_HIP', 'RIGHT_HIP',
+    'LEFT_KNEE', 'RIGHT_KNEE', 'LEFT_ANKLE', 'RIGHT_ANKLE', 'LEFT_HEEL', 'RIGHT_HEEL',
+    'LEFT_FOOT_INDEX', 'RIGHT_FOOT_INDEX',
+)
+NUM_LANDMARKS = len(LANDMARK_NAMES)
+LANDMARK_INDEX = {name: index for index, name in enumerate(LANDMARK_NAMES)}
+
+NOSE = LANDMARK_INDEX['NOSE']
+LEFT_SHOULDER = LANDMARK_INDEX['LEFT_SHOULDER']
+LEFT_ELBOW = LANDMARK_INDEX['LEFT_ELBOW']
+LEFT_WRIST = LANDMARK_INDEX['LEFT_WRIST']
+LEFT_HIP = LANDMARK_INDEX['LEFT_HIP']
+LEFT_KNEE = LANDMARK_INDEX['LEFT_KNEE']
+LEFT_ANKLE = LANDMARK_INDEX['LEFT_ANKLE']
+RIGHT_HIP = LANDMARK_INDEX['RIGHT_HIP']
+RIGHT_KNEE = LANDMARK_INDEX['RIGHT_KNEE']
+RIGHT_ANKLE = LANDMARK_INDEX['RIGHT_ANKLE']
+
+
+def _mirror_name(name):
+    if 'LEFT' in name:
+        return name.replace('LEFT', 'RIGHT')
+    if 'RIGHT' in name:
+        return name.replace('RIGHT', 'LEFT')
+    return name
+
+
+# MIRRORED_INDEX[i] is the same joint on the other side of the body
+MIRRORED_INDEX = np.array([LANDMARK_INDEX[_mirror_name(name)] for name in LANDMARK_NAMES])
+
+Landmark = namedtuple('Landmark', ['x', 'y', 'z', 'visibility'])
+
+# Same topology as mp.solutions.pose.POSE_CONNECTIONS
+POSE_CONNECTIONS = (
+    (0, 1), (1, 2), (2, 3), (3, 7), (0, 4), (4, 5), (5, 6), (6, 8), (9, 10),
+    (11, 12), (11, 13), (13, 15), (15, 17), (15, 19), (15, 21), (17, 19),
+    (12, 14), (14, 16), (16, 18), (16, 20), (16, 22), (18, 20), (11, 23),
+    (12, 24), (23, 24), (23, 25), (24, 26), (25, 27), (26, 28), (27, 29),
+    (28, 30), (29, 31), (30, 32), (27, 31), (28, 32),
+)
+
+VISIBILITY_THRESHOLD = 0.5
+
+
+class LandmarkList:
+    """Read-only view that lets exercise modules index an array like a landmark proto
+
+    With ``mirrored`` set, LEFT_* indices read the RIGHT_* rows and vice versa, so
+    logic written against the left side can follow whichever side is visible.
+    Only the rows that are actually indexed get converted.
+    """
+
+    def __init__(self, array, mirrored=False):
+        self.array = array
+        self.mirrored = mirrored
+
+    def __getitem__(self, index):
+        if self.mirrored:
+            index = MIRRORED_INDEX[index]
+        return Landmark(*self.array[index].tolist())
+
+    def xy(self, index):
+        """[x, y] of one landmark, as the angle helpers expect"""
+        if self.mirrored:
+            index = MIRRORED_INDEX[index]
+        return self.array[index, :2].tolist()
+
+    def __len__(self):
+        return len(self.array)
+
+
+def landmarks_to_array(landmarks):
+    """Convert a sequence of landmark objects (proto or tasks) into a (33, 4) array"""
+    return np.array([[lm.x, lm.y, lm.z, lm.visibility] for lm in landmarks], dtype=np.float64)
+
+
+def draw_landmarks(image, landmarks, landmark_color=(0, 0, 255), connection_color=(224, 224, 224)):
+    """Draw a pose skeleton onto a BGR image, matching mp_drawing's default style"""
+    height, width = image.shape[:2]
+    points = np.rint(landmarks[:, :2] * (width, height)).astype(np.int32).tolist()
+    visible = landmarks[:, 3] >= VISIBILITY_THRESHOLD
+
+    for start, end in POSE_CONNECTIONS:
+        if visible[start] and visible[end]:
+            cv2.line(image, tuple(points[start]), tuple(points[end]), connection_color, 2)
+    for index in np.flatnonzero(visible):
+        cv2.circle(image, tuple(points[index]), 2, landmark_color, 2)
+    return image
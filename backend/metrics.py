@@ -0,0 +1,252 @@
+"""Per-session pipeline timings and the Prometheus text exposition served at /metrics.
+
+Each session gets a ``SessionMetrics`` holding one latency histogram per
+pipeline stage. The video loop times itself with a ``StageTimer``: every
+``lap(stage)`` attributes the time since the previous lap to that stage, which
+costs two ``perf_counter`` calls and a bisect per stage, so it stays on in
+production.
+
+Frames also carry their capture time to the client (MJPEG part headers), and
+the frontend reports back when each one was displayed. Both ends feed sliding
+windows of per-frame latency: capture to published (``pipeline``: processed,
+encoded and handed to the session's viewers, before any client is written to)
+and capture to displayed (``glass_to_glass``), reported as live p50/p95/p99.
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict, deque
+
+import tracing
+from errors import error_tracker
+
+STAGES = ('capture', 'color_conversion', 'pose', 'logic', 'overlay', 'encode')
+
+# Seconds; dense around a 30 fps frame budget
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Window over which the reported frame rate is measured
+FPS_WINDOW = 1.0
+
+# Latency samples the percentiles are computed over (about 20 s at 30 fps)
+LATENCY_WINDOW = 600
+# Sent frames whose capture time is kept for matching display reports
+SENT_FRAMES_KEPT = 300
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus model"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs ending with +Inf"""
+        total = 0
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        result = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class LatencyWindow:
+    """Most recent latency samples with nearest-rank percentiles, plus running sum and count"""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self.samples = deque(maxlen=size)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.sum += value
+        self.count += 1
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+    def summary(self):
+        """p50/p95/p99 in milliseconds over the window"""
+        result = {f'p{int(q * 100)}': round(value * 1000, 1) for q, value in self.quantiles().items()}
+        result['samples'] = len(self.samples)
+        return result
+
+
+class SessionMetrics:
+    """Timings and frame counters of one exercise session"""
+
+    def __init__(self, session_id, exercise_name):
+        self.session_id = session_id
+        self.exercise_name = exercise_name
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.frames = 0
+        self.dropped_frames = 0
+        self.fps = 0.0
+        # FrameProfiler armed through the admin API, see profiling.py
+        self.profiler = None
+        self.pipeline_latency = LatencyWindow()
+        self.glass_to_glass = LatencyWindow()
+        self.last_frame = None
+        # frame id -> wall-clock capture time, for matching display reports
+        self._sent_frames = OrderedDict()
+        self._latency_lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_frames = 0
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    def frame_done(self, frame_id=None, capture_time=None):
+        """Count a frame published to viewers and refresh the frame rate once per window
+
+        Called once the frame is encoded, just before it is published; per-client
+        sends happen later on the viewers' own threads or coroutines and are not timed here.
+
+        ``capture_time`` is the wall-clock (``time.time()``) capture time of frame ``frame_id``.
+        """
+        if capture_time is not None:
+            with self._latency_lock:
+                self.pipeline_latency.observe(time.time() - capture_time)
+                self.last_frame = {'id': frame_id, 'timestamp': capture_time}
+                self._sent_frames[frame_id] = capture_time
+                if len(self._sent_frames) > SENT_FRAMES_KEPT:
+                    self._sent_frames.popitem(last=False)
+        self.frames += 1
+        self._window_frames += 1
+        now = time.monotonic()
+        if now - self._window_start >= FPS_WINDOW:
+            self.fps = self._window_frames / (now - self._window_start)
+            self._window_start = now
+            self._window_frames = 0
+
+    def frame_displayed(self, frame_id, displayed_at):
+        """Record a client display report; returns False for frames no longer known"""
+        with self._latency_lock:
+            capture_time = self._sent_frames.get(frame_id)
+            if capture_time is None or displayed_at < capture_time:
+                # Expired, never sent, or a client clock behind ours
+                return False
+            self.glass_to_glass.observe(displayed_at - capture_time)
+        return True
+
+    def latency_summary(self):
+        with self._latency_lock:
+            return {
+                'glass_to_glass_ms': self.glass_to_glass.summary(),
+                'pipeline_ms': self.pipeline_latency.summary(),
+                'last_frame': self.last_frame,
+            }
+
+    def labels(self):
+        return f'session="{self.session_id}",exercise="{self.exercise_name}"'
+
+
+class StageTimer:
+    """Lap timer for one pass of the video loop"""
+
+    def __init__(self, session_metrics):
+        self.session_metrics = session_metrics
+        self.last = time.perf_counter()
+        # Index of the frame being timed, attached to trace spans
+        self.frame_id = None
+
+    def start(self):
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.session_metrics.observe(stage, now - self.last)
+        if tracing.enabled:
+            tracing.record(stage, self.last, now - self.last, self.frame_id, self.session_metrics.session_id)
+        self.last = now
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def start_session(session_id, exercise_name):
+    session_metrics = SessionMetrics(session_id, exercise_name)
+    with _sessions_lock:
+        _sessions[session_id] = session_metrics
+    return session_metrics
+
+
+def end_session(session_id):
+    with _sessions_lock:
+        session_metrics = _sessions.pop(session_id, None)
+    # A profiler the video loop left unfinished, e.g. armed as it ended, would otherwise stay armed
+    if session_metrics and session_metrics.profiler:
+        session_metrics.profiler.stop()
+
+
+def get_session(session_id):
+    with _sessions_lock:
+        return _sessions.get(session_id)
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    lines.extend(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}' for labels, value in samples)
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+
+    lines = []
+    _metric(lines, 'exercise_active_sessions', 'gauge', 'Exercise sessions currently running',
+            [('', len(sessions))])
+
+    lines.append('# HELP exercise_pipeline_stage_seconds Time per frame spent in each video pipeline stage')
+    lines.append('# TYPE exercise_pipeline_stage_seconds histogram')
+    for session in sessions:
+        for stage, histogram in session.stages.items():
+            labels = f'{session.labels()},stage="{stage}"'
+            lines.extend(f'exercise_pipeline_stage_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                         for bound, count in histogram.cumulative())
+            lines.append(f'exercise_pipeline_stage_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'exercise_pipeline_stage_seconds_count{{{labels}}} {histogram.count}')
+
+    _metric(lines, 'exercise_pipeline_fps', 'gauge', 'Frames per second encoded and published to viewers',
+            [(session.labels(), round(session.fps, 2)) for session in sessions])
+    _metric(lines, 'exercise_pipeline_frames_total', 'counter', 'Frames encoded and published to viewers',
+            [(session.labels(), session.frames) for session in sessions])
+    _metric(lines, 'exercise_pipeline_dropped_frames_total', 'counter',
+            'Camera frames replaced by a newer one before the pipeline read them or skipped by a busy pose backend',
+            [(session.labels(), session.dropped_frames) for session in sessions])
+
+    _metric(lines, 'exercise_frame_errors_total', 'counter', 'Frames whose exercise logic raised, by exception type',
+            [(f'exercise="{exercise_name}",type="{error_type}"', count)
+             for (exercise_name, error_type), count in sorted(error_tracker.snapshot().items())])
+
+    for name, attribute, help_text in (
+            ('exercise_pipeline_latency_seconds', 'pipeline_latency', 'Time from frame capture until it is encoded and published to viewers'),
+            ('exercise_glass_to_glass_latency_seconds', 'glass_to_glass',
+             'Time from frame capture until the client displayed it')):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} summary')
+        for session in sessions:
+            with session._latency_lock:
+                window = getattr(session, attribute)
+                quantiles, total, count = window.quantiles(), window.sum, window.count
+            lines.extend(f'{name}{{{session.labels()},quantile="{q}"}} {value}' for q, value in quantiles.items())
+            lines.append(f'{name}_sum{{{session.labels()}}} {total}')
+            lines.append(f'{name}_count{{{session.labels()}}} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,188 @@
+"""Pluggable pose estimation backends.
+
+Every backend accepts RGB frames through ``submit`` and hands back ``PoseResult``
+tuples from ``poll``. A result carries a (33, 4) landmark array (x, y, z,
+visibility), or None when no person was found, plus the timestamp of the frame
+it was computed from. Synchronous engines produce the result inside ``submit``;
+asynchronous ones deliver it later from their own thread, so capture of the
+next frame overlaps with inference of the previous one.
+
+The engine is chosen per deployment with the POSE_BACKEND environment variable.
+"""
+import os
+import threading
+from collections import deque, namedtuple
+
+from landmarks import landmarks_to_array
+
+PoseResult = namedtuple('PoseResult', ['landmarks', 'timestamp_ms'])
+
+DEFAULT_BACKEND = 'solutions'
+DEFAULT_TASKS_MODEL = os.path.join(os.path.dirname(__file__), 'models', 'pose_landmarker_full.task')
+
+
+class PoseBackend:
+    """Base class for pose estimation engines"""
+
+    name = None
+    asynchronous = False
+    # Frames submit() skipped because earlier ones were still being inferred
+    frames_skipped = 0
+
+    def __init__(self):
+        self._results = deque()
+        self._result_ready = threading.Condition()
+
+    def submit(self, image, timestamp_ms):
+        """Queue an RGB frame for inference"""
+        raise NotImplementedError
+
+    def poll(self):
+        """Return all results that became available since the last call"""
+        with self._result_ready:
+            results = list(self._results)
+            self._results.clear()
+        return results
+
+    def process(self, image, timestamp_ms, timeout=1.0):
+        """Run inference on one frame and wait for its result"""
+        self.submit(image, timestamp_ms)
+        with self._result_ready:
+            self._result_ready.wait_for(
+                lambda: any(r.timestamp_ms >= timestamp_ms for r in self._results), timeout)
+        for result in self.poll():
+            if result.timestamp_ms >= timestamp_ms:
+                return result
+        return PoseResult(None, timestamp_ms)
+
+    def reset(self):
+        """Forget tracking state and timestamps, so the next frame may start an unrelated clip"""
+        with self._result_ready:
+            self._results.clear()
+
+    def _publish(self, landmarks, timestamp_ms):
+        with self._result_ready:
+            self._results.append(PoseResult(landmarks, timestamp_ms))
+            self._result_ready.notify_all()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SolutionsPoseBackend(PoseBackend):
+    """Legacy ``mp.solutions.pose.Pose`` graph, run synchronously in the caller's thread"""
+
+    name = 'solutions'
+
+    def __init__(self, model_complexity=1, min_detection_confidence=0.5, min_tracking_confidence=0.5,
+                 static_image_mode=False):
+        super().__init__()
+        import mediapipe as mp
+        self._pose = mp.solutions.pose.Pose(
+            static_image_mode=static_image_mode,
+            model_complexity=model_complexity,
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence,
+        )
+
+    def submit(self, image, timestamp_ms):
+        results = self._pose.process(image)
+        landmarks = None
+        if results.pose_landmarks:
+            landmarks = landmarks_to_array(results.pose_landmarks.landmark)
+        self._publish(landmarks, timestamp_ms)
+
+    def reset(self):
+        super().reset()
+        self._pose.reset()
+
+    def close(self):
+        self._pose.close()
+
+
+class TasksPoseBackend(PoseBackend):
+    """MediaPipe Tasks ``PoseLandmarker`` in VIDEO or LIVE_STREAM running mode
+
+    In LIVE_STREAM mode frames go through ``detect_async`` and results arrive
+    on MediaPipe's callback thread; frames submitted while the graph is busy
+    are dropped by MediaPipe instead of queueing up.
+    """
+
+    def __init__(self, model_path=DEFAULT_TASKS_MODEL, running_mode='live_stream',
+                 min_detection_confidence=0.5, min_tracking_confidence=0.5):
+        super().__init__()
+        import mediapipe as mp
+        from mediapipe.tasks.python import BaseOptions
+        from mediapipe.tasks.python import vision
+
+        if running_mode not in ('live_stream', 'video'):
+            raise ValueError(f"Unsupported running mode {running_mode}")
+        if not os.path.exists(model_path):
+            raise ValueError(f"Pose landmarker model {model_path} not found")
+
+        self._mp = mp
+        self.asynchronous = running_mode == 'live_stream'
+        self.name = f"tasks_{running_mode}"
+        self._last_timestamp_ms = -1
+
+        self._landmarker_class = vision.PoseLandmarker
+        self._options = vision.PoseLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=model_path),
+            running_mode=(vision.RunningMode.LIVE_STREAM if self.asynchronous
+                          else vision.RunningMode.VIDEO),
+            num_poses=1,
+            min_pose_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence,
+            result_callback=self._on_result if self.asynchronous else None,
+        )
+        self._landmarker = self._landmarker_class.create_from_options(self._options)
+
+    def submit(self, image, timestamp_ms):
+        # The Tasks API rejects timestamps that do not strictly increase
+        timestamp_ms = max(int(timestamp_ms), self._last_timestamp_ms + 1)
+        self._last_timestamp_ms = timestamp_ms
+
+        mp_image = self._mp.Image(image_format=self._mp.ImageFormat.SRGB, data=image)
+        if self.asynchronous:
+            self._landmarker.detect_async(mp_image, timestamp_ms)
+        else:
+            self._on_result(self._landmarker.detect_for_video(mp_image, timestamp_ms), None, timestamp_ms)
+
+    def _on_result(self, result, output_image, timestamp_ms):
+        landmarks = None
+        if result.pose_landmarks:
+            landmarks = landmarks_to_array(result.pose_landmarks[0])
+        self._publish(landmarks, timestamp_ms)
+
+    def reset(self):
+        # A landmarker cannot go back in time, so a new clip needs a new one
+        self._landmarker.close()
+        super().reset()
+        self._last_timestamp_ms = -1
+        self._landmarker = self._landmarker_class.create_from_options(self._options)
+
+    def close(self):
+        self._landmarker.close()
+
+
+def create_pose_backend(name=None, **kwargs):
+    """Instantiate the pose backend configured for this deployment"""
+    name = name or os.environ.get('POSE_BACKEND', DEFAULT_BACKEND)
+
+    if name == 'solutions':
+        if 'model_complexity' not in kwargs and 'POSE_MODEL_COMPLEXITY' in os.environ:
+            kwargs['model_complexity'] = int(os.environ['POSE_MODEL_COMPLEXITY'])
+        return SolutionsPoseBackend(**kwargs)
+    elif name in ('tasks_live_stream', 'tasks_video'):
+        kwargs.setdefault('model_path', os.environ.get('POSE_MODEL_PATH', DEFAULT_TASKS_MODEL))
+        return TasksPoseBackend(running_mode=name[len('tasks_'):], **kwargs)
+    elif name == 'tflite_batched':
+        from batched_inference import TFLiteBatchedPoseBackend
+        return TFLiteBatchedPoseBackend(**kwargs)
+    raise ValueError(f"Unknown pose backend {name}")
@@ -0,0 +1,459 @@
+"""Per-session exercise logic: turns landmark arrays into rep counts and form feedback."""
+import functools
+import importlib.util
+import json
+import os
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from errors import record_error
+from events import FORM_FAULT, REP_COMPLETED, REP_STARTED, form_code
+from landmarks import (
+    LANDMARK_INDEX, LEFT_ANKLE, LEFT_ELBOW, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, LEFT_WRIST,
+    MIRRORED_INDEX, NOSE, RIGHT_ANKLE, RIGHT_HIP, RIGHT_KNEE, VISIBILITY_THRESHOLD, LandmarkList,
+)
+
+MOVE_INTO_FRAME_FEEDBACK = "Move into frame so your joints are visible."
+
+# Joint-angle cutoffs (degrees) at which each exercise enters its stages
+STAGE_THRESHOLDS = {
+    'bicep_curl': {'down': 160, 'up': 30},
+    'squats': {'up': 160, 'down': 100},
+    'overhead_press': {'down': 90, 'up': 160},
+    'lateral_raises': {'down': 30, 'up': 70},
+    'lunges': {'up': 160, 'down': 100},
+    'pullups': {'down': 160, 'up': 100},
+    'pushups': {'up': 160, 'down': 90},
+    'glute_bridges': {'down': 150, 'up': 160},
+    'crunches': {'down': 160, 'up': 150},
+    'plank': {},
+}
+
+# Stage each exercise's reps start from; a rep is counted on reaching the other stage
+REP_START_STAGES = {
+    'bicep_curl': 'down',
+    'squats': 'up',
+    'overhead_press': 'down',
+    'lateral_raises': 'down',
+    'lunges': 'up',
+    'pullups': 'down',
+    'pushups': 'up',
+    'glute_bridges': 'down',
+    'crunches': 'down',
+}
+
+# Degrees past the start threshold the angle must move before a rep counts as started, so
+# jitter around the threshold does not start and abandon reps (at most half the gap to the other one)
+REP_START_MARGIN = 5.0
+
+@functools.lru_cache(maxsize=None)
+def _load_thresholds_file(path):
+    with open(path) as f:
+        return json.load(f)
+
+def stage_thresholds(exercise_name, overrides=None):
+    """Stage thresholds for an exercise: defaults, then the STAGE_THRESHOLDS_FILE JSON, then ``overrides``"""
+    thresholds = dict(STAGE_THRESHOLDS.get(exercise_name, {}))
+    path = os.environ.get('STAGE_THRESHOLDS_FILE')
+    if path:
+        thresholds.update(_load_thresholds_file(path).get(exercise_name, {}))
+    thresholds.update(overrides or {})
+    return thresholds
+
+def fallback_calculate_angle(a, b, c):
+    a, b, c = np.array(a), np.array(b), np.array(c)
+    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
+    angle = np.abs(radians*180.0/np.pi)
+    return 360-angle if angle > 180 else angle
+
+def load_exercise_module(exercise_name):
+    """Dynamically load exercise module"""
+    exercise_path = Path(__file__).parent / "exercises" / f"{exercise_name}.py"
+    if not exercise_path.exists():
+        raise ValueError(f"Exercise {exercise_name} not found")
+    
+    spec = importlib.util.spec_from_file_location(exercise_name, exercise_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class ExerciseProcessor:
+    def __init__(self, exercise_name, thresholds=None):
+        self.exercise_name = exercise_name
+        self.thresholds = stage_thresholds(exercise_name, thresholds)
+        self.exercise_module = self._load_exercise_module(exercise_name)
+        self.calculate_angle = getattr(self.exercise_module, 'calculate_angle', fallback_calculate_angle)
+        
+        # Only the joints this exercise declares are checked for visibility
+        required = getattr(self.exercise_module, 'REQUIRED_LANDMARKS', [])
+        self.required_indices = np.array([LANDMARK_INDEX[name] for name in required], dtype=int)
+        self.mirrored_indices = MIRRORED_INDEX[self.required_indices]
+        # Exercises that already use both sides (lunges) are never mirrored
+        self.can_mirror = set(self.required_indices.tolist()) != set(self.mirrored_indices.tolist())
+        # Called as on_event(event_type, **fields) for rep and form fault events; see events.py
+        self.on_event = None
+        self.reset_state()
+    
+    def _load_exercise_module(self, exercise_name):
+        return load_exercise_module(exercise_name)
+    
+    def reset_state(self, start_time=None):
+        """Reset exercise state; times are seconds on the clock frame timestamps use"""
+        self.counter = 0
+        self.stage = 'down' if self.exercise_name != 'plank' else None
+        self.good_reps = 0
+        self.feedback_list = []
+        self.rep_log = []
+        self.start_time = time.monotonic() if start_time is None else start_time
+        self.frame_time = self.start_time
+        self.good_form_time = 0 if self.exercise_name == 'plank' else None
+        self.last_frame_time = self.start_time if self.exercise_name == 'plank' else None
+        # Frames whose logic raised, by exception type; frames without a usable pose are not errors
+        self.error_counts = Counter()
+        self.frames_without_pose = 0
+        # Time the rep in progress left the start position, its primary angle's [min, max]
+        # and, once it has been counted, what to report when it ends
+        self.rep_start_time = None
+        self.rep_angle_range = None
+        self.counted_rep = None
+    
+    def process_frame(self, frame, landmarks, timestamp=None):
+        """Process a frame's (33, 4) landmark array using exercise-specific logic
+        
+        ``timestamp`` is the frame's capture time in seconds (time.monotonic() when
+        omitted), so timed stats follow the video rather than processing speed.
+        """
+        self.frame_time = time.monotonic() if timestamp is None else timestamp
+        previous_feedback = self.feedback_list
+        try:
+            landmarks = self._visible_landmarks(landmarks)
+            if landmarks is None:
+                # Required joints are missing or occluded; don't update the stage from garbage
+                self.frames_without_pose += 1
+                self.feedback_list = [MOVE_INTO_FRAME_FEEDBACK]
+                if self.exercise_name == 'plank':
+                    self.last_frame_time = self.frame_time
+                return
+            
+            calculate_angle = self.calculate_angle
+            
+            # Exercise-specific processing
+            if self.exercise_name == 'bicep_curl':
+                self._process_bicep_curl(landmarks, calculate_angle)
+            elif self.exercise_name == 'squats':
+                self._process_squats(landmarks, calculate_angle)
+            elif self.exercise_name == 'overhead_press':
+                self._process_overhead_press(landmarks, calculate_angle)
+            elif self.exercise_name == 'lateral_raises':
+                self._process_lateral_raises(landmarks, calculate_angle)
+            elif self.exercise_name == 'lunges':
+                self._process_lunges(landmarks, calculate_angle)
+            elif self.exercise_name == 'pullups':
+                self._process_pullups(landmarks, calculate_angle)
+            elif self.exercise_name == 'pushups':
+                self._process_pushups(landmarks, calculate_angle)
+            elif self.exercise_name == 'glute_bridges':
+                self._process_glute_bridges(landmarks, calculate_angle)
+            elif self.exercise_name == 'crunches':
+                self._process_crunches(landmarks, calculate_angle)
+            elif self.exercise_name == 'plank':
+                self._process_plank(landmarks, calculate_angle)
+                
+        except Exception as e:
+            # Counted and logged at a limited rate; a persistent fault would otherwise log every frame
+            self.error_counts[type(e).__name__] += 1
+            record_error(self.exercise_name, e)
+        
+        if self.on_event and self.feedback_list != previous_feedback:
+            self._report_form_faults(previous_feedback)
+    
+    def _visible_landmarks(self, landmarks):
+        """Pick the better-visible body side, or None if its required joints are not visible
+
+        Each exercise module lists the landmarks its logic reads in
+        ``REQUIRED_LANDMARKS``. One-sided exercises name the left side; when
+        the mirrored joints are better visible, LEFT_* and RIGHT_* lookups are
+        swapped so the same logic tracks the right side. Lists that already
+        cover both sides (lunges) are never mirrored, and unpaired landmarks
+        such as NOSE (pullups) read the same row either way.
+        """
+        if landmarks is None:
+            return None
+        
+        visibility = landmarks[:, 3]
+        left = visibility[self.required_indices]
+        right = visibility[self.mirrored_indices]
+        mirrored = self.can_mirror and right.sum() > left.sum()
+        if len(left) and (right if mirrored else left).min() < VISIBILITY_THRESHOLD:
+            return None
+        return LandmarkList(landmarks, mirrored)
+    
+    def _process_bicep_curl(self, landmarks, calculate_angle):
+        shoulder = landmarks.xy(LEFT_SHOULDER)
+        elbow = landmarks.xy(LEFT_ELBOW)
+        wrist = landmarks.xy(LEFT_WRIST)
+        
+        elbow_angle = calculate_angle(shoulder, elbow, wrist)
+        self.feedback_list = self.exercise_module.check_bicep_curl_form(landmarks, elbow_angle, self.stage)
+        
+        if elbow_angle > self.thresholds['down']:
+            self.stage = "down"
+        if elbow_angle < self.thresholds['up'] and self.stage == 'down':
+            self.stage = "up"
+            self._count_rep(self.exercise_module.check_bicep_curl_form(landmarks, elbow_angle, "up"))
+        self._track_rep(elbow_angle)
+    
+    def _process_squats(self, landmarks, calculate_angle):
+        hip = landmarks.xy(LEFT_HIP)
+        knee = landmarks.xy(LEFT_KNEE)
+        ankle = landmarks.xy(LEFT_ANKLE)
+        shoulder = landmarks.xy(LEFT_SHOULDER)
+        
+        knee_angle = calculate_angle(hip, knee, ankle)
+        hip_angle = calculate_angle(shoulder, hip, knee)
+        
+        self.feedback_list = self.exercise_module.check_squat_form(knee_angle, hip_angle, self.stage)
+        
+        if knee_angle > self.thresholds['up']:
+            self.stage = "up"
+        if knee_angle < self.thresholds['down'] and self.stage == "up":
+            self.stage = "down"
+            self._count_rep(self.exercise_module.check_squat_form(knee_angle, hip_angle, "down"))
+        self._track_rep(knee_angle)
+    
+    def _process_plank(self, landmarks, calculate_angle):
+        shoulder = landmarks.xy(LEFT_SHOULDER)
+        hip = landmarks.xy(LEFT_HIP)
+        ankle = landmarks.xy(LEFT_ANKLE)
+        
+        hip_angle = calculate_angle(shoulder, hip, ankle)
+        self.feedback_list = self.exercise_module.check_plank_form(hip_angle)
+        
+        good_form = not self.feedback_list
+        now = self.frame_time
+        if good_form:
+            self.good_form_time += now - self.last_frame_time
+        self.last_frame_time = now
+    
+    # Add other exercise processing methods...
+    def _process_overhead_press(self, landmarks, calculate_angle):
+        shoulder = landmarks.xy(LEFT_SHOULDER)
+        elbow = landmarks.xy(LEFT_ELBOW)
+        wrist = landmarks.xy(LEFT_WRIST)
+        hip = landmarks.xy(LEFT_HIP)
+        
+        elbow_angle = calculate_angle(shoulder, elbow, wrist)
+        shoulder_angle = calculate_angle(hip, shoulder, elbow)
+        
+        self.feedback_list = self.exercise_module.check_overhead_press_form(elbow_angle, shoulder_angle, self.stage)
+        
+        if elbow_angle < self.thresholds['down']:
+            self.stage = "down"
+        if elbow_angle > self.thresholds['up'] and self.stage == "down":
+            self.stage = "up"
+            self._count_rep(self.exercise_module.check_overhead_press_form(elbow_angle, shoulder_angle, "up"))
+        self._track_rep(elbow_angle)
+    
+    def _process_lateral_raises(self, landmarks, calculate_angle):
+        shoulder = landmarks.xy(LEFT_SHOULDER)
+        elbow = landmarks.xy(LEFT_ELBOW)
+        wrist = landmarks.xy(LEFT_WRIST)
+        hip = landmarks.xy(LEFT_HIP)
+        
+        shoulder_angle = calculate_angle(hip, shoulder, elbow)
+        elbow_angle = calculate_angle(shoulder, elbow, wrist)
+        
+        self.feedback_list = self.exercise_module.check_lateral_raise_form(shoulder_angle, elbow_angle, self.stage)
+        
+        if shoulder_angle < self.thresholds['down']:
+            self.stage = "down"
+        if shoulder_angle > self.thresholds['up'] and self.stage == "down":
+            self.stage = "up"
+            self._count_rep(self.exercise_module.check_lateral_raise_form(shoulder_angle, elbow_angle, "up"))
+        self._track_rep(shoulder_angle)
+    
+    def _process_lunges(self, landmarks, calculate_angle):
+        left_hip = landmarks.xy(LEFT_HIP)
+        left_knee = landmarks.xy(LEFT_KNEE)
+        left_ankle = landmarks.xy(LEFT_ANKLE)
+        right_hip = landmarks.xy(RIGHT_HIP)
+        right_knee = landmarks.xy(RIGHT_KNEE)
+        right_ankle = landmarks.xy(RIGHT_ANKLE)
+        
+        front_knee_angle = calculate_angle(left_hip, left_knee, left_ankle)
+        back_knee_angle = calculate_angle(right_hip, right_knee, right_ankle)
+        
+        self.feedback_list = self.exercise_module.check_lunge_form(front_knee_angle, back_knee_angle, self.stage)
+        
+        if front_knee_angle > self.thresholds['up'] and back_knee_angle > self.thresholds['up']:
+            self.stage = "up"
+        if front_knee_angle < self.thresholds['down'] and self.stage == "up":
+            self.stage = "down"
+            self._count_rep(self.exercise_module.check_lunge_form(front_knee_angle, back_knee_angle, "down"))
+        self._track_rep(front_knee_angle)
+    
+    def _process_pullups(self, landmarks, calculate_angle):
+        shoulder = landmarks.xy(LEFT_SHOULDER)
+        elbow = landmarks.xy(LEFT_ELBOW)
+        wrist = landmarks.xy(LEFT_WRIST)
+        nose = landmarks[NOSE]
+        
+        elbow_angle = calculate_angle(shoulder, elbow, wrist)
+        self.feedback_list = self.exercise_module.check_pullup_form(landmarks, elbow_angle, self.stage)
+        
+        if elbow_angle > self.thresholds['down']:
+            self.stage = "down"
+        if nose.y < shoulder[1] and elbow_angle < self.thresholds['up'] and self.stage == "down":
+            self.stage = "up"
+            self._count_rep(self.exercise_module.check_pullup_form(landmarks, elbow_angle, "up"))
+        self._track_rep(elbow_angle)
+    
+    def _process_pushups(self, landmarks, calculate_angle):
+        shoulder = landmarks.xy(LEFT_SHOULDER)
+        elbow = landmarks.xy(LEFT_ELBOW)
+        wrist = landmarks.xy(LEFT_WRIST)
+        hip = landmarks.xy(LEFT_HIP)
+        knee = landmarks.xy(LEFT_KNEE)
+        
+        elbow_angle = calculate_angle(shoulder, elbow, wrist)
+        hip_angle = calculate_angle(shoulder, hip, knee)
+        
+        if elbow_angle > self.thresholds['up']:
+            current_stage = "up"
+        elif elbow_angle < self.thresholds['down']:
+            current_stage = "down"
+        else:
+            current_stage = self.stage
+        
+        if current_stage == "down" and self.stage == "up":
+            self._count_rep(self.exercise_module.check_pushup_form(elbow_angle, hip_angle, "down"))
+        
+        self.stage = current_stage
+        self.feedback_list = self.exercise_module.check_pushup_form(elbow_angle, hip_angle, current_stage)
+        self._track_rep(elbow_angle)
+    
+    def _process_glute_bridges(self, landmarks, calculate_angle):
+        shoulder = landmarks.xy(LEFT_SHOULDER)
+        hip = landmarks.xy(LEFT_HIP)
+        knee = landmarks.xy(LEFT_KNEE)
+        
+        hip_angle = calculate_angle(shoulder, hip, knee)
+        self.feedback_list = self.exercise_module.check_glute_bridge_form(hip_angle, self.stage)
+        
+        if hip_angle < self.thresholds['down']:
+            self.stage = "down"
+        if hip_angle > self.thresholds['up'] and self.stage == 'down':
+            self.stage = "up"
+            self._count_rep(self.exercise_module.check_glute_bridge_form(hip_angle, "up"))
+        self._track_rep(hip_angle)
+    
+    def _process_crunches(self, landmarks, calculate_angle):
+        shoulder = landmarks.xy(LEFT_SHOULDER)
+        hip = landmarks.xy(LEFT_HIP)
+        knee = landmarks.xy(LEFT_KNEE)
+        
+        hip_angle = calculate_angle(shoulder, hip, knee)
+        self.feedback_list = self.exercise_module.check_crunch_form(hip_angle, self.stage)
+        
+        if hip_angle > self.thresholds['down']:
+            self.stage = "down"
+        if hip_angle < self.thresholds['up'] and self.stage == 'down':
+            self.stage = "up"
+            self._count_rep(self.exercise_module.check_crunch_form(hip_angle, "up"))
+        self._track_rep(hip_angle)
+    
+    def _track_rep(self, angle):
+        """Follow the primary joint angle through a rep, for its duration and range of motion
+        
+        Called with each frame's angle after the stage update. A rep starts on
+        the first frame the angle is clearly past the start stage's threshold, or
+        when it is counted if it got there within a single frame, and ends when
+        the stage is back at the start with the angle past its threshold: with a
+        rep_completed event if it was counted on the way, silently if it was
+        abandoned.
+        """
+        start_stage = REP_START_STAGES[self.exercise_name]
+        threshold = self.thresholds[start_stage]
+        other_threshold = self.thresholds['up' if start_stage == 'down' else 'down']
+        margin = min(REP_START_MARGIN, abs(threshold - other_threshold) / 2)
+        if threshold > other_threshold:
+            at_start, left_start = angle > threshold, angle < threshold - margin
+        else:
+            at_start, left_start = angle < threshold, angle > threshold + margin
+        
+        if self.rep_start_time is None:
+            if self.counted_rep or (self.stage == start_stage and left_start):
+                self.rep_start_time = self.frame_time
+                self.rep_angle_range = [angle, angle]
+                rep = self.counter if self.counted_rep else self.counter + 1
+                self._emit(REP_STARTED, rep=rep, angle=round(float(angle), 1))
+            return
+        
+        low, high = self.rep_angle_range
+        self.rep_angle_range = [min(low, angle), max(high, angle)]
+        if at_start and self.stage == start_stage:
+            self._complete_rep()
+    
+    def _complete_rep(self):
+        """End the rep in progress, reporting it if it was counted"""
+        if self.counted_rep:
+            low, high = self.rep_angle_range
+            self._emit(REP_COMPLETED, rom=round(float(high - low), 1),
+                       angle_range=[round(float(low), 1), round(float(high), 1)],
+                       duration=round(float(self.frame_time - self.rep_start_time), 3), **self.counted_rep)
+        self.rep_start_time = None
+        self.counted_rep = None
+    
+    def _count_rep(self, form_feedback):
+        """Record a completed rep along with the form feedback at the moment it was counted"""
+        if self.counted_rep:
+            # Counted again before the start position was seen; report the earlier rep first
+            self._complete_rep()
+        self.counter += 1
+        if not form_feedback:
+            self.good_reps += 1
+        self.rep_log.append({
+            'rep': self.counter,
+            'timestamp': round(self.frame_time - self.start_time, 3),
+            'good': not form_feedback,
+            'feedback': list(form_feedback),
+        })
+        # Reported once the movement is back at its start position, with the full range of motion
+        self.counted_rep = {'rep': self.counter, 'good': not form_feedback,
+                            'form_codes': [form_code(message) for message in form_feedback],
+                            'feedback': list(form_feedback)}
+    
+    def _report_form_faults(self, previous_feedback):
+        """A form_fault event for each feedback message that was not shown on the previous frame"""
+        for message in self.feedback_list:
+            if message not in previous_feedback and message != MOVE_INTO_FRAME_FEEDBACK:
+                self._emit(FORM_FAULT, code=form_code(message), message=message, stage=self.stage)
+    
+    def _emit(self, event_type, **fields):
+        if self.on_event:
+            self.on_event(event_type, exercise=self.exercise_name,
+                          session_time=round(float(self.frame_time - self.start_time), 3), **fields)
+    
+    def get_stats(self, now=None):
+        """Get current exercise statistics"""
+        elapsed_time = (time.monotonic() if now is None else now) - self.start_time
+        
+        if self.exercise_name == 'plank':
+            return {
+                'exercise': self.exercise_name,
+                'elapsed_time': int(elapsed_time),
+                'good_form_time': int(self.good_form_time),
+                'feedback': self.feedback_list
+            }
+        else:
+            return {
+                'exercise': self.exercise_name,
+                'reps': self.counter,
+                'good_reps': self.good_reps,
+                'stage': self.stage,
+                'elapsed_time': int(elapsed_time),
+                'feedback': self.feedback_list
+            }
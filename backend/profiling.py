@@ -0,0 +1,199 @@
+"""On-demand profiling of one session's video loop for a fixed number of frames.
+
+An armed ``FrameProfiler`` is attached to the session's ``SessionMetrics``;
+the video loop checks that attribute once per frame, so profiling costs
+nothing until someone arms it. Two modes:
+
+- ``cprofile``: deterministic ``cProfile`` of the loop thread, exported as a
+  pstats file (``python -m pstats``, snakeviz) or a text summary
+- ``sampling``: a background thread snapshots the loop thread's stack every
+  ``interval`` seconds, exported as collapsed stacks for flamegraph.pl or
+  speedscope; much lower overhead, so it suits sessions already near budget
+
+Only the loop's own thread is profiled, from the moment a frame arrives to the
+moment it is encoded; pose inference running on backend threads shows up as
+time waiting for results. A session that ends first stops its profiler, which
+keeps the frames recorded so far and is reported as aborted.
+"""
+import contextlib
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+MODES = ('cprofile', 'sampling')
+MAX_FRAMES = 10000
+DEFAULT_SAMPLE_INTERVAL = 0.001
+# Finished profiles kept for download, oldest dropped first
+MAX_KEPT_PROFILES = 16
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer while that thread is inside a frame"""
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.thread_id = None
+        self.active = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if not self.active:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class FrameProfiler:
+    """Profiles the next ``frames`` frames of the first loop thread that picks it up"""
+
+    def __init__(self, session_id, frames, mode='cprofile', interval=DEFAULT_SAMPLE_INTERVAL):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode}; expected one of {', '.join(MODES)}")
+        if not 0 < frames <= MAX_FRAMES:
+            raise ValueError(f"frames must be between 1 and {MAX_FRAMES}")
+        self.session_id = session_id
+        self.mode = mode
+        self.frames = frames
+        self.frames_done = 0
+        self.finished = False
+        # Finished by the session ending before all frames were profiled
+        self.aborted = False
+        self.armed_at = time.time()
+        self.profiled_seconds = 0.0
+        self._thread_id = None
+        self._frame_start = None
+        self._profile = cProfile.Profile() if mode == 'cprofile' else None
+        self._sampler = StackSampler(interval) if mode == 'sampling' else None
+
+    def frame_started(self):
+        thread_id = threading.get_ident()
+        if self.finished or self._thread_id not in (None, thread_id):
+            # Bound to the first thread that ran a frame with it
+            return
+        self._thread_id = thread_id
+        self._frame_start = time.perf_counter()
+        if self._profile:
+            self._profile.enable()
+        else:
+            self._sampler.thread_id = thread_id
+            self._sampler.active = True
+
+    def frame_finished(self):
+        """Stop recording for this frame; returns True once the requested frames are done"""
+        if self._frame_start is None or threading.get_ident() != self._thread_id:
+            return self.finished
+        if self._profile:
+            self._profile.disable()
+        else:
+            self._sampler.active = False
+        self.profiled_seconds += time.perf_counter() - self._frame_start
+        self._frame_start = None
+        self.frames_done += 1
+        if self.frames_done >= self.frames:
+            self.finished = True
+            if self._sampler:
+                self._sampler.stop()
+        return self.finished
+
+    def stop(self):
+        """Finish early because the session ended, keeping the frames recorded so far"""
+        if self.finished:
+            return
+        if self._frame_start is not None and threading.get_ident() == self._thread_id:
+            # The loop left in the middle of a frame; cProfile can only be disabled from its thread
+            if self._profile:
+                self._profile.disable()
+            self._frame_start = None
+        if self._sampler:
+            self._sampler.active = False
+            self._sampler.stop()
+        self.aborted = True
+        self.finished = True
+
+    def status(self):
+        return {
+            'session_id': self.session_id,
+            'mode': self.mode,
+            'frames': self.frames,
+            'frames_done': self.frames_done,
+            'finished': self.finished,
+            'aborted': self.aborted,
+            'profiled_seconds': round(self.profiled_seconds, 4),
+        }
+
+    def export(self, format=None):
+        """Return (body, mimetype, filename) of a finished profile"""
+        if not self.frames_done:
+            raise ValueError("The session ended before any frame was profiled")
+        if self.mode == 'sampling':
+            if format not in (None, 'collapsed'):
+                raise ValueError("Sampling profiles export as 'collapsed'")
+            return self._sampler.collapsed(), 'text/plain', f'profile-{self.session_id}.collapsed'
+        stats = pstats.Stats(self._profile)
+        if format in (None, 'pstats'):
+            return marshal.dumps(stats.stats), 'application/octet-stream', f'profile-{self.session_id}.pstats'
+        if format == 'text':
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats('cumulative').print_stats(60)
+            return stream.getvalue(), 'text/plain', f'profile-{self.session_id}.txt'
+        raise ValueError("cProfile profiles export as 'pstats' or 'text'")
+
+
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def arm(session_metrics, frames, mode='cprofile', interval=DEFAULT_SAMPLE_INTERVAL):
+    """Attach a new profiler to a session; raises ValueError for bad arguments or one already running"""
+    with _profiles_lock:
+        if session_metrics.profiler and not session_metrics.profiler.finished:
+            raise ValueError(f"Session {session_metrics.session_id} is already being profiled")
+        if mode == 'cprofile' and any(p.mode == 'cprofile' and not p.finished for p in _profiles.values()):
+            # Only one cProfile profiler can be active in a process at a time
+            raise ValueError("Another session is already being profiled with cprofile; use sampling")
+        profiler = FrameProfiler(session_metrics.session_id, frames, mode, interval)
+        _profiles[session_metrics.session_id] = profiler
+        _profiles.move_to_end(session_metrics.session_id)
+        while len(_profiles) > MAX_KEPT_PROFILES:
+            _profiles.popitem(last=False)
+        session_metrics.profiler = profiler
+    return profiler
+
+
+@contextlib.contextmanager
+def profiled_loop(session_metrics):
+    """Wraps a session's video loop; stops a profiler it leaves unfinished, on the loop's own thread"""
+    try:
+        yield
+    finally:
+        profiler = session_metrics.profiler
+        if profiler:
+            profiler.stop()
+
+
+def get_profile(session_id):
+    with _profiles_lock:
+        return _profiles.get(session_id)
@@ -0,0 +1,150 @@
+"""Re-run counting and form logic over recorded landmark streams.
+
+    python replay.py recordings/*.lmk --output rescored.jsonl
+    python replay.py recordings/ --workers 8 --reps
+
+Recordings (``.lmk`` files from ``landmark_store``) already hold the landmarks
+the live logic saw, so replay skips pose inference entirely and feeds them
+through ``ExerciseProcessor`` at memory speed. Stats come out the same as the
+live path for the same rules; after a rule change, ``changed_frames`` counts
+frames whose stage differs from what was recorded.
+
+``--vectorized`` scores each recording in one pass with ``vectorized.count_reps``
+instead; stats and reps are identical but per-frame stages (and so
+``changed_frames``) are not produced.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from landmark_store import STAGES, LandmarkRecording, dequantize, is_missing
+from processor import ExerciseProcessor
+from vectorized import count_recording
+
+
+def replay_recording(path, exercise_name=None):
+    """Replay one recording; returns (summary, rep_log)"""
+    recording = LandmarkRecording(path)
+    exercise_name = exercise_name or recording.exercise_name
+    processor = ExerciseProcessor(exercise_name)
+
+    start = time.perf_counter()
+    chunks = list(recording.iter_chunks())
+    first_timestamp = float(chunks[0]['timestamps'][0]) if chunks else 0.0
+    processor.reset_state(start_time=recording.metadata.get('start_time', first_timestamp))
+
+    changed_frames = 0
+    timestamp = processor.start_time
+    for chunk in chunks:
+        landmarks = dequantize(chunk['landmarks'])
+        missing = is_missing(chunk['landmarks'])
+        stages = np.empty(len(landmarks), dtype=object)
+        for i, timestamp in enumerate(chunk['timestamps'].tolist()):
+            processor.process_frame(None, None if missing[i] else landmarks[i], timestamp)
+            stages[i] = processor.stage
+        recorded_stages = np.array(STAGES, dtype=object)[chunk['stage']]
+        changed_frames += int(np.count_nonzero(stages != recorded_stages))
+
+    stats = processor.get_stats(now=timestamp)
+    stats.pop('feedback')
+    processing_seconds = time.perf_counter() - start
+    summary = dict(
+        type='summary',
+        recording=path,
+        frames=recording.frame_count,
+        changed_frames=changed_frames,
+        processing_seconds=round(processing_seconds, 4),
+        **stats,
+    )
+    return summary, processor.rep_log
+
+
+def count_recording_summary(path, exercise_name=None):
+    """Score one recording with the vectorized counter; returns (summary, rep_log)"""
+    recording = LandmarkRecording(path)
+    start = time.perf_counter()
+    stats = count_recording(recording, exercise_name)
+    rep_log = stats.pop('rep_log')
+    summary = dict(
+        type='summary',
+        recording=path,
+        frames=recording.frame_count,
+        processing_seconds=round(time.perf_counter() - start, 4),
+        **stats,
+    )
+    return summary, rep_log
+
+
+def _replay_job(job):
+    path, exercise_name, include_reps, vectorized = job
+    try:
+        if vectorized:
+            summary, rep_log = count_recording_summary(path, exercise_name)
+        else:
+            summary, rep_log = replay_recording(path, exercise_name)
+    except Exception as e:
+        return [{'type': 'error', 'recording': path, 'error': str(e)}]
+    records = []
+    if include_reps:
+        records = [dict(type='rep', recording=path, exercise=summary['exercise'], **rep) for rep in rep_log]
+    return records + [summary]
+
+
+def collect_recordings(sources):
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(sorted(os.path.join(source, name) for name in os.listdir(source)
+                                if name.endswith('.lmk')))
+        else:
+            paths.append(source)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recordings', nargs='+', help='.lmk files or directories of them')
+    parser.add_argument('--exercise', help='Override the exercise stored in each recording')
+    parser.add_argument('--reps', action='store_true', help='Also emit one record per rep')
+    parser.add_argument('--workers', type=int, default=1, help='Replay recordings in parallel processes')
+    parser.add_argument('--output', help='JSON lines output file (defaults to stdout)')
+    parser.add_argument('--vectorized', action='store_true',
+                        help='Count each recording in one numpy pass (no changed_frames)')
+    args = parser.parse_args()
+
+    jobs = [(path, args.exercise, args.reps, args.vectorized) for path in collect_recordings(args.recordings)]
+    output = open(args.output, 'w') if args.output else sys.stdout
+    start = time.perf_counter()
+    frames = 0
+    try:
+        if args.workers > 1:
+            with multiprocessing.Pool(args.workers) as pool:
+                results = pool.imap_unordered(_replay_job, jobs)
+                frames = _write_records(results, output)
+        else:
+            frames = _write_records(map(_replay_job, jobs), output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {len(jobs)} recordings, {frames} frames in {elapsed:.2f}s "
+          f"({frames / elapsed if elapsed else 0:.0f} frames/s)", file=sys.stderr)
+
+
+def _write_records(results, output):
+    frames = 0
+    for records in results:
+        for record in records:
+            output.write(json.dumps(record) + '\n')
+            frames += record.get('frames', 0) if record['type'] == 'summary' else 0
+    return frames
+
+
+if __name__ == '__main__':
+    main()
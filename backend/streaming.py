@@ -0,0 +1,264 @@
+"""Fan-out of a session's encoded frames to any number of streaming viewers.
+
+The video pipeline runs once per session on its own thread and publishes each
+encoded frame to the session's ``FrameBroadcast``. Viewers never run or block
+the pipeline: they wait for a frame newer than the last one they sent, so a
+viewer that falls behind simply skips to the newest frame and holds at most
+one frame in memory. Threaded servers wait on the broadcast's condition
+(``wait``); async servers register a listener that wakes their event loop
+(see ``asgi.py``).
+
+Frames are encoded once per rendition, not once per viewer: ``RENDITIONS``
+is a ladder of resolutions and JPEG qualities, viewers pick one with the
+``rendition`` query parameter, and the pipeline encodes only the renditions
+someone is currently watching, downscaling through a single image pyramid.
+
+Each viewer also adapts to its own connection. A ``Viewer`` times every send
+against the interval between published frames: a client whose sends take
+longer than that is falling behind, and is stepped down ``VIEWER_LEVELS`` (a
+frame rate cap, then smaller renditions); a client with plenty of headroom is
+stepped back up after a while.
+"""
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+# jpegs: {rendition: encoded bytes} for the renditions being watched; frame_id: source frame index;
+# capture_time: wall-clock capture time; image: the annotated full-size BGR frame
+EncodedFrame = namedtuple('EncodedFrame', ['jpegs', 'frame_id', 'capture_time', 'image'])
+
+MJPEG_BOUNDARY = 'frame'
+MJPEG_MIMETYPE = f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}'
+
+# name -> (pyramid level, JPEG quality); each pyramid level halves width and height
+RENDITIONS = {
+    'full': (0, 80),
+    'half': (1, 70),
+    'quarter': (2, 60),
+}
+RENDITION_NAMES = tuple(RENDITIONS)
+DEFAULT_RENDITION = 'full'
+
+# (renditions below the requested one, max frames per second or None)
+VIEWER_LEVELS = (
+    (0, None),
+    (0, 15),
+    (1, 15),
+    (1, 10),
+    (2, 5),
+)
+# Smoothing of the per-send load and throughput estimates
+LOAD_ALPHA = 0.2
+# Step down when sends take longer than the frame interval, after at least DEGRADE_AFTER seconds at a level
+DEGRADE_LOAD = 1.0
+DEGRADE_AFTER = 1.0
+# Step back up when sends use under UPGRADE_LOAD of the interval for UPGRADE_AFTER seconds
+UPGRADE_LOAD = 0.4
+UPGRADE_AFTER = 5.0
+
+
+class FrameBroadcast:
+    """Latest encoded frame of a session with a sequence number, for any number of viewers"""
+
+    def __init__(self):
+        self.sequence = 0
+        self.latest = None
+        self.closed = False
+        # Smoothed seconds between published frames
+        self.interval = None
+        self.viewers = set()
+        self._last_publish = None
+        self._condition = threading.Condition()
+        self._listeners = set()
+
+    def publish(self, frame):
+        now = time.monotonic()
+        with self._condition:
+            if self._last_publish is not None:
+                elapsed = now - self._last_publish
+                self.interval = elapsed if self.interval is None else self.interval + LOAD_ALPHA * (elapsed - self.interval)
+            self._last_publish = now
+            self.latest = frame
+            self.sequence += 1
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def wait(self, after, timeout=None):
+        """(sequence, frame) of the newest frame published after sequence ``after``
+
+        Returns None once the broadcast is closed, or on timeout.
+        """
+        with self._condition:
+            ready = self._condition.wait_for(lambda: self.closed or self.sequence > after, timeout)
+            if not ready or self.closed:
+                return None
+            return self.sequence, self.latest
+
+    def current(self):
+        """(sequence, frame) of the newest published frame, without waiting"""
+        with self._condition:
+            return self.sequence, self.latest
+
+    def add_listener(self, listener):
+        """Call ``listener()`` (from the pipeline thread) after every publish and on close"""
+        with self._condition:
+            self._listeners.add(listener)
+
+    def remove_listener(self, listener):
+        with self._condition:
+            self._listeners.discard(listener)
+
+    def add_viewer(self, rendition=DEFAULT_RENDITION):
+        viewer = Viewer(self, rendition)
+        with self._condition:
+            self.viewers.add(viewer)
+        return viewer
+
+    def remove_viewer(self, viewer):
+        with self._condition:
+            self.viewers.discard(viewer)
+
+    def wanted_renditions(self):
+        """Renditions at least one viewer is currently sent"""
+        with self._condition:
+            return {viewer.rendition for viewer in self.viewers}
+
+    def viewer_stats(self):
+        with self._condition:
+            viewers = list(self.viewers)
+        return [viewer.stats() for viewer in viewers]
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Viewer:
+    """Delivery state of one streaming client: which frames it skipped and the level it is sent at
+
+    The serving loop calls ``delay()`` before waiting for a frame, ``render()``
+    to build the part to send and ``sent()`` once the send returned.
+    """
+
+    def __init__(self, broadcast, rendition=DEFAULT_RENDITION):
+        if rendition not in RENDITIONS:
+            raise ValueError(f"Unknown rendition {rendition}; expected one of {', '.join(RENDITION_NAMES)}")
+        self.broadcast = broadcast
+        self.requested = rendition
+        self.rendition = rendition
+        self.level = 0
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+        # Send time as a fraction of the frame interval, and bytes per second while sending
+        self.load = 0.0
+        self.throughput = 0.0
+        self._last_sequence = None
+        self._last_send = 0.0
+        self._level_since = time.monotonic()
+
+    def delay(self):
+        """Seconds to wait before taking the next frame, to honor the level's frame rate cap"""
+        max_fps = VIEWER_LEVELS[self.level][1]
+        if not max_fps:
+            return 0.0
+        return max(0.0, self._last_send + 1.0 / max_fps - time.monotonic())
+
+    def render(self, sequence, frame):
+        """The MJPEG part for ``frame`` in this viewer's rendition, or None if it was not encoded
+
+        A rendition is missing only from frames encoded before this viewer
+        joined or changed level; the next frame will carry it.
+        """
+        jpeg = frame.jpegs.get(self.rendition)
+        if jpeg is None:
+            return None
+        if self._last_sequence is not None:
+            self.frames_skipped += max(0, sequence - self._last_sequence - 1)
+        self._last_sequence = sequence
+        return mjpeg_part(jpeg, frame)
+
+    def sent(self, size, seconds):
+        """Account for a part of ``size`` bytes whose send took ``seconds``, and adapt the level"""
+        now = time.monotonic()
+        self._last_send = now
+        self.frames_sent += 1
+        self.bytes_sent += size
+        if seconds > 0:
+            self.throughput += LOAD_ALPHA * (size / seconds - self.throughput)
+
+        max_fps = VIEWER_LEVELS[self.level][1]
+        interval = max(self.broadcast.interval or 0.0, 1.0 / max_fps if max_fps else 0.0)
+        if not interval:
+            return
+        self.load += LOAD_ALPHA * (seconds / interval - self.load)
+        held = now - self._level_since
+        if self.load > DEGRADE_LOAD and held >= DEGRADE_AFTER and self.level < len(VIEWER_LEVELS) - 1:
+            self._set_level(self.level + 1, now)
+        elif self.load < UPGRADE_LOAD and held >= UPGRADE_AFTER and self.level > 0:
+            self._set_level(self.level - 1, now)
+
+    def _set_level(self, level, now):
+        self.level = level
+        step_down = VIEWER_LEVELS[level][0]
+        self.rendition = RENDITION_NAMES[min(RENDITION_NAMES.index(self.requested) + step_down,
+                                             len(RENDITION_NAMES) - 1)]
+        self._level_since = now
+        # Measure the new level from scratch rather than from the old level's sends
+        self.load = (DEGRADE_LOAD + UPGRADE_LOAD) / 2
+
+    def stats(self):
+        return {
+            'requested_rendition': self.requested,
+            'rendition': self.rendition,
+            'level': self.level,
+            'max_fps': VIEWER_LEVELS[self.level][1],
+            'frames_sent': self.frames_sent,
+            'frames_skipped': self.frames_skipped,
+            'throughput_kbps': round(self.throughput * 8 / 1000, 1),
+            'load': round(self.load, 2),
+        }
+
+
+def encode_renditions(image, renditions):
+    """{rendition: JPEG bytes} for the requested renditions of a BGR image
+
+    Smaller renditions come from a pyramid built only as deep as the smallest
+    one requested, each level downscaled from the previous one.
+    """
+    if not renditions:
+        return {}
+    pyramid = [image]
+    for _ in range(max(RENDITIONS[name][0] for name in renditions)):
+        previous = pyramid[-1]
+        size = (max(1, previous.shape[1] // 2), max(1, previous.shape[0] // 2))
+        pyramid.append(cv2.resize(previous, size, interpolation=cv2.INTER_AREA))
+
+    jpegs = {}
+    for name in renditions:
+        level, quality = RENDITIONS[name]
+        ret, buffer = cv2.imencode('.jpg', pyramid[level], [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ret:
+            jpegs[name] = buffer.tobytes()
+    return jpegs
+
+
+def mjpeg_part(jpeg, frame):
+    """One multipart/x-mixed-replace part carrying the frame id and capture time as headers"""
+    headers = (f'--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n'
+               f'X-Frame-Id: {frame.frame_id}\r\nX-Frame-Timestamp: {frame.capture_time:.6f}\r\n\r\n')
+    return headers.encode() + jpeg + b'\r\n'
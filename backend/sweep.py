@@ -0,0 +1,175 @@
+"""Search stage thresholds against a labeled corpus of landmark recordings.
+
+    python sweep.py corpus.jsonl --best thresholds.json --output sweep.jsonl
+    python sweep.py corpus.jsonl --exercise squats --span 30 --step 2 --workers 16
+
+The corpus is a JSON lines manifest of ``{"recording": "a.lmk", "reps": 12}``
+entries (``exercise`` defaults to the one stored in the recording; relative
+paths are resolved against the manifest). By default every threshold of an
+exercise is swept over ``default +- span`` in ``step`` degree increments; a
+``--grid`` JSON file of ``{"squats": {"up": [150, 155], "down": [90, 100]}}``
+sets the values explicitly; thresholds it leaves out keep their current value.
+
+Each worker process loads the recordings once as ``vectorized.ExerciseTrace``s,
+so every configuration only re-runs the stage hysteresis over precomputed angle
+series. A configuration scores by the share of traces whose rep count matches
+the label exactly, then by mean absolute error. ``--best`` writes the winning
+thresholds per exercise in the format ``STAGE_THRESHOLDS_FILE`` reads.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from landmark_store import LandmarkRecording
+from processor import STAGE_THRESHOLDS, stage_thresholds
+from vectorized import load_recording_trace
+
+
+def load_corpus(manifest_path):
+    """List (recording, exercise, true_reps) from a JSON lines manifest"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    corpus = []
+    with open(manifest_path) as manifest:
+        for line in manifest:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            path = os.path.join(base, entry['recording'])
+            exercise = entry.get('exercise') or LandmarkRecording(path).exercise_name
+            corpus.append((path, exercise, int(entry['reps'])))
+    return corpus
+
+
+def default_grid(exercise_name, span, step):
+    """Every threshold of an exercise over its current value +- span"""
+    return {key: [round(v, 3) for v in np.arange(value - span, value + span + step / 2, step).tolist()]
+            for key, value in stage_thresholds(exercise_name).items()}
+
+
+def grid_configs(grid):
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+# Per-process corpus and the traces loaded from it, filled by init_worker and _traces_for
+_corpus = None
+_traces = {}
+
+
+def init_worker(corpus):
+    global _corpus
+    _corpus = corpus
+
+
+def _traces_for(exercise_name):
+    if exercise_name not in _traces:
+        _traces[exercise_name] = [load_recording_trace(LandmarkRecording(path), exercise)
+                                  for path, exercise, _ in _corpus if exercise == exercise_name]
+    return _traces[exercise_name]
+
+
+def _count_configs(job):
+    """Rep counts of every trace of one exercise under each configuration"""
+    exercise_name, configs = job
+    traces = _traces_for(exercise_name)
+    return exercise_name, [(config, [trace.count(config) for trace in traces]) for config in configs]
+
+
+def score(counts, truth):
+    counts = np.asarray(counts)
+    return {
+        'exact': round(float(np.mean(counts == truth)), 4),
+        'mean_abs_error': round(float(np.mean(np.abs(counts - truth))), 4),
+    }
+
+
+def _rank_key(result, defaults):
+    # Best exact-match rate, then lowest error, then the smallest move from the current thresholds
+    distance = sum(abs(result['thresholds'][key] - defaults[key]) for key in defaults)
+    return (-result['exact'], result['mean_abs_error'], distance)
+
+
+def run_sweep(corpus, grids, workers=None, chunk_size=64):
+    """Evaluate every grid configuration; returns {exercise: results sorted best first}"""
+    jobs = []
+    for exercise_name, grid in grids.items():
+        # A grid may sweep only some thresholds; the others keep their current values
+        defaults = stage_thresholds(exercise_name)
+        configs = [dict(defaults, **config) for config in grid_configs(grid)]
+        jobs.extend((exercise_name, configs[i:i + chunk_size]) for i in range(0, len(configs), chunk_size))
+
+    truth = {exercise_name: np.array([reps for _, exercise, reps in corpus if exercise == exercise_name])
+             for exercise_name in grids}
+    results = {exercise_name: [] for exercise_name in grids}
+    with multiprocessing.Pool(workers or os.cpu_count(), initializer=init_worker, initargs=(corpus,)) as pool:
+        for exercise_name, counted in pool.imap_unordered(_count_configs, jobs):
+            for config, counts in counted:
+                results[exercise_name].append(dict(exercise=exercise_name, thresholds=config,
+                                                   traces=len(counts), **score(counts, truth[exercise_name])))
+
+    for exercise_name, exercise_results in results.items():
+        exercise_results.sort(key=lambda result: _rank_key(result, stage_thresholds(exercise_name)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', help='JSON lines manifest of {"recording", "reps", "exercise"?}')
+    parser.add_argument('--exercise', nargs='+', help='Only sweep these exercises')
+    parser.add_argument('--grid', help='JSON file of {exercise: {threshold: [values]}}')
+    parser.add_argument('--span', type=float, default=20, help='Default grid: degrees either side of the current value')
+    parser.add_argument('--step', type=float, default=2, help='Default grid: degrees between values')
+    parser.add_argument('--workers', type=int, help='Worker processes (defaults to all cores)')
+    parser.add_argument('--output', help='JSON lines file with the score of every configuration')
+    parser.add_argument('--best', help='Write the best thresholds per exercise to this JSON file')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    exercises = sorted({exercise for _, exercise, _ in corpus if STAGE_THRESHOLDS.get(exercise)})
+    if args.exercise:
+        exercises = [exercise for exercise in exercises if exercise in args.exercise]
+    if args.grid:
+        with open(args.grid) as f:
+            grids = {exercise: grid for exercise, grid in json.load(f).items() if exercise in exercises}
+    else:
+        grids = {exercise: default_grid(exercise, args.span, args.step) for exercise in exercises}
+
+    start = time.perf_counter()
+    results = run_sweep(corpus, grids, args.workers)
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            for exercise_results in results.values():
+                for result in exercise_results:
+                    output.write(json.dumps(result) + '\n')
+
+    best = {}
+    configs = 0
+    for exercise_name, exercise_results in results.items():
+        configs += len(exercise_results)
+        defaults = stage_thresholds(exercise_name)
+        if not exercise_results:
+            print(f"{exercise_name}: no configurations in the grid", file=sys.stderr)
+            continue
+        current = next((result for result in exercise_results if result['thresholds'] == defaults), None)
+        winner = exercise_results[0]
+        best[exercise_name] = winner['thresholds']
+        current_text = f"{current['exact']:.1%} exact" if current else 'not in grid'
+        print(f"{exercise_name}: {winner['traces']} traces, best {winner['thresholds']} "
+              f"{winner['exact']:.1%} exact, MAE {winner['mean_abs_error']:.2f} (current {defaults}: {current_text})")
+    print(f"Evaluated {configs} configurations in {elapsed:.1f}s", file=sys.stderr)
+
+    if args.best:
+        with open(args.best, 'w') as f:
+            json.dump(best, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
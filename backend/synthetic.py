@@ -0,0 +1,414 @@
+"""Synthetic workouts: rep motion for every exercise as landmark streams or rendered video.
+
+    python synthetic.py landmarks squats --traces 50 --reps 12 --output-dir corpus/
+    python synthetic.py video squats squats.mp4 --reps 10 --noise 0.004
+
+A side-on stick figure is posed from a few segment angles (torso, upper arm,
+elbow, thigh, knee) and eased from the exercise's rest pose to its peak pose
+and back once per rep, so every angle the exercise logic measures sweeps
+through its stage thresholds. Tempo, landmark noise, occlusion bursts and the
+share of reps done with the exercise's typical fault are all parameters; each
+trace carries its ground truth (which reps were faulty and which should count).
+
+``landmarks`` writes ``.lmk`` recordings plus a ``corpus.jsonl`` manifest that
+``sweep.py`` reads. ``video`` renders the figure for end-to-end pipeline runs;
+pose models are not trained on stick figures, so check counting accuracy on the
+landmark streams and use videos for throughput. ``SyntheticCapture`` plays a
+rendered workout in real time behind the ``cv2.VideoCapture`` interface, which
+is how the backend runs without a webcam (``"source": "synthetic"``).
+"""
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from landmarks import LANDMARK_INDEX, LANDMARK_NAMES, NUM_LANDMARKS, POSE_CONNECTIONS
+
+# Segment lengths as a fraction of frame height
+SEGMENTS = {'torso': 0.26, 'neck': 0.09, 'upper_arm': 0.14, 'forearm': 0.12, 'thigh': 0.2, 'shin': 0.2}
+
+# Pose parameters, in degrees. torso, upper_arm, thigh and back_thigh are segment
+# directions in image coordinates (0 points right, the way the figure faces; 90
+# points down); elbow, knee and back_knee are interior joint angles (180 is
+# straight). The right arm follows the left; the right leg uses the back_* values.
+STANDING = {'torso': -90, 'upper_arm': 90, 'elbow': 175, 'thigh': 90, 'knee': 175}
+
+# rest: pose that enters the first stage; peak: pose that counts the rep;
+# fault: (name, peak pose with the exercise's typical fault, whether the counter should still count it)
+EXERCISES = {
+    'bicep_curl': {
+        'rest': STANDING,
+        'peak': {'elbow': 20},
+        'fault': ('elbows_forward', {'elbow': 20, 'upper_arm': 40}, True),
+        'anchor': ('LEFT_ANKLE', (0.5, 0.9)), 'scale': 1.0,
+    },
+    'squats': {
+        'rest': STANDING,
+        'peak': {'torso': -75, 'thigh': 15, 'knee': 80, 'upper_arm': 0},
+        'fault': ('chest_forward', {'torso': -30, 'thigh': 15, 'knee': 80, 'upper_arm': 0}, True),
+        'anchor': ('LEFT_ANKLE', (0.5, 0.9)), 'scale': 1.0,
+    },
+    'overhead_press': {
+        'rest': dict(STANDING, upper_arm=30, elbow=70),
+        'peak': {'upper_arm': -95, 'elbow': 175},
+        'fault': ('press_forward', {'upper_arm': -60, 'elbow': 175}, True),
+        'anchor': ('LEFT_ANKLE', (0.5, 0.9)), 'scale': 1.0,
+    },
+    'lateral_raises': {
+        'rest': dict(STANDING, upper_arm=80, elbow=170),
+        'peak': {'upper_arm': 0},
+        'fault': ('bent_elbows', {'upper_arm': 0, 'elbow': 130}, True),
+        'anchor': ('LEFT_ANKLE', (0.5, 0.9)), 'scale': 1.0,
+    },
+    'lunges': {
+        'rest': STANDING,
+        'peak': {'thigh': 5, 'knee': 90, 'back_thigh': 100, 'back_knee': 80},
+        'fault': ('shallow_back_knee', {'thigh': 5, 'knee': 90, 'back_thigh': 100, 'back_knee': 130}, True),
+        'anchor': ('LEFT_ANKLE', (0.55, 0.9)), 'scale': 1.0,
+    },
+    'pullups': {
+        'rest': {'torso': -90, 'upper_arm': -90, 'elbow': 175, 'thigh': 90, 'knee': 170},
+        'peak': {'upper_arm': 60, 'elbow': 50},
+        'fault': ('half_rep', {'upper_arm': -10, 'elbow': 125}, False),
+        'anchor': ('LEFT_WRIST', (0.5, 0.1)), 'scale': 0.8,
+    },
+    'pushups': {
+        'rest': {'torso': -5, 'upper_arm': 90, 'elbow': 175, 'thigh': 175, 'knee': 178},
+        'peak': {'upper_arm': 150, 'elbow': 70},
+        'fault': ('sagging_hips', {'upper_arm': 150, 'elbow': 70, 'torso': -20, 'thigh': 200}, True),
+        'anchor': ('LEFT_WRIST', (0.72, 0.85)), 'scale': 0.9,
+    },
+    'glute_bridges': {
+        'rest': {'torso': 180, 'upper_arm': 0, 'elbow': 175, 'thigh': -45, 'knee': 70},
+        'peak': {'torso': 160, 'thigh': -10},
+        'fault': ('low_hips', {'torso': 175, 'thigh': -40}, False),
+        'anchor': ('LEFT_ANKLE', (0.75, 0.85)), 'scale': 0.9,
+    },
+    'crunches': {
+        'rest': {'torso': 180, 'upper_arm': -45, 'elbow': 60, 'thigh': -10, 'knee': 120},
+        'peak': {'torso': 220},
+        'fault': ('shallow_crunch', {'torso': 190}, False),
+        'anchor': ('LEFT_HIP', (0.55, 0.8)), 'scale': 0.9,
+    },
+    'plank': {
+        'rest': {'torso': -5, 'upper_arm': 90, 'elbow': 90, 'thigh': 175, 'knee': 178},
+        'peak': {},
+        'fault': ('sagging_hips', {'torso': -20, 'thigh': 200}, False),
+        'anchor': ('LEFT_ELBOW', (0.72, 0.85)), 'scale': 0.9,
+    },
+}
+
+# Joints hidden together by an occlusion burst, on both sides
+OCCLUSION_GROUPS = {
+    'arms': [i for i, name in enumerate(LANDMARK_NAMES)
+             if name.split('_', 1)[-1] in ('SHOULDER', 'ELBOW', 'WRIST', 'PINKY', 'INDEX', 'THUMB')],
+    'legs': [i for i, name in enumerate(LANDMARK_NAMES)
+             if name.split('_', 1)[-1] in ('HIP', 'KNEE', 'ANKLE', 'HEEL', 'FOOT_INDEX')],
+}
+
+SyntheticTrace = namedtuple('SyntheticTrace', ['exercise', 'timestamps', 'landmarks', 'reps', 'occluded'])
+
+
+def _direction(degrees):
+    radians = np.radians(degrees)
+    return np.stack([np.cos(radians), np.sin(radians)], axis=-1)
+
+
+def _skeleton(pose, scale):
+    """(T, 33, 2) landmark positions relative to the left hip from per-frame pose parameters"""
+    frames = len(pose['torso'])
+    points = np.zeros((frames, NUM_LANDMARKS, 2))
+    length = {name: value * scale for name, value in SEGMENTS.items()}
+    torso = _direction(pose['torso'])
+    face = _direction(pose['torso'] + 90)
+
+    def place(name, position):
+        points[:, LANDMARK_INDEX[name]] = position
+
+    hip = np.zeros((frames, 2))
+    shoulder = hip + length['torso'] * torso
+    nose = shoulder + length['neck'] * torso + 0.03 * scale * face
+    place('NOSE', nose)
+    for side, back in (('LEFT', 0.0), ('RIGHT', 0.01)):
+        place(f'{side}_EYE_INNER', nose + 0.015 * scale * torso - (0.005 + back) * scale * face)
+        place(f'{side}_EYE', nose + 0.017 * scale * torso - (0.01 + back) * scale * face)
+        place(f'{side}_EYE_OUTER', nose + 0.018 * scale * torso - (0.015 + back) * scale * face)
+        place(f'{side}_EAR', nose + 0.01 * scale * torso - (0.04 + back) * scale * face)
+        place(f'MOUTH_{side}', nose - 0.02 * scale * torso - (0.005 + back) * scale * face)
+
+    # The far (right) side sits slightly behind the near side
+    for side, thigh, knee, depth in (('LEFT', pose['thigh'], pose['knee'], 0.0),
+                                     ('RIGHT', pose['back_thigh'], pose['back_knee'], -0.012 * scale)):
+        offset = np.array([depth, 0.0])
+        elbow = shoulder + length['upper_arm'] * _direction(pose['upper_arm'])
+        forearm = pose['upper_arm'] - (180 - pose['elbow'])
+        wrist = elbow + length['forearm'] * _direction(forearm)
+        place(f'{side}_SHOULDER', shoulder + offset)
+        place(f'{side}_ELBOW', elbow + offset)
+        place(f'{side}_WRIST', wrist + offset)
+        for name, spread in (('PINKY', -15), ('INDEX', 0), ('THUMB', 25)):
+            place(f'{side}_{name}', wrist + 0.03 * scale * _direction(forearm + spread) + offset)
+
+        shin = thigh + (180 - knee)
+        knee_point = hip + length['thigh'] * _direction(thigh)
+        ankle = knee_point + length['shin'] * _direction(shin)
+        place(f'{side}_HIP', hip + offset)
+        place(f'{side}_KNEE', knee_point + offset)
+        place(f'{side}_ANKLE', ankle + offset)
+        place(f'{side}_HEEL', ankle + 0.02 * scale * _direction(shin + 90) + offset)
+        place(f'{side}_FOOT_INDEX', ankle + 0.05 * scale * _direction(shin - 90) + offset)
+    return points
+
+
+def _rep_schedule(reps, fps, tempo, pause, tempo_jitter, fault_rate, rng):
+    """Per-rep (start, duration, faulty) with a second of rest before the first and after the last"""
+    schedule = []
+    t = 1.0
+    for _ in range(reps):
+        duration = tempo * (1 + tempo_jitter * rng.uniform(-1, 1))
+        schedule.append((t, duration, bool(rng.random() < fault_rate)))
+        t += duration + pause
+    return schedule, t - pause + 1.0
+
+
+def generate_trace(exercise_name, reps=10, fps=30.0, tempo=2.0, pause=0.5, tempo_jitter=0.1,
+                   noise=0.003, occlusion=0.0, fault_rate=0.0, seed=None):
+    """Synthesize one workout as a ``SyntheticTrace``
+
+    ``tempo`` is seconds per rep and ``pause`` the rest between reps; ``noise``
+    is the standard deviation of landmark jitter in normalized coordinates;
+    ``occlusion`` is the expected number of occlusion bursts (0.2-1 s, arms or
+    legs hidden) per second; ``fault_rate`` is the share of faulty reps.
+    For plank each "rep" is a hold cycle whose faulty ones sag.
+    """
+    if exercise_name not in EXERCISES:
+        raise ValueError(f"Exercise {exercise_name} not found")
+    spec = EXERCISES[exercise_name]
+    rng = np.random.default_rng(seed)
+
+    schedule, duration = _rep_schedule(reps, fps, tempo, pause, tempo_jitter, fault_rate, rng)
+    timestamps = np.arange(int(duration * fps)) / fps
+
+    rest = dict(spec['rest'])
+    rest.setdefault('back_thigh', rest['thigh'])
+    rest.setdefault('back_knee', rest['knee'])
+    pose = {name: np.full(len(timestamps), float(value)) for name, value in rest.items()}
+    fault_name, fault_pose, fault_counts = spec['fault']
+    rep_records = []
+    for start, rep_duration, faulty in schedule:
+        active = (timestamps >= start) & (timestamps < start + rep_duration)
+        # Ease out to the peak and back: 0 at rest, 1 at the peak
+        progress = (1 - np.cos(2 * np.pi * (timestamps[active] - start) / rep_duration)) / 2
+        target = fault_pose if faulty else spec['peak']
+        for name, value in target.items():
+            pose[name][active] = rest[name] + progress * (value - rest[name])
+        rep_records.append({
+            'start': round(start, 3),
+            'peak': round(start + rep_duration / 2, 3),
+            'end': round(start + rep_duration, 3),
+            'fault': fault_name if faulty else None,
+            'counts': exercise_name != 'plank' and (fault_counts or not faulty),
+        })
+
+    if not any('back_thigh' in p for p in (spec['rest'], spec['peak'], fault_pose)):
+        # Both legs move together unless the exercise poses the back leg itself
+        pose['back_thigh'], pose['back_knee'] = pose['thigh'], pose['knee']
+
+    anchor, anchor_position = spec['anchor']
+    points = _skeleton(pose, spec['scale'])
+    points += np.array(anchor_position) - points[:, LANDMARK_INDEX[anchor]][:, None]
+    points += rng.normal(0.0, noise, points.shape)
+
+    landmarks = np.zeros((len(timestamps), NUM_LANDMARKS, 4))
+    landmarks[..., :2] = points
+    right = np.array([name.startswith('RIGHT') or name == 'MOUTH_RIGHT' for name in LANDMARK_NAMES])
+    landmarks[..., 2] = np.where(right, 0.05, -0.05)
+    # The near side faces the camera, so it is always the better-visible one
+    landmarks[..., 3] = np.where(right, rng.uniform(0.7, 0.85, points.shape[:2]),
+                                 rng.uniform(0.9, 1.0, points.shape[:2]))
+
+    occluded = np.zeros(len(timestamps), dtype=bool)
+    t = rng.exponential(1 / occlusion) if occlusion > 0 else duration
+    while t < duration:
+        burst = (timestamps >= t) & (timestamps < t + rng.uniform(0.2, 1.0))
+        group = OCCLUSION_GROUPS[rng.choice(list(OCCLUSION_GROUPS))]
+        hidden = landmarks[burst][:, group]
+        hidden[..., :2] += rng.normal(0.0, 0.05, hidden[..., :2].shape)
+        hidden[..., 3] = rng.uniform(0.05, 0.3, hidden.shape[:2])
+        landmarks[np.ix_(burst, group)] = hidden
+        occluded |= burst
+        t += rng.exponential(1 / occlusion)
+
+    return SyntheticTrace(exercise_name, timestamps, landmarks, rep_records, occluded)
+
+
+def expected_reps(trace):
+    """Reps the counter should count in a trace"""
+    return sum(rep['counts'] for rep in trace.reps)
+
+
+_RIGHT_CONNECTIONS = [(a, b) for a, b in POSE_CONNECTIONS
+                      if LANDMARK_NAMES[a].startswith('RIGHT') and LANDMARK_NAMES[b].startswith('RIGHT')]
+_NEAR_CONNECTIONS = [connection for connection in POSE_CONNECTIONS if connection not in _RIGHT_CONNECTIONS]
+
+
+def render_frame(landmarks, width=640, height=480, image=None):
+    """Draw a (33, 4) landmark array as a filled-out stick figure on a BGR frame"""
+    if image is None:
+        image = np.full((height, width, 3), 70, dtype=np.uint8)
+        cv2.line(image, (0, int(0.9 * height)), (width, int(0.9 * height)), (110, 110, 110), 2)
+    points = np.round(landmarks[:, :2] * (width, height)).astype(int).tolist()
+    visible = landmarks[:, 3] >= 0.5
+    thickness = max(2, height // 40)
+    for connections, color in ((_RIGHT_CONNECTIONS, (120, 150, 190)), (_NEAR_CONNECTIONS, (160, 200, 240))):
+        for a, b in connections:
+            if visible[a] and visible[b]:
+                cv2.line(image, tuple(points[a]), tuple(points[b]), color, thickness, cv2.LINE_AA)
+    if visible[0]:
+        cv2.circle(image, tuple(points[0]), max(4, height // 22), (160, 200, 240), -1, cv2.LINE_AA)
+    return image
+
+
+def write_video(path, trace, width=640, height=480, fps=30.0):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise ValueError(f"Could not open {path} for writing")
+    try:
+        for landmarks in trace.landmarks:
+            writer.write(render_frame(landmarks, width, height))
+    finally:
+        writer.release()
+
+
+def write_recording(path, trace):
+    """Save a trace as a ``.lmk`` recording, with stages and feedback from the live logic"""
+    from landmark_store import LandmarkRecorder
+    from processor import ExerciseProcessor
+
+    processor = ExerciseProcessor(trace.exercise)
+    processor.reset_state(start_time=0.0)
+    with LandmarkRecorder(path, trace.exercise, {'start_time': 0.0, 'synthetic': True}) as recorder:
+        for timestamp, landmarks in zip(trace.timestamps.tolist(), trace.landmarks):
+            processor.process_frame(None, landmarks, timestamp)
+            recorder.append(timestamp, landmarks, processor.stage, processor.feedback_list)
+
+
+class SyntheticCapture:
+    """Plays a looping synthetic workout in real time with the ``cv2.VideoCapture`` interface"""
+
+    def __init__(self, exercise_name, width=640, height=480, fps=30.0, reps=20, **options):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.trace = generate_trace(exercise_name, reps=reps, fps=fps, **options)
+        self.frame_index = 0
+        self.opened = True
+        self._start = None
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now
+        # Pace to the trace's frame rate, like a camera would
+        delay = self._start + self.frame_index / self.fps - now
+        if delay > 0:
+            time.sleep(delay)
+        landmarks = self.trace.landmarks[self.frame_index % len(self.trace.landmarks)]
+        self.frame_index += 1
+        return True, render_frame(landmarks, self.width, self.height)
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FPS: self.fps, cv2.CAP_PROP_FRAME_WIDTH: self.width,
+                cv2.CAP_PROP_FRAME_HEIGHT: self.height}.get(prop, 0.0)
+
+    def release(self):
+        self.opened = False
+
+
+def parse_synthetic_options(spec):
+    """Options from a ``synthetic:tempo=2.5,noise=0.01`` source string; values are numbers or exercise names"""
+    options = {}
+    _, _, params = spec.partition(':')
+    for item in filter(None, params.split(',')):
+        key, _, value = item.partition('=')
+        try:
+            options[key.strip()] = int(value) if value.strip().lstrip('-').isdigit() else float(value)
+        except ValueError:
+            options[key.strip()] = value.strip()
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_motion_arguments(subparser):
+        subparser.add_argument('exercise', choices=sorted(EXERCISES))
+        subparser.add_argument('--reps', type=int, default=10)
+        subparser.add_argument('--fps', type=float, default=30.0)
+        subparser.add_argument('--tempo', type=float, default=2.0, help='Seconds per rep')
+        subparser.add_argument('--pause', type=float, default=0.5, help='Seconds of rest between reps')
+        subparser.add_argument('--noise', type=float, default=0.003, help='Landmark jitter (normalized units)')
+        subparser.add_argument('--occlusion', type=float, default=0.0, help='Occlusion bursts per second')
+        subparser.add_argument('--fault-rate', type=float, default=0.0, help='Share of reps done with a form fault')
+        subparser.add_argument('--seed', type=int)
+
+    landmark_parser = subparsers.add_parser('landmarks', help='Write .lmk recordings and a labeled corpus manifest')
+    add_motion_arguments(landmark_parser)
+    landmark_parser.add_argument('--traces', type=int, default=1)
+    landmark_parser.add_argument('--output-dir', required=True)
+
+    video_parser = subparsers.add_parser('video', help='Render a workout to a video file')
+    add_motion_arguments(video_parser)
+    video_parser.add_argument('output')
+    video_parser.add_argument('--width', type=int, default=640)
+    video_parser.add_argument('--height', type=int, default=480)
+    args = parser.parse_args()
+
+    options = dict(reps=args.reps, fps=args.fps, tempo=args.tempo, pause=args.pause, noise=args.noise,
+                   occlusion=args.occlusion, fault_rate=args.fault_rate)
+    if args.command == 'video':
+        trace = generate_trace(args.exercise, seed=args.seed, **options)
+        write_video(args.output, trace, args.width, args.height, args.fps)
+        print(f"Wrote {len(trace.timestamps)} frames, {expected_reps(trace)} countable reps to {args.output}")
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    seeds = np.random.SeedSequence(args.seed).spawn(args.traces)
+    rows = {}
+    for index, seed in enumerate(seeds):
+        trace = generate_trace(args.exercise, seed=seed, **options)
+        name = f"{args.exercise}-{index:04d}.lmk"
+        write_recording(os.path.join(args.output_dir, name), trace)
+        rows[name] = {
+            'recording': name,
+            'exercise': args.exercise,
+            'reps': expected_reps(trace),
+            'good_reps': sum(rep['counts'] and not rep['fault'] for rep in trace.reps),
+        }
+
+    # Other exercises' rows stay, so one directory can collect a mixed corpus; rows for
+    # the recordings just overwritten are replaced, never duplicated with stale labels
+    manifest_path = os.path.join(args.output_dir, 'corpus.jsonl')
+    kept = []
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest:
+            kept = [line for line in manifest if line.strip() and json.loads(line)['recording'] not in rows]
+    with open(manifest_path + '.tmp', 'w') as manifest:
+        manifest.writelines(kept)
+        manifest.writelines(json.dumps(row) + '\n' for row in rows.values())
+    os.replace(manifest_path + '.tmp', manifest_path)
+    print(f"Wrote {args.traces} {args.exercise} recordings to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
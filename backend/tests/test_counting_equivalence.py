@@ -0,0 +1,70 @@
+"""The fast counting paths must reproduce the per-frame ExerciseProcessor exactly"""
+import pytest
+
+import analyze
+from pose_backends import PoseBackend
+from processor import ExerciseProcessor
+from synthetic import EXERCISES, generate_trace
+from vectorized import count_reps
+
+
+def per_frame_stats(trace):
+    processor = ExerciseProcessor(trace.exercise)
+    processor.reset_state(start_time=0.0)
+    for timestamp, landmarks in zip(trace.timestamps.tolist(), trace.landmarks):
+        processor.process_frame(None, landmarks, timestamp)
+    stats = processor.get_stats(now=float(trace.timestamps[-1]))
+    stats.pop('feedback')
+    return dict(stats, rep_log=processor.rep_log)
+
+
+@pytest.mark.parametrize('exercise_name', sorted(EXERCISES))
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_vectorized_counter_matches_per_frame(exercise_name, seed):
+    trace = generate_trace(exercise_name, reps=12, fault_rate=0.3, occlusion=0.2, seed=seed)
+    vectorized = count_reps(trace.landmarks, trace.timestamps, exercise_name, start_time=0.0)
+    assert vectorized == per_frame_stats(trace)
+
+
+class TracePose(PoseBackend):
+    """Returns a synthetic trace's landmarks for the frame index passed as the image"""
+
+    name = 'trace'
+
+    def __init__(self, trace):
+        super().__init__()
+        self.trace = trace
+
+    def submit(self, image, timestamp_ms):
+        self._publish(self.trace.landmarks[image], timestamp_ms)
+
+
+class SerialPool:
+    def map(self, function, jobs):
+        return [function(job) for job in jobs]
+
+
+def without_timing(records):
+    return [{key: value for key, value in record.items()
+             if key not in ('processing_seconds', 'processing_fps', 'segments')} for record in records]
+
+
+@pytest.mark.parametrize('exercise_name', ['squats', 'bicep_curl', 'lunges', 'plank'])
+@pytest.mark.parametrize('segments,overlap', [(3, 0), (4, 30), (7, 5)])
+def test_segmented_analysis_matches_unsegmented(monkeypatch, exercise_name, segments, overlap):
+    # Smoothing state differs across a cut by design; only the stitching must be exact
+    monkeypatch.setenv('LANDMARK_FILTER', 'none')
+    trace = generate_trace(exercise_name, reps=15, fault_rate=0.3, seed=3)
+    timestamps = trace.timestamps.tolist()
+
+    def decode_frames(path, start_frame=0, end_frame=None):
+        for index in range(start_frame, len(timestamps) if end_frame is None else end_frame):
+            yield index, timestamps[index], index
+
+    monkeypatch.setattr(analyze, 'decode_frames', decode_frames)
+    monkeypatch.setattr(analyze, 'probe_video', lambda path: (30.0, len(timestamps)))
+    monkeypatch.setattr(analyze, '_worker_pose', TracePose(trace))
+
+    whole = list(analyze.analyze_video('trace', exercise_name, TracePose(trace)))
+    stitched = list(analyze.analyze_video_segmented('trace', exercise_name, SerialPool(), segments, overlap))
+    assert without_timing(stitched) == without_timing(whole)
@@ -0,0 +1,51 @@
+"""Every counted rep is reported once as a rep_completed event"""
+import numpy as np
+import pytest
+
+from events import REP_COMPLETED, REP_STARTED
+from processor import ExerciseProcessor
+from synthetic import EXERCISES, generate_trace
+
+
+def collect_events(processor):
+    events = []
+    processor.on_event = lambda event_type, **fields: events.append(dict(fields, type=event_type))
+    return events
+
+
+def completed_reps(events):
+    return [event['rep'] for event in events if event['type'] == REP_COMPLETED]
+
+
+def test_one_frame_crossings_complete_every_rep():
+    # Bicep curl: down past 160 degrees, counted below 30. The angle is back down for
+    # a single frame after rep 1 and curled for a single frame for rep 2
+    angles = [170, 120, 25, 165, 25, 170, 170]
+    processor = ExerciseProcessor('bicep_curl')
+    processor.reset_state(start_time=0.0)
+    events = collect_events(processor)
+    landmarks = np.full((33, 4), 0.5)
+    landmarks[:, 3] = 1.0
+    for frame, angle in enumerate(angles):
+        processor.calculate_angle = lambda a, b, c: float(angle)
+        processor.process_frame(None, landmarks, frame / 30.0)
+
+    assert processor.counter == 2
+    assert completed_reps(events) == [1, 2]
+    assert [event['rep'] for event in events if event['type'] == REP_STARTED] == [1, 2]
+
+
+@pytest.mark.parametrize('exercise_name', sorted(set(EXERCISES) - {'plank'}))
+def test_synthetic_reps_complete_once(exercise_name):
+    trace = generate_trace(exercise_name, reps=12, tempo=0.4, pause=0.0, fault_rate=0.3, seed=4)
+    processor = ExerciseProcessor(exercise_name)
+    processor.reset_state(start_time=0.0)
+    events = collect_events(processor)
+    for timestamp, landmarks in zip(trace.timestamps.tolist(), trace.landmarks):
+        processor.process_frame(None, landmarks, timestamp)
+
+    reps = completed_reps(events)
+    assert reps == sorted(set(reps))
+    # The last rep may still be on its way back when the trace ends
+    assert processor.counter - len(reps) in (0, 1)
+    assert processor.counter > 0
@@ -0,0 +1,80 @@
+"""Optional span tracing of the video pipeline, exported as Chrome trace-event JSON.
+
+When enabled, the pipeline records one span per stage of every frame (the
+``StageTimer`` laps of the video loop), per frame read on each source reader
+thread and per micro-batch on the shared TFLite batcher. Spans carry thread,
+stage, frame id, session, start and duration, and go into a bounded ring
+buffer so a long-running server only ever holds the most recent ones.
+
+The export loads in ``chrome://tracing`` or https://ui.perfetto.dev, one track
+per thread: stalls, time spent waiting for frames and GIL contention between
+sessions sharing a node show up as gaps and stretched spans that the
+``/metrics`` histograms average away.
+
+Tracing is off unless ``PIPELINE_TRACE=1`` or it is switched on through
+``/api/admin/trace``; while off, each hook costs one attribute check.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_CAPACITY = 200000
+
+enabled = os.environ.get('PIPELINE_TRACE', '0') == '1'
+_spans = deque(maxlen=int(os.environ.get('PIPELINE_TRACE_SPANS', DEFAULT_CAPACITY)))
+_thread_names = {}
+
+
+def record(name, start, duration, frame=None, session=None, category='pipeline', **args):
+    """Record a finished span; ``start`` and ``duration`` in ``time.perf_counter()`` seconds"""
+    thread_id = threading.get_ident()
+    if thread_id not in _thread_names:
+        _thread_names[thread_id] = threading.current_thread().name
+    _spans.append((name, category, thread_id, start, duration, frame, session, args))
+
+
+def configure(enable=None, capacity=None, clear=False):
+    """Switch tracing on or off, resize the ring buffer or drop recorded spans"""
+    global enabled, _spans
+    if capacity is not None:
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        _spans = deque(_spans, maxlen=capacity)
+    if clear:
+        _spans.clear()
+    if enable is not None:
+        enabled = bool(enable)
+    return status()
+
+
+def status():
+    return {'enabled': enabled, 'spans': len(_spans), 'capacity': _spans.maxlen}
+
+
+def export():
+    """Recorded spans as a Chrome trace-event JSON object (timestamps in microseconds)"""
+    # deque.copy runs without releasing the GIL, so recording threads cannot interleave
+    spans = _spans.copy()
+    pid = os.getpid()
+    origin = min((span[3] for span in spans), default=time.perf_counter())
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'ai-exercise backend'}}]
+    events.extend({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': name}}
+                  for thread_id, name in list(_thread_names.items()))
+    for name, category, thread_id, start, duration, frame, session, args in spans:
+        event_args = dict(args)
+        if frame is not None:
+            event_args['frame'] = frame
+        if session is not None:
+            event_args['session'] = session
+        events.append({
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'pid': pid,
+            'tid': thread_id,
+            'ts': round((start - origin) * 1e6, 1),
+            'dur': round(duration * 1e6, 1),
+            'args': event_args,
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
@@ -0,0 +1,267 @@
+"""Whole-trace rep counting over (T, 33, 4) landmark tensors.
+
+``count_reps`` reproduces ``ExerciseProcessor`` frame for frame, but computes
+every angle time series in one numpy pass and resolves the stage state machine
+without a Python loop:
+
+* each exercise's stage update is a two-threshold hysteresis: frames meeting
+  the first condition enter stage A, frames meeting the second enter stage B;
+* the stage at every frame is the last entered stage, found by forward-filling
+  event indices with ``np.maximum.accumulate``;
+* a rep is counted wherever stage B is entered while the previous stage was A.
+
+Form is only evaluated at those rep boundaries, by calling the exercise
+module's ``check_*_form`` with the same arguments the processor passes, so
+counts, good reps and rep timestamps match the per-frame processor exactly.
+
+``ExerciseTrace`` keeps the angle series of one trace, so re-counting it under
+different thresholds (see ``sweep.py``) only redoes the hysteresis.
+"""
+import numpy as np
+
+from landmarks import (
+    LANDMARK_INDEX, LEFT_ANKLE, LEFT_ELBOW, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, LEFT_WRIST,
+    MIRRORED_INDEX, NOSE, RIGHT_ANKLE, RIGHT_HIP, RIGHT_KNEE, VISIBILITY_THRESHOLD, LandmarkList,
+)
+from processor import load_exercise_module, stage_thresholds
+
+# Hip angle range check_plank_form accepts as good form
+PLANK_HIP_RANGE = (160, 190)
+
+# Stage entered first, stage whose entry counts a rep, and whether the processor
+# checks both conditions in turn (two ifs) rather than as if/elif
+STAGE_RULES = {
+    'bicep_curl': ('down', 'up', True),
+    'squats': ('up', 'down', True),
+    'overhead_press': ('down', 'up', True),
+    'lateral_raises': ('down', 'up', True),
+    'lunges': ('up', 'down', True),
+    'pullups': ('down', 'up', True),
+    'pushups': ('up', 'down', False),
+    'glute_bridges': ('down', 'up', True),
+    'crunches': ('down', 'up', True),
+}
+
+# Stage after each event code: 0 none, 1 enter A, 2 enter B, 3 enter A then B in one frame
+_EVENT_STAGE = np.array([0, 1, 2, 2])
+
+
+def trace_angles(a, b, c):
+    """Angle at b in degrees for (T, 2) point arrays, same arithmetic as calculate_angle"""
+    radians = np.arctan2(c[:, 1]-b[:, 1], c[:, 0]-b[:, 0]) - np.arctan2(a[:, 1]-b[:, 1], a[:, 0]-b[:, 0])
+    angle = np.abs(radians*180.0/np.pi)
+    return np.where(angle > 180, 360-angle, angle)
+
+
+def _resolve_side(landmarks, valid, module):
+    """Per-frame mirror flag and visibility gate, as in ExerciseProcessor._visible_landmarks"""
+    required = np.array([LANDMARK_INDEX[name] for name in getattr(module, 'REQUIRED_LANDMARKS', [])], dtype=int)
+    mirrored_required = MIRRORED_INDEX[required]
+    if not len(required):
+        return np.zeros(len(landmarks), dtype=bool), valid
+
+    left = landmarks[:, required, 3]
+    right = landmarks[:, mirrored_required, 3]
+    mirrored = np.zeros(len(landmarks), dtype=bool)
+    if set(required.tolist()) != set(mirrored_required.tolist()):
+        mirrored = right.sum(axis=1) > left.sum(axis=1)
+    visible = np.where(mirrored, right.min(axis=1), left.min(axis=1)) >= VISIBILITY_THRESHOLD
+    return mirrored, valid & visible
+
+
+class ExerciseTrace:
+    """One exercise's angle series over a whole trace, ready to be counted under any thresholds
+
+    ``landmarks`` is (T, 33, 4); ``missing`` flags frames without a pose;
+    ``timestamps`` are seconds on the same clock as ``start_time`` (defaults to
+    the first frame).
+    """
+
+    def __init__(self, landmarks, timestamps, exercise_name, missing=None, start_time=None, exercise_module=None):
+        self.exercise_name = exercise_name
+        self.module = exercise_module or load_exercise_module(exercise_name)
+        self.landmarks = landmarks
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.frames = len(self.timestamps)
+        if start_time is None:
+            start_time = float(self.timestamps[0]) if self.frames else 0.0
+        self.start_time = start_time
+        valid = np.ones(self.frames, dtype=bool) if missing is None else ~np.asarray(missing)
+        self.mirrored, self.valid = _resolve_side(landmarks, valid, self.module)
+        self.angles = self._angles()
+
+    def xy(self, index):
+        left = self.landmarks[:, index, :2]
+        right = self.landmarks[:, MIRRORED_INDEX[index], :2]
+        return np.where(self.mirrored[:, None], right, left)
+
+    def frame(self, t):
+        return LandmarkList(self.landmarks[t], bool(self.mirrored[t]))
+
+    def _angles(self):
+        """The angle series the processor computes for this exercise"""
+        name = self.exercise_name
+        if name == 'bicep_curl':
+            return {'elbow': trace_angles(self.xy(LEFT_SHOULDER), self.xy(LEFT_ELBOW), self.xy(LEFT_WRIST))}
+        elif name == 'pullups':
+            shoulder = self.xy(LEFT_SHOULDER)
+            return {'elbow': trace_angles(shoulder, self.xy(LEFT_ELBOW), self.xy(LEFT_WRIST)),
+                    'chin_up': self.landmarks[:, NOSE, 1] < shoulder[:, 1]}
+        elif name == 'squats':
+            shoulder, hip, knee, ankle = (self.xy(i) for i in (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE, LEFT_ANKLE))
+            return {'knee': trace_angles(hip, knee, ankle), 'hip': trace_angles(shoulder, hip, knee)}
+        elif name in ('overhead_press', 'lateral_raises'):
+            shoulder, elbow, wrist, hip = (self.xy(i) for i in (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST, LEFT_HIP))
+            return {'elbow': trace_angles(shoulder, elbow, wrist), 'shoulder': trace_angles(hip, shoulder, elbow)}
+        elif name == 'lunges':
+            return {'front': trace_angles(self.xy(LEFT_HIP), self.xy(LEFT_KNEE), self.xy(LEFT_ANKLE)),
+                    'back': trace_angles(self.xy(RIGHT_HIP), self.xy(RIGHT_KNEE), self.xy(RIGHT_ANKLE))}
+        elif name == 'pushups':
+            shoulder, elbow, wrist, hip, knee = (self.xy(i) for i in
+                                                 (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST, LEFT_HIP, LEFT_KNEE))
+            return {'elbow': trace_angles(shoulder, elbow, wrist), 'hip': trace_angles(shoulder, hip, knee)}
+        elif name in ('glute_bridges', 'crunches'):
+            return {'hip': trace_angles(self.xy(LEFT_SHOULDER), self.xy(LEFT_HIP), self.xy(LEFT_KNEE))}
+        elif name == 'plank':
+            return {'hip': trace_angles(self.xy(LEFT_SHOULDER), self.xy(LEFT_HIP), self.xy(LEFT_ANKLE))}
+        raise ValueError(f"Exercise {name} has no vectorized counter")
+
+    def _stage_conditions(self, limits):
+        """Boolean series of frames meeting the enter-A and enter-B conditions"""
+        name, angles = self.exercise_name, self.angles
+        if name == 'bicep_curl':
+            return angles['elbow'] > limits['down'], angles['elbow'] < limits['up']
+        elif name == 'squats':
+            return angles['knee'] > limits['up'], angles['knee'] < limits['down']
+        elif name == 'overhead_press':
+            return angles['elbow'] < limits['down'], angles['elbow'] > limits['up']
+        elif name == 'lateral_raises':
+            return angles['shoulder'] < limits['down'], angles['shoulder'] > limits['up']
+        elif name == 'lunges':
+            return ((angles['front'] > limits['up']) & (angles['back'] > limits['up']),
+                    angles['front'] < limits['down'])
+        elif name == 'pullups':
+            return angles['elbow'] > limits['down'], angles['chin_up'] & (angles['elbow'] < limits['up'])
+        elif name == 'pushups':
+            return angles['elbow'] > limits['up'], angles['elbow'] < limits['down']
+        elif name == 'glute_bridges':
+            return angles['hip'] < limits['down'], angles['hip'] > limits['up']
+        elif name == 'crunches':
+            return angles['hip'] > limits['down'], angles['hip'] < limits['up']
+
+    def _check_form(self, t):
+        """The feedback the processor passes to _count_rep at frame t"""
+        name, angles, module = self.exercise_name, self.angles, self.module
+        if name == 'bicep_curl':
+            return module.check_bicep_curl_form(self.frame(t), angles['elbow'][t], "up")
+        elif name == 'squats':
+            return module.check_squat_form(angles['knee'][t], angles['hip'][t], "down")
+        elif name == 'overhead_press':
+            return module.check_overhead_press_form(angles['elbow'][t], angles['shoulder'][t], "up")
+        elif name == 'lateral_raises':
+            return module.check_lateral_raise_form(angles['shoulder'][t], angles['elbow'][t], "up")
+        elif name == 'lunges':
+            return module.check_lunge_form(angles['front'][t], angles['back'][t], "down")
+        elif name == 'pullups':
+            return module.check_pullup_form(self.frame(t), angles['elbow'][t], "up")
+        elif name == 'pushups':
+            return module.check_pushup_form(angles['elbow'][t], angles['hip'][t], "down")
+        elif name == 'glute_bridges':
+            return module.check_glute_bridge_form(angles['hip'][t], "up")
+        elif name == 'crunches':
+            return module.check_crunch_form(angles['hip'][t], "up")
+
+    def stages(self, thresholds=None):
+        """Return (per-frame stage codes, rep frame indices); 1 is the first stage of STAGE_RULES, 2 the second"""
+        limits = stage_thresholds(self.exercise_name, thresholds)
+        stage_a, _, sequential = STAGE_RULES[self.exercise_name]
+        enters_a, enters_b = self._stage_conditions(limits)
+        enters_a = enters_a & self.valid
+        enters_b = enters_b & self.valid
+        if sequential:
+            events = enters_a + 2 * enters_b
+        else:
+            events = np.where(enters_a, 1, 2 * enters_b)
+
+        initial = 1 if stage_a == 'down' else 2
+        last_event = np.maximum.accumulate(np.where(events > 0, np.arange(self.frames), -1))
+        stages = np.where(last_event >= 0, _EVENT_STAGE[events[np.maximum(last_event, 0)]], initial)
+        previous = np.concatenate(([initial], stages[:-1]))
+        rep_frames = np.flatnonzero(((events == 2) & (previous == 1)) | (events == 3))
+        return stages, rep_frames
+
+    def count(self, thresholds=None):
+        """Number of reps the processor would count under these thresholds"""
+        if not self.frames:
+            return 0
+        return len(self.stages(thresholds)[1])
+
+    def stats(self, thresholds=None):
+        """The processor's end-of-trace stats plus its ``rep_log``"""
+        end_time = float(self.timestamps[-1]) if self.frames else self.start_time
+        elapsed_time = int(end_time - self.start_time)
+
+        if self.exercise_name == 'plank':
+            hip = self.angles['hip']
+            good = self.valid & ~(hip < PLANK_HIP_RANGE[0]) & ~(hip > PLANK_HIP_RANGE[1])
+            # Every processed frame advances last_frame_time, so each good frame adds
+            # the gap since the previous frame; cumsum keeps the processor's summation order
+            gaps = np.diff(self.timestamps, prepend=self.start_time)
+            good_form_time = float(np.cumsum(np.where(good, gaps, 0.0))[-1]) if self.frames else 0
+            return {
+                'exercise': self.exercise_name,
+                'elapsed_time': elapsed_time,
+                'good_form_time': int(good_form_time),
+                'rep_log': [],
+            }
+
+        stage_a, stage_b, _ = STAGE_RULES[self.exercise_name]
+        final_stage = 1 if stage_a == 'down' else 2
+        rep_log = []
+        if self.frames:
+            stages, rep_frames = self.stages(thresholds)
+            final_stage = stages[-1]
+            for rep, t in enumerate(rep_frames.tolist(), start=1):
+                feedback = self._check_form(t)
+                rep_log.append({
+                    'rep': rep,
+                    'timestamp': round(float(self.timestamps[t]) - self.start_time, 3),
+                    'good': not feedback,
+                    'feedback': list(feedback),
+                })
+
+        return {
+            'exercise': self.exercise_name,
+            'reps': len(rep_log),
+            'good_reps': sum(rep['good'] for rep in rep_log),
+            'stage': stage_a if final_stage == 1 else stage_b,
+            'elapsed_time': elapsed_time,
+            'rep_log': rep_log,
+        }
+
+
+def count_reps(landmarks, timestamps, exercise_name, missing=None, start_time=None,
+               thresholds=None, exercise_module=None):
+    """Count reps over a whole trace; returns the processor's stats plus its ``rep_log``
+
+    ``thresholds`` overrides the configured stage thresholds, as for ``ExerciseProcessor``.
+    """
+    trace = ExerciseTrace(landmarks, timestamps, exercise_name, missing, start_time, exercise_module)
+    return trace.stats(thresholds)
+
+
+def load_recording_trace(recording, exercise_name=None, exercise_module=None):
+    """``ExerciseTrace`` over a whole ``LandmarkRecording``"""
+    from landmark_store import dequantize, is_missing
+    columns = recording.read()
+    return ExerciseTrace(
+        dequantize(columns['landmarks']), columns['timestamps'], exercise_name or recording.exercise_name,
+        missing=is_missing(columns['landmarks']),
+        start_time=recording.metadata.get('start_time'),
+        exercise_module=exercise_module,
+    )
+
+
+def count_recording(recording, exercise_name=None, thresholds=None, exercise_module=None):
+    """Run ``count_reps`` over a whole ``LandmarkRecording``"""
+    return load_recording_trace(recording, exercise_name, exercise_module).stats(thresholds)
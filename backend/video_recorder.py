@@ -0,0 +1,130 @@
+"""Session video recording on an encoder thread that never blocks the pipeline.
+
+The pipeline hands each annotated frame to ``VideoRecorder.submit``, which
+only puts a reference on a bounded queue: frames are not modified after they
+are published, so nothing is copied. An encoder thread drains the queue into
+``cv2.VideoWriter``. When the encoder falls ``RECORD_VIDEO_QUEUE`` frames
+behind, new frames are dropped instead of waiting, so recording costs the live
+pipeline a queue operation per frame however slow the disk or codec is.
+
+The file has a constant frame rate of ``RECORD_VIDEO_FPS``. Each frame is
+written as many times as its capture time calls for: frames the pipeline
+skipped or the recorder dropped show as a held picture, and frames arriving
+faster than the file's rate are left out, so the recording keeps the session's
+real duration.
+"""
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2
+
+QUEUE_FRAMES = int(os.environ.get('RECORD_VIDEO_QUEUE', 64))
+FPS = float(os.environ.get('RECORD_VIDEO_FPS', 30))
+FOURCC = 'mp4v'
+
+
+class VideoRecorder:
+    """Encodes submitted BGR frames to a video file on its own thread"""
+
+    def __init__(self, path, fps=FPS, queue_frames=QUEUE_FRAMES):
+        self.path = path
+        self.fps = fps
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.frames_encoded = 0
+        # Frames left out because the file already covers their capture time
+        self.frames_skipped = 0
+        # Encoded frames including repeats that fill time between captures
+        self.frames_written = 0
+        self.encode_seconds = 0.0
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_frames)
+        self._writer = None
+        self._start_time = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='video-recorder', daemon=True)
+        self._thread.start()
+
+    def submit(self, image, timestamp):
+        """Queue a frame captured at ``timestamp`` (seconds); dropped if the encoder is behind"""
+        if self._closed:
+            return
+        self.frames_submitted += 1
+        try:
+            self._queue.put_nowait((image, timestamp))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self.error:
+                continue
+            try:
+                self._write(*item)
+            except Exception as e:
+                # Keep draining so submit() never sees a full queue because of a dead writer
+                self.error = f"{type(e).__name__}: {e}"
+                print(f"Video recording to {self.path} failed: {self.error}", file=sys.stderr)
+        if self._writer is not None:
+            self._writer.release()
+
+    def _write(self, image, timestamp):
+        start = time.perf_counter()
+        if self._writer is None:
+            height, width = image.shape[:2]
+            self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*FOURCC), self.fps, (width, height))
+            if not self._writer.isOpened():
+                raise ValueError(f"Cannot open video writer for {self.path}")
+            self._start_time = timestamp
+        # Frame count the file should reach by this frame's capture time
+        target = int((timestamp - self._start_time) * self.fps) + 1
+        repeats = target - self.frames_written
+        if repeats <= 0:
+            # A source faster than the file's rate; writing it would stretch the recording
+            self.frames_skipped += 1
+            return
+        for _ in range(repeats):
+            self._writer.write(image)
+        self.frames_written += repeats
+        self.frames_encoded += 1
+        self.encode_seconds += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'frames_submitted': self.frames_submitted,
+            'frames_encoded': self.frames_encoded,
+            'frames_dropped': self.frames_dropped,
+            'frames_skipped': self.frames_skipped,
+            'frames_written': self.frames_written,
+            'queued': self._queue.qsize(),
+            'duration': round(self.frames_written / self.fps, 2),
+            'encode_ms_per_frame': round(self.encode_seconds * 1000 / self.frames_encoded, 2)
+            if self.frames_encoded else None,
+            'error': self.error,
+        }
+
+    def close(self, timeout=10.0):
+        """Encode what is queued, finish the file and return the recording summary"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout)
+        return self.stats()
+
+
+def create_video_recorder(exercise_name, session_id, directory=None):
+    """Recorder for a session when RECORD_VIDEO_DIR is set; otherwise None"""
+    directory = directory or os.environ.get('RECORD_VIDEO_DIR')
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    # The session id keeps sessions started in the same second apart
+    name = f"{exercise_name}-{time.strftime('%Y%m%d-%H%M%S')}-{session_id}.mp4"
+    return VideoRecorder(os.path.join(directory, name))
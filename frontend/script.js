@@ -1,10 +1,27 @@
+// Constrained Baseline, as encoded by the server's libx264
+const H264_MIME_TYPE = 'video/mp4; codecs="avc1.42E01F"';
+// Seconds the <video> may fall behind the newest buffered frame before it skips ahead
+const H264_MAX_LAG = 0.5;
+
 class FitnessApp {
     constructor() {
         this.apiBaseUrl = 'http://localhost:5000/api';
         this.videoFeedUrl = 'http://localhost:5000/video_feed';
+        this.h264FeedUrl = 'http://localhost:5000/video_h264';
+        // ?video=h264 plays the H.264 stream in a <video> element instead of MJPEG
+        this.useH264 = new URLSearchParams(window.location.search).get('video') === 'h264'
+            && window.MediaSource && MediaSource.isTypeSupported(H264_MIME_TYPE);
         this.currentExercise = null;
         this.statsInterval = null;
         this.isWorkoutActive = false;
+        this.sessionId = null;
+        this.videoAbort = null;
+        this.eventSource = null;
+        this.frameUrl = null;
+        this.displayedFrames = [];
+        // Server clock minus ours, in seconds, from the fastest latency report round trip
+        this.clockOffset = 0;
+        this.bestRoundTrip = Infinity;
         
         this.initializeElements();
         this.bindEvents();
@@ -24,6 +41,7 @@ class FitnessApp {
         // Workout elements
         this.currentExerciseTitle = document.getElementById('current-exercise-title');
         this.videoFeed = document.getElementById('video-feed');
+        this.videoPlayer = document.getElementById('video-player');
         this.countdown = document.getElementById('countdown');
         this.stopWorkoutBtn = document.getElementById('stop-workout-btn');
         
@@ -32,6 +50,8 @@ class FitnessApp {
         this.goodRepsCount = document.getElementById('good-reps-count');
         this.stageDisplay = document.getElementById('stage-display');
         this.timeElapsed = document.getElementById('time-elapsed');
+        this.latencyDisplay = document.getElementById('latency-display');
+        this.repDisplay = document.getElementById('rep-display');
         this.feedbackList = document.getElementById('feedback-list');
         
         // Summary elements
@@ -92,7 +112,8 @@ class FitnessApp {
                 throw new Error('Failed to start exercise');
             }
             
-            this.startWorkout();
+            const result = await response.json();
+            this.startWorkout(result.session_id);
             
         } catch (error) {
             console.error('Failed to start exercise:', error);
@@ -125,11 +146,21 @@ class FitnessApp {
         });
     }
     
-    startWorkout() {
+    startWorkout(sessionId) {
         this.isWorkoutActive = true;
+        this.sessionId = sessionId;
+        this.displayedFrames = [];
+        this.latencyDisplay.textContent = '';
+        this.repDisplay.textContent = '';
+        this.startEventStream(sessionId);
         
-        // Start video feed
-        this.videoFeed.src = this.videoFeedUrl + '?t=' + Date.now();
+        // Start video feed; small screens get a smaller rendition
+        if (this.useH264) {
+            this.startH264Feed(`${this.h264FeedUrl}?t=${Date.now()}`);
+        } else {
+            const rendition = window.innerWidth <= 768 ? 'half' : 'full';
+            this.startVideoFeed(`${this.videoFeedUrl}?rendition=${rendition}&t=${Date.now()}`);
+        }
         
         // Start stats polling
         this.statsInterval = setInterval(() => this.updateStats(), 1000);
@@ -138,10 +169,214 @@ class FitnessApp {
         this.updateStats();
     }
     
+    startEventStream(sessionId) {
+        // Per-rep results are pushed as they happen rather than diffed out of the polled totals
+        if (!window.EventSource) return;
+        this.eventSource = new EventSource(`${this.apiBaseUrl}/events?types=rep_completed&session_id=${sessionId}`);
+        this.eventSource.addEventListener('rep_completed', message => {
+            const rep = JSON.parse(message.data);
+            const form = rep.good ? 'good form' : rep.feedback.join(' ');
+            this.repDisplay.textContent = `Rep ${rep.rep}: ${Math.round(rep.rom)}° in ${rep.duration.toFixed(1)}s, ${form}`;
+        });
+    }
+    
+    stopEventStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+    
+    async startVideoFeed(url) {
+        // Read the MJPEG stream ourselves so each frame's display time can be reported back
+        if (!window.fetch || !window.ReadableStream) {
+            this.videoFeed.src = url;
+            return;
+        }
+        
+        this.videoAbort = new AbortController();
+        try {
+            const response = await fetch(url, { signal: this.videoAbort.signal });
+            const reader = response.body.getReader();
+            let buffer = new Uint8Array(0);
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                
+                const joined = new Uint8Array(buffer.length + value.length);
+                joined.set(buffer);
+                joined.set(value, buffer.length);
+                buffer = joined;
+                
+                let part;
+                while ((part = this.nextMjpegPart(buffer))) {
+                    buffer = buffer.slice(part.end);
+                    this.showFrame(part);
+                }
+            }
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                console.error('Video stream failed:', error);
+            }
+        }
+    }
+    
+    async startH264Feed(url) {
+        // Fragmented MP4 through Media Source Extensions, held at the live edge
+        this.videoFeed.classList.add('hidden');
+        this.videoPlayer.classList.remove('hidden');
+        const mediaSource = new MediaSource();
+        this.videoPlayer.src = URL.createObjectURL(mediaSource);
+        await new Promise(resolve => mediaSource.addEventListener('sourceopen', resolve, { once: true }));
+        
+        const sourceBuffer = mediaSource.addSourceBuffer(H264_MIME_TYPE);
+        // Fragments the server dropped for us leave timestamp gaps; play them back to back instead
+        sourceBuffer.mode = 'sequence';
+        const pending = [];
+        const appendNext = () => {
+            if (!sourceBuffer.updating && pending.length && mediaSource.readyState === 'open') {
+                sourceBuffer.appendBuffer(pending.shift());
+            }
+        };
+        sourceBuffer.addEventListener('updateend', () => {
+            const buffered = sourceBuffer.buffered;
+            if (buffered.length) {
+                const end = buffered.end(buffered.length - 1);
+                if (end - this.videoPlayer.currentTime > H264_MAX_LAG) {
+                    this.videoPlayer.currentTime = end - 0.05;
+                }
+                // Keep only the last few seconds buffered
+                if (!pending.length && this.videoPlayer.currentTime - buffered.start(0) > 30) {
+                    sourceBuffer.remove(buffered.start(0), this.videoPlayer.currentTime - 10);
+                    return;
+                }
+            }
+            appendNext();
+        });
+        
+        this.videoAbort = new AbortController();
+        try {
+            const response = await fetch(url, { signal: this.videoAbort.signal });
+            const reader = response.body.getReader();
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                pending.push(value);
+                appendNext();
+            }
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                console.error('Video stream failed:', error);
+            }
+        }
+    }
+    
+    nextMjpegPart(buffer) {
+        // Parts are "--frame", headers, a blank line, Content-Length bytes of JPEG and CRLF
+        let headerEnd = -1;
+        for (let i = 0; i + 3 < buffer.length; i++) {
+            if (buffer[i] === 13 && buffer[i + 1] === 10 && buffer[i + 2] === 13 && buffer[i + 3] === 10) {
+                headerEnd = i;
+                break;
+            }
+        }
+        if (headerEnd < 0) return null;
+        
+        const headers = {};
+        new TextDecoder().decode(buffer.subarray(0, headerEnd)).split('\r\n').forEach(line => {
+            const separator = line.indexOf(':');
+            if (separator > 0) {
+                headers[line.slice(0, separator).trim().toLowerCase()] = line.slice(separator + 1).trim();
+            }
+        });
+        
+        const start = headerEnd + 4;
+        const length = parseInt(headers['content-length'], 10);
+        if (isNaN(length) || buffer.length < start + length) return null;
+        return {
+            jpeg: buffer.slice(start, start + length),
+            frameId: parseInt(headers['x-frame-id'], 10),
+            end: start + length + 2
+        };
+    }
+    
+    showFrame(part) {
+        if (this.frameUrl) {
+            URL.revokeObjectURL(this.frameUrl);
+        }
+        this.frameUrl = URL.createObjectURL(new Blob([part.jpeg], { type: 'image/jpeg' }));
+        this.videoFeed.onload = () => {
+            // The decoded frame reaches the screen with the next paint
+            requestAnimationFrame(() => this.frameDisplayed(part.frameId));
+        };
+        this.videoFeed.src = this.frameUrl;
+    }
+    
+    frameDisplayed(frameId) {
+        if (isNaN(frameId) || this.displayedFrames.length >= 300) return;
+        // Client clock; converted to server time when reported, once an offset is known
+        this.displayedFrames.push([frameId, (performance.timeOrigin + performance.now()) / 1000]);
+    }
+    
+    stopVideoFeed() {
+        if (this.videoAbort) {
+            this.videoAbort.abort();
+            this.videoAbort = null;
+        }
+        this.videoFeed.onload = null;
+        this.videoFeed.src = '';
+        if (this.frameUrl) {
+            URL.revokeObjectURL(this.frameUrl);
+            this.frameUrl = null;
+        }
+        if (this.videoPlayer.src) {
+            URL.revokeObjectURL(this.videoPlayer.src);
+            this.videoPlayer.removeAttribute('src');
+            this.videoPlayer.load();
+        }
+        this.videoPlayer.classList.add('hidden');
+        this.videoFeed.classList.remove('hidden');
+    }
+    
+    async reportLatency() {
+        if (!this.sessionId || this.displayedFrames.length === 0) return;
+        
+        const frames = this.displayedFrames;
+        this.displayedFrames = [];
+        if (this.bestRoundTrip === Infinity) {
+            // No clock offset estimate yet: measure one with an empty report first
+            await this.postLatency([]);
+            if (this.bestRoundTrip === Infinity) return;
+        }
+        await this.postLatency(frames.map(([frameId, displayedAt]) => [frameId, displayedAt + this.clockOffset]));
+    }
+    
+    async postLatency(frames) {
+        const sentAt = (performance.timeOrigin + performance.now()) / 1000;
+        const response = await fetch(`${this.apiBaseUrl}/latency`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ session_id: this.sessionId, frames: frames })
+        });
+        const receivedAt = (performance.timeOrigin + performance.now()) / 1000;
+        if (!response.ok) return;
+        
+        // Cristian's algorithm: the fastest round trip bounds the offset error most tightly
+        const result = await response.json();
+        const roundTrip = receivedAt - sentAt;
+        if (roundTrip < this.bestRoundTrip) {
+            this.bestRoundTrip = roundTrip;
+            this.clockOffset = result.server_time - (sentAt + receivedAt) / 2;
+        }
+    }
+    
     async updateStats() {
         if (!this.isWorkoutActive) return;
         
         try {
+            this.reportLatency().catch(error => console.error('Failed to report latency:', error));
             const response = await fetch(`${this.apiBaseUrl}/stats`);
             if (response.ok) {
                 const stats = await response.json();
@@ -174,6 +409,12 @@ class FitnessApp {
             this.timeElapsed.textContent = `${stats.elapsed_time}s`;
         }
         
+        const latency = stats.latency && stats.latency.glass_to_glass_ms;
+        if (latency && latency.samples) {
+            this.latencyDisplay.textContent =
+                `Latency p50 ${latency.p50} ms · p95 ${latency.p95} ms · p99 ${latency.p99} ms`;
+        }
+        
         // Update feedback
         this.renderFeedback(stats.feedback || []);
     }
@@ -205,8 +446,9 @@ class FitnessApp {
             this.statsInterval = null;
         }
         
-        // Stop video feed
-        this.videoFeed.src = '';
+        // Stop video feed and rep events
+        this.stopVideoFeed();
+        this.stopEventStream();
         
         try {
             const response = await fetch(`${this.apiBaseUrl}/stop_exercise`, {
@@ -296,8 +538,9 @@ class FitnessApp {
             this.statsInterval = null;
         }
         
-        // Stop video feed
-        this.videoFeed.src = '';
+        // Stop video feed and rep events
+        this.stopVideoFeed();
+        this.stopEventStream();
         
         // Reset UI
         this.showScreen('exercise-selection');